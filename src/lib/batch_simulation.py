@@ -0,0 +1,288 @@
+# -*- coding:utf-8 -*-
+# Copyright © 2012 Clément Schaff, Mahdi Ben Jelloul
+'''
+Created on 18 oct. 2013
+
+@author: M Benjelloul, J Santoul
+'''
+from __future__ import division
+from pandas import DataFrame
+from numpy import arange, array, empty, zeros, ones, hstack, newaxis
+
+from cohorts.cube import (CohortsCube, generation_present_value, geometric_tail, add_tail,
+                          intertemporal_public_liability, generational_imbalance)
+from cohorts.factors import factor_table, is_path, yearly_rates
+
+
+PARAMETERS = ['discount_rate', 'growth_rate', 'population_growth_rate', 'inflation_rate',
+              'net_gov_wealth', 'net_gov_spendings', 'year_gov_spendings']
+
+
+class BatchSimulation(object):
+    """
+    Evaluates the pipeline of a Simulation (population projection, tax projection,
+    net transfers, present values and indicators) for many parameter sets at once.
+    The scenarios are stacked along a leading axis of the (age, sex, year) cubes.
+    The tail beyond the horizon is added as Simulation does when its tail is set.
+    """
+    def __init__(self, simulation, taxes_list = None, payments_list = None, batch_size = 50):
+        """
+        Parameters
+        ----------
+        simulation : Simulation
+                     gives the population, the profiles, the projection methods and
+                     the default value of the parameters
+        taxes_list : list
+                     the columns of the profiles counted as taxes in the net transfers
+        payments_list : list
+                        the columns of the profiles counted as payments in the net transfers
+        batch_size : int, default 50
+                     maximal number of scenarios evaluated in the same pass, to bound memory usage
+        """
+        super(BatchSimulation, self).__init__()
+        if taxes_list is None:
+            taxes_list = []
+        if payments_list is None:
+            payments_list = []
+        self.simulation = simulation
+        self.taxes_list = taxes_list
+        self.payments_list = payments_list
+        self.batch_size = batch_size
+        self.scenarios = None
+        self.results = None
+        self._population = None
+        self._parts = None
+
+    def set_scenarios(self, scenarios):
+        """
+        Set the parameter sets to evaluate
+
+        Parameters
+        ----------
+        scenarios : DataFrame or dict of lists
+                    one row per scenario, with columns among 'discount_rate', 'growth_rate',
+                    'population_growth_rate', 'inflation_rate', 'net_gov_wealth',
+                    'net_gov_spendings' and 'year_gov_spendings'.
+                    'year_gov_spendings' are the spendings of the reference year, their
+                    present value is computed as set_gov_spendings(compute=True) does.
+                    Missing parameters take the value of the simulation. When the simulation
+                    spendings were computed from the spendings of the reference year and
+                    'net_gov_spendings' is not given, their present value is computed again
+                    with the rates of each scenario.
+                    The rates can be year-indexed paths (dict or Series).
+        """
+        scenarios = DataFrame(scenarios)
+        for name in scenarios.columns:
+            if name not in PARAMETERS:
+                raise Exception('%s is not a parameter of the simulation' % name)
+
+        given = list(scenarios.columns)
+        simulation = self.simulation
+        defaults = {'discount_rate' : simulation.discount_rate,
+                    'growth_rate' : simulation.growth_rate,
+                    'population_growth_rate' : simulation.population_growth_rate,
+                    'inflation_rate' : simulation.tax_projection.get('inflation_rate', 0),
+                    'net_gov_wealth' : simulation.net_gov_wealth,
+                    'net_gov_spendings' : simulation.net_gov_spendings}
+        for name, value in defaults.iteritems():
+            if name not in scenarios.columns:
+                if is_path(value):
+                    # A path is a single object of each row
+                    scenarios[name] = [value]*len(scenarios)
+                else:
+                    scenarios[name] = value
+        if (simulation.year_gov_spendings is not None and 'year_gov_spendings' not in scenarios.columns
+                and 'net_gov_spendings' not in given):
+            scenarios['year_gov_spendings'] = simulation.year_gov_spendings
+        self.scenarios = scenarios
+        self.results = None
+
+    def _prepare(self):
+        """
+        Builds once the observed population and the net transfers profiles
+        grouped by projection factor
+        """
+        simulation = self.simulation
+        if simulation.tail and simulation.population_projection['method'] not in ['stable', 'exp_growth']:
+            raise Exception("the tail can only be added with the 'stable' or 'exp_growth' population projection")
+        population = CohortsCube.from_frame(simulation.population, columns = ['pop'])
+        self._population = population['pop']
+        year_min = population._year_min
+        year_length = simulation.population_projection['year_length']
+        self._population_method = simulation.population_projection['method']
+        year_max = population._year_max
+        if self._population_method in ['stable', 'exp_growth']:
+            year_max = max(year_max, year_min + year_length)
+        self._years = arange(year_min, year_max + 1)
+
+        profiles = CohortsCube(population.ages, population.sexes, self._years)
+        profiles._fill(simulation.profiles)
+
+        # Net transfers are the sum of three parts, projected with growth, with inflation or kept
+        tax_method = simulation.tax_projection['method']
+        if tax_method == 'desynchronized':
+            grown = simulation.tax_projection['typ']
+            inflated = simulation.tax_projection['payments_list']
+        elif tax_method in ['per_capita', 'aggregate']:
+            grown = profiles._types
+            inflated = []
+        else:
+            raise Exception('a method should be specified')
+        self._tax_method = tax_method
+
+        shape = profiles.shape
+        self._parts = dict((part, zeros(shape)) for part in ['growth', 'inflation', 'fixed'])
+        self._aggregate_parts = []
+        for signs, names in [(1, self.taxes_list), (-1, self.payments_list)]:
+            for name in names:
+                profile = signs*profiles[name]
+                if tax_method == 'aggregate':
+                    position = self._years.searchsorted(max(profiles._types_years[name]))
+                    self._aggregate_parts.append((position, profile))
+                elif name in grown:
+                    self._parts['growth'] += profile
+                elif name in inflated:
+                    self._parts['inflation'] += profile
+                else:
+                    self._parts['fixed'] += profile
+
+    def _project_population(self, population_growth_rates):
+        observed = self._population
+        nb_observed = observed.shape[2]
+        nb_added = len(self._years) - nb_observed
+        pop = empty((len(population_growth_rates),) + observed.shape[:2] + (len(self._years),))
+        pop[..., :nb_observed] = observed
+        if nb_added > 0:
+            if self._population_method == 'exp_growth':
+                growth = array([factor_table.growth(n, nb_added, self._years[nb_observed])
+                                for n in population_growth_rates])
+            else:
+                growth = ones((len(population_growth_rates), nb_added))
+            pop[..., nb_observed:] = observed[newaxis, :, :, -1:]*growth[:, newaxis, newaxis, :]
+        return pop
+
+    def _tail(self, scenarios, pop):
+        """
+        Returns the tail beyond the horizon of the aggregate present values of each scenario
+        (see geometric_tail), the population of the first year after the horizon and its yearly ratio
+        afterwards. The population and the profiles are continued as Simulation._tail_flows does
+        """
+        nb_years, year_min = len(self._years), self._years[0]
+        nb_observed = self._population.shape[2]
+        nb_added = nb_years - nb_observed
+        shape = (len(scenarios),) + pop.shape[1:3]
+        entering, first_pop, unborn, pop_ratios = zeros(shape), zeros(shape), zeros(shape[::2]), ones(len(scenarios))
+        rates = zip(scenarios['discount_rate'], scenarios['growth_rate'],
+                    scenarios['population_growth_rate'], scenarios['inflation_rate'])
+        for k, (r, g, n, inflation_rate) in enumerate(rates):
+            if self._population_method == 'exp_growth':
+                growth = factor_table.growth(n, nb_added + 1, self._years[nb_observed])
+                first_pop[k] = self._population[..., -1]*growth[nb_added]
+                # The rate of a path after the horizon is its last one
+                pop_ratios[k] = 1 + yearly_rates(n, year_min + nb_years + 1, 1)[0]
+            else:
+                first_pop[k] = self._population[..., -1]
+            dsct = factor_table.discount(r, nb_years + 2, year_min)
+            factors = {'growth': factor_table.growth(g, nb_years + 2, year_min),
+                       'inflation': factor_table.growth(inflation_rate, nb_years + 2, year_min),
+                       'fixed': ones(nb_years + 2)}
+            # Discounted flows of the first year after the horizon, by projection factor
+            flows = dict((part, self._parts[part][..., -1]*first_pop[k]) for part in factors
+                         if self._parts[part].any())
+            for position, profile in self._aggregate_parts:
+                flows['growth'] = flows.get('growth', 0) + profile[..., -1]*pop[k, ..., position]
+            for part, flow in flows.iteritems():
+                ratio = factors[part][-1]/factors[part][-2]*dsct[-1]/dsct[-2]
+                if self._tax_method != 'aggregate':
+                    ratio *= pop_ratios[k]
+                part_entering, part_unborn = geometric_tail(flow*factors[part][-2]*dsct[-2], ratio)
+                entering[k] += part_entering
+                unborn[k] += part_unborn
+        return entering, unborn.sum(axis = 1), first_pop, pop_ratios
+
+    def _factors(self, kind, *rates):
+        nb_years, year_min = len(self._years), self._years[0]
+        return array([getattr(factor_table, kind)(*(rate + (nb_years, year_min)))
+                      for rate in zip(*rates)])[:, newaxis, newaxis, :]
+
+    def _run_batch(self, scenarios):
+        nb_years, year_min = len(self._years), self._years[0]
+        r = list(scenarios['discount_rate'])
+        g = list(scenarios['growth_rate'])
+
+        pop = self._project_population(list(scenarios['population_growth_rate']))
+        grth = self._factors('growth', g)
+        net_transfers = self._parts['growth']*grth + self._parts['fixed']
+        if self._parts['inflation'].any():
+            net_transfers += self._parts['inflation']*self._factors('growth', list(scenarios['inflation_rate']))
+        for position, profile in self._aggregate_parts:
+            net_transfers += profile*grth*pop[..., position][..., newaxis]/pop
+
+        aggregate_pv = generation_present_value(self._factors('discount', r)*net_transfers*pop)
+        if self.simulation.tail:
+            entering, unborn_pv, first_pop, pop_ratios = self._tail(scenarios, pop)
+            for k in range(len(scenarios)):
+                aggregate_pv[k] = add_tail(aggregate_pv[k], entering[k])
+
+        net_gov_wealth = scenarios['net_gov_wealth'].values
+        net_gov_spendings = scenarios['net_gov_spendings'].values.astype(float)
+        if 'year_gov_spendings' in scenarios:
+            horizon = self.simulation.year_length + 1
+            actualization = array([factor_table.growth(g_k, horizon, year_min)*factor_table.discount(r_k, horizon, year_min)
+                                   for g_k, r_k in zip(g, r)])
+            net_gov_spendings = scenarios['year_gov_spendings'].values*actualization[:, 1:].sum(axis = 1)
+
+        ipl = intertemporal_public_liability(aggregate_pv, net_gov_wealth, net_gov_spendings)
+        precision = intertemporal_public_liability(aggregate_pv, net_gov_wealth, net_gov_spendings, precision = True)
+
+        unborn = pop[:, 0, :, 1:].sum(axis = 1)
+        actualization = array([factor_table.actualization(g_k, r_k, nb_years - 1, year_min + 1) for g_k, r_k in zip(g, r)])
+        if self.simulation.tail:
+            # The generations born after the horizon are added, see Simulation.compute_ipl
+            precision = precision*ipl/(ipl - unborn_pv)
+            ipl = ipl - unborn_pv
+            # and summed as one more geometric year in the generational imbalance
+            factors = array([factor_table.actualization(g_k, r_k, nb_years + 1, year_min + 1) for g_k, r_k in zip(g, r)])
+            ratios = factors[:, -1]/factors[:, -2]*pop_ratios
+            if not (abs(ratios) < 1).all():
+                raise Exception('the tail is infinite: the discounted flows do not decrease after the horizon')
+            unborn = hstack([unborn, first_pop[:, 0].sum(axis = 1)[:, newaxis]])
+            actualization = hstack([actualization, (factors[:, -2]/(1 - ratios))[:, newaxis]])
+        imbalance = generational_imbalance(aggregate_pv[:, :, :, 0].sum(axis = 2).sum(axis = 1),
+                                           aggregate_pv[:, 0, :, 0]/pop[:, 0, :, 0],
+                                           unborn, actualization, net_gov_wealth, net_gov_spendings)
+        return ipl, precision, imbalance, net_gov_spendings
+
+    def run(self):
+        """
+        Evaluates all the scenarios and returns a DataFrame of the scenarios with columns
+        'ipl', 'precision', 'gen_imbalance' and 'net_gov_spendings_pv'
+        """
+        if self.scenarios is None:
+            raise Exception('scenarios should be set first')
+        self._prepare()
+        batches = list()
+        for start in range(0, len(self.scenarios), self.batch_size):
+            batches.append(self._run_batch(self.scenarios.iloc[start:start + self.batch_size]))
+
+        results = self.scenarios.copy()
+        for name, values in zip(['ipl', 'precision', 'gen_imbalance', 'net_gov_spendings_pv'], zip(*batches)):
+            results[name] = hstack(values)
+        self.results = results
+        return results
+
+    def compute_ipl(self):
+        """
+        Returns the vector of the intertemporal public liability of each scenario
+        """
+        if self.results is None:
+            self.run()
+        return self.results['ipl'].values
+
+    def compute_gen_imbalance(self):
+        """
+        Returns the vector of the generational imbalance of each scenario
+        """
+        if self.results is None:
+            self.run()
+        return self.results['gen_imbalance'].values
@@ -6,9 +6,10 @@ Created on 14 mai 2013
 @author: Jérôme SANTOUL
 '''
 from __future__ import division
-from pandas import concat, DataFrame
-from numpy import array, arange, NaN
+from pandas import concat, DataFrame, Index, MultiIndex
+from numpy import array, arange, NaN, add, isnan, unique
 from src.lib.cohorts.cohort import Cohorts
+from src.lib.cohorts.cube import indicator_terms, liability_from_terms
 import matplotlib.pyplot as plt
 
 class AccountingCohorts(Cohorts):
@@ -23,6 +24,23 @@ class AccountingCohorts(Cohorts):
     def __init__(self, data=None, index=None, columns=None, 
                  dtype=None, copy=False):
         super(AccountingCohorts, self).__init__(data, index, columns , dtype, copy)
+        if data is not None:
+            # Accounting results do not keep the scratch columns of the data cohorts
+            for name in self._derived_columns():
+                del self[name]
+
+    def indicator_terms(self, typ):
+        """
+        Returns the reductions of the present values of typ the indicators are computed from:
+        the sum over the generations alive the first year ('past'), over the newborns of all the years
+        ('future'), the newborns of the first year by sex ('newborn') and the last newborn ('last').
+        They are computed on the positions of the dense cube, Simulation caches them for its indicators
+        
+        Parameters
+        ----------
+        typ : the column containing the present values
+        """
+        return indicator_terms(self.to_cube([typ], copy = False)[typ])
      
     def extract_generation(self, year, typ, age = None):
         """
@@ -93,58 +111,83 @@ class AccountingCohorts(Cohorts):
         generation_cohort = Cohorts(res)
         generation_cohort.columns = [typ]
         return generation_cohort
+
+    def lifetime_accounts(self, typ, sex = None, discount_rate = None, base = None):
+        """
+        Returns the flows (or the present values) of every birth cohort by age,
+        re-indexing the age x year plane along its diagonals at once.
+        It gives the generations extract_generation follows one by one.
+        
+        Parameters
+        ----------
+        typ : Str
+              A column of the cohort
+        sex : Int, default None
+              The sex of the generations, both sexes if None
+        discount_rate : float or year-indexed path, default None
+                        if given the flows are discounted with this rate
+        base : Int or 'birth', default None
+               the year the flows are discounted to, the first year if None.
+               With 'birth' each generation is discounted to its birth year,
+               or to the first year when it was born before
+        
+        Returns
+        -------
+        accounts : DataFrame with the ages as columns, indexed by birth year (and sex if sex is None).
+                   The ages a generation does not reach within the years of the cohort are NaN
+        """
+        if typ not in self.columns:
+            raise Exception('the given column is not in the cohort')
+        cube = self.to_cube([typ], copy = False)
+        return cube.lifetime_accounts(typ, sex = sex, discount_rate = discount_rate, base = base)
  
  
     
-    def create_age_class(self, step = 1, typ = None):
+    def create_age_class(self, step = 1, typ = None, breaks = None):
         """
         Transform a filled cohort dataframe by regrouping 
-        age indexies in age class indexies. The size of the age class is indicated by the step argument
+        age indexies in age class indexies. The size of the age class is indicated by the step argument.
+        All the columns are summed by class in a single segment sum along the ages, the columns typ
+        are then divided by the population of the class
          
         Parameters
         ----------
         step : Int
         The number of years included in the age class
+        typ : str or list of str, default None
+              the columns divided by the population, the types of the cohort if None
+        breaks : list of Int, default None
+                 the first ages of custom classes, used instead of step.
+                 The ages below the first break are in the first class
          
         Returns
         -------
         res : A DataFrame of the Cohorts class with age indexes replaced with class indicies
         """
-        
         if typ is None:
             typ = self._types
-        
-        # Separating Men and Women
-        pvm = self.xs(0, level='sex')
-        pvf = self.xs(1, level='sex')
-        pvm.reset_index(inplace = True)
-        pvf.reset_index(inplace = True)
-         
-        #Transforming the age indexes
-        serie = array(pvm.age)
-        pvm['age'] = array((serie//step)*step)
-        pvf['age'] = array((serie//step)*step)
-        
-#         #Old version of age class creation using the simulation.percapita_pv
-#         age_class_pvm = pvm.groupby(['age', 'year']).mean()
-#         age_class_pvf = pvf.groupby(['age', 'year']).mean() 
+        if isinstance(typ, basestring):
+            typ = [typ]
+        columns = list(self.columns)
+        cube = self.to_cube(columns, copy = False)
+        if breaks is None:
+            classes, codes = unique((cube.ages//step)*step, return_inverse = True)
+        else:
+            bounds = array(sorted(breaks))
+            codes = (bounds.searchsorted(cube.ages, side = 'right') - 1).clip(0, len(bounds) - 1)
+            classes, codes = unique(bounds[codes], return_inverse = True)
 
-       
-        #New version which takes in account the change of population over the years
-        print pvm        
-        age_class_pvm = pvm.groupby(['age', 'year']).sum()
-        age_class_pvf = pvf.groupby(['age', 'year']).sum()
-        print age_class_pvm
-        
-        age_class_pvm[typ] *= 1.0/age_class_pvm['pop']
-        age_class_pvf[typ] *= 1.0/age_class_pvf['pop']
-         
-        #Put back the dataframes together
-        pieces = [age_class_pvm, age_class_pvf]
-        res =  concat(pieces, keys = [0,1], names = ["sex"] )
-        res = res.reset_index()
-        res = res.set_index(['age', 'sex', 'year'])
-        return AccountingCohorts(res)            
+        # The ages are sorted so that each class is a segment of the age axis
+        block = array([cube[name] for name in columns], dtype = float)
+        block[isnan(block)] = 0
+        sums = add.reduceat(block, codes.searchsorted(arange(len(classes))), axis = 1)
+        pop = sums[columns.index('pop')]
+        for name in typ:
+            sums[columns.index(name)] /= pop
+
+        index = MultiIndex.from_product([classes, cube.sexes, cube.years], names = ['age', 'sex', 'year'])
+        res = DataFrame(sums.reshape(len(columns), -1).T, index = index, columns = columns)
+        return AccountingCohorts(res)
  
     def compute_ipl(self, typ, net_gov_wealth = None, net_gov_spendings = None, precision=False):
         """
@@ -171,35 +214,7 @@ class AccountingCohorts(Cohorts):
         if net_gov_spendings is None:
             net_gov_spendings = 0
          
-        year_min = array(list(self.index_sets['year'])).min()
-        year_max = array(list(self.index_sets['year'])).max()
-        before_year_max = array(list(self.index_sets['year'])).max() - 1
-        
-        age_max = array(list(self.index_sets['age'])).max()
-         
-        past_gen_dataframe = self.xs(year_min, level = 'year')
-        past_gen_dataframe = past_gen_dataframe.cumsum()
-        past_gen_transfer = past_gen_dataframe.get_value((age_max, 1), typ)
-#         print '    past_gen_transfer = ', past_gen_transfer
- 
-         
-        future_gen_dataframe = self.xs(0, level = 'age')
-        future_gen_dataframe = future_gen_dataframe.cumsum()
-        future_gen_transfer = future_gen_dataframe.get_value((1, year_max), typ)
-#         print '    future_gen_transfer =', future_gen_transfer
-        
-        #Note : do not forget to eliminate values counted twice
-        ipl = net_gov_spendings - net_gov_wealth - future_gen_transfer - past_gen_transfer + past_gen_dataframe.get_value((0, 0), typ)
-        
-        if precision:
-            future_gen_transfer_last = future_gen_dataframe.get_value((1, before_year_max), typ)
-            last_ipl = net_gov_spendings - net_gov_wealth - past_gen_transfer - future_gen_transfer_last + past_gen_dataframe.get_value((0, 0), typ)
-            
-            to_return = (ipl - last_ipl)/ipl
-        else:
-            to_return = ipl
-        
-        return to_return
+        return liability_from_terms(self.indicator_terms(typ), net_gov_wealth, net_gov_spendings, precision)
     
     def break_down_ipl(self, typ, net_gov_wealth = None, net_gov_spendings = None, threshold = 60):
         """
@@ -224,37 +239,18 @@ class AccountingCohorts(Cohorts):
         if net_gov_spendings is None:
             net_gov_spendings = 0
          
-        year_min = array(list(self.index_sets['year'])).min()
-        year_max = array(list(self.index_sets['year'])).max()
-        before_year_max = array(list(self.index_sets['year'])).max() - 1
-        
-        age_max = array(list(self.index_sets['age'])).max()
-         
-        past_gen_dataframe = self.xs(year_min, level = 'year')
-        past_gen_dataframe = past_gen_dataframe.cumsum()
-        past_gen_transfer = past_gen_dataframe.get_value((age_max, 1), typ)
-#         print '    past_gen_transfer = ', past_gen_transfer
- 
-        #On crée nos deux dataframe de travail : 
-        future_gen_dataframe = self.xs(0, level = 'age')
-        age_gen_df = self.xs(threshold, level = 'age')
-        
-        # On manipule les générations non-nées
-        future_gen_dataframe = future_gen_dataframe.unstack(level='sex')
-        future_gen_dataframe['age'] = 0
-        future_gen_dataframe.reset_index(inplace=True)
-        future_gen_dataframe.set_index(keys=['age', 'year'], inplace=True)
-        
-        # On manipule des généartions seuil
-        age_gen_df = age_gen_df.unstack(level='sex')
-        age_gen_df['age'] = threshold
-        age_gen_df.reset_index(inplace=True)
-        age_gen_df.set_index(keys=['age', 'year'], inplace=True)
-
-        broken_down = concat([future_gen_dataframe, age_gen_df])
-        broken_down = broken_down.unstack(level='age')
-        print broken_down.head().to_string()
-        
+        # The newborns and the generations of the threshold age are read at their positions in the cube
+        columns = list(self.columns)
+        cube = self.to_cube(columns, copy = False)
+        ages = cube.ages.searchsorted([0, threshold])
+        for position, age in zip(ages, [0, threshold]):
+            if position >= len(cube.ages) or cube.ages[position] != age:
+                raise Exception('%s is not an age of the cohorts' % age)
+        # (column, sex, age, year) block with the years as rows
+        block = array([cube[name][ages] for name in columns]).transpose(0, 2, 1, 3)
+        broken_down = DataFrame(block.reshape(-1, len(cube.years)).T, index = Index(cube.years, name = 'year'),
+                                columns = MultiIndex.from_product([columns, cube.sexes, [0, threshold]],
+                                                                  names = [None, 'sex', 'age']))
         return broken_down
 
 
@@ -8,7 +8,9 @@ Created on May 22, 2012
 
 from __future__ import division
 from pandas import DataFrame, read_csv, concat, ExcelFile, HDFStore
-from numpy import NaN, arange, hstack, array
+from numpy import NaN, arange, hstack, array, atleast_1d, bincount, flatnonzero, in1d, dtype as dtype_of, float32, result_type
+from src.lib.cohorts.cube import CohortsCube, DERIVED_COLUMNS
+from src.lib.cohorts.factors import factor_table
 import os
 
 class Cohorts(DataFrame):
@@ -36,18 +38,71 @@ class Cohorts(DataFrame):
             self._types_years = dict()   # TODO: merge this dict with the previous list
             self._year_min = None
             self._year_max = None
+            self._recipes = dict()   # methods and arguments computing the derived columns
             self.name = None
             self.post_init()
 
 
+    def __getitem__(self, key):
+        # An evicted derived column is computed again when it is read
+        if isinstance(key, basestring) and key in DERIVED_COLUMNS and key not in self.columns:
+            recipes = self.__dict__.get('_recipes', {})
+            if key in recipes:
+                method, args = recipes[key]
+                getattr(self, method)(*args)
+        return super(Cohorts, self).__getitem__(key)
+
+    @property
+    def version(self):
+        """
+        Number of edits of the cohort, the simulation stages depending on it are computed again
+        when it changes. It is increased by the assignments of columns, the indexers (.loc, .iloc, .at),
+        the edits in place of a column and the operations with inplace=True,
+        not by the edits of the arrays returned by .values.
+        The derived columns only depend on rates, their eviction and restoration are not counted
+        """
+        return self.__dict__.get('_version', 0)
+
+    def _edited(self, key = None):
+        if not (isinstance(key, basestring) and key in DERIVED_COLUMNS):
+            self.__dict__['_version'] = self.version + 1
+
+    def __setitem__(self, key, value):
+        super(Cohorts, self).__setitem__(key, value)
+        self._edited(key)
+
+    def __delitem__(self, key):
+        super(Cohorts, self).__delitem__(key)
+        self._edited(key)
+
+    def _set_value(self, *args, **kwargs):
+        result = super(Cohorts, self)._set_value(*args, **kwargs)
+        self._edited()
+        return result
+
+    def _maybe_update_cacher(self, *args, **kwargs):
+        # Called by pandas after an indexer or an operation modified the cohort in place
+        super(Cohorts, self)._maybe_update_cacher(*args, **kwargs)
+        self._edited()
+
+    def _maybe_cache_changed(self, item, value):
+        # Called by pandas when a column taken from the cohort is modified in place
+        super(Cohorts, self)._maybe_cache_changed(item, value)
+        self._edited()
+
+
     def post_init(self):
         """
-        Post initialization, computes index_sets, _agemin, _agemax attributes
+        Post initialization, computes index_sets, _agemin, _agemax attributes.
+        The sets are read from the levels of the index, keeping the values used by its codes.
+        The missing entries of a level (code -1) are NaN in the set
         """
-        temp = zip(*self.index)
-        name = self.index.names 
-        for t, n in zip(temp, name):
-            self.index_sets[n] = set(t)
+        index = self.index
+        for level, codes, name in zip(index.levels, index.codes, index.names):
+            used = bincount(codes[codes >= 0], minlength = len(level)) > 0
+            self.index_sets[name] = set(level[used].tolist())
+            if (codes < 0).any():
+                self.index_sets[name].add(NaN)
 
         self._agemin = min(self.index_sets['age'])
         self._agemax = max(self.index_sets['age'])
@@ -55,6 +110,106 @@ class Cohorts(DataFrame):
         self._year_max = max(self.index_sets['year'])
 
 
+    def to_cube(self, columns=None, copy=True):
+        """
+        Returns a CohortsCube holding the columns as dense (age, sex, year) arrays.
+        
+        Parameters
+        ----------
+        columns : list of str, default None
+                  the columns to convert, all the columns if None
+        copy : bool, default True
+               if False and the cohort is sorted and complete, 
+               the arrays of the cube are views on the cohort data
+        """
+        # The cube is in single precision only if all the columns are
+        names = self.columns if columns is None else columns
+        dtype = result_type(float32, *[self.dtypes[name] for name in names if name in self.dtypes])
+        return CohortsCube.from_frame(self, columns, copy, dtype = dtype)
+
+
+    def _precision(self):
+        """
+        Returns the dtype of the population when it is a float, used for the profiles
+        and the factors of the cohort, double precision otherwise
+        """
+        if 'pop' in self.columns and self['pop'].dtype.kind == 'f':
+            return self['pop'].dtype
+        return dtype_of(float)
+
+
+    def clone(self):
+        """
+        Returns a copy of the cohort keeping its types and their years.
+        The derived columns are not copied, they are computed again when read
+        """
+        res = self.__class__(data = self.drop(self._derived_columns(), axis = 1))
+        res._nb_type = self._nb_type
+        res._types = list(self._types)
+        res._types_years = dict(self._types_years)
+        res._recipes = dict(self._recipes)
+        res.name = self.name
+        return res
+
+
+    def _derived_columns(self):
+        return [name for name in self.columns if name in DERIVED_COLUMNS]
+
+
+    def restore_derived(self):
+        """
+        Computes again the derived columns which were evicted or not copied
+        """
+        for name, (method, args) in self._recipes.items():
+            if name not in self.columns:
+                getattr(self, method)(*args)
+
+
+    def memory_report(self, counted = None):
+        """
+        Returns the memory footprint of the index and of each column of the cohort
+        
+        Parameters
+        ----------
+        counted : set, default None
+                  ids of the arrays already counted, see CohortsCube.memory_report.
+                  The columns of a cohort are never shared
+        
+        Returns
+        -------
+        report : DataFrame indexed by column with the number of 'bytes' and a 'derived' flag
+                 for the columns which can be evicted
+        """
+        usage = self.memory_usage(index = True, deep = True)
+        return DataFrame({'bytes': usage, 'derived': [name in DERIVED_COLUMNS for name in usage.index]},
+                         columns = ['bytes', 'derived'])
+
+
+    def evict_derived(self, budget = None):
+        """
+        Drops the derived columns, the largest first, until the cohort uses at most budget bytes.
+        An evicted column is computed again when it is read.
+        
+        Parameters
+        ----------
+        budget : int, default None
+                 memory budget in bytes, all the derived columns are dropped if None
+        
+        Returns
+        -------
+        size : the number of bytes used by the cohort afterwards
+        """
+        report = self.memory_report()
+        size = report['bytes'].sum()
+        derived = report['bytes'][report['derived']].sort_values(ascending = False)
+        for name, nbytes in derived.iteritems():
+            if budget is not None and size <= budget:
+                break
+            del self[name]
+            size -= nbytes
+        return size
+
+
     def totaux(self, by, column, pivot = False):
         """
         Compute a pivot table 
@@ -150,6 +305,7 @@ class Cohorts(DataFrame):
             var = 'typ%i'%typ
             self['tmp'] = self[var]*self['pop']
             sums = self.totaux(by = 'year', column = 'tmp')
+            del self['tmp']
             
             unities = self._agg['%i' %typ]/sums
             # warning: creates NaN from 2071 to 2200 because agg unknown
@@ -163,19 +319,30 @@ class Cohorts(DataFrame):
                 self.xs(yr, level='year', axis=0)[var] = a
 
     
+    def _year_offsets(self):
+        """
+        Returns the position of the year of each row among the years of the cohort
+        """
+        years = array(sorted(self.index_sets['year']))
+        return years.searchsorted(self.index.get_level_values('year'))
+
+    def _broadcast_years(self, factors):
+        """
+        Broadcasts a vector of factors indexed by year offsets along the rows of the cohort
+        """
+        return factors[self._year_offsets()]
+
     def gen_grth(self, g):
         self._growth_rate = g
-        self['grth'] = NaN
-        grouped = self.groupby(level = ['sex', 'age'])['grth']
+        self._recipes['grth'] = ('gen_grth', (g,))
         nb_years = len(self.index_sets['year'])
-        self['grth'] = grouped.transform(lambda x: ((1+g)**(arange(nb_years))))
+        self['grth'] = self._broadcast_years(factor_table.growth(g, nb_years, self._year_min).astype(self._precision()))
 
     def gen_dsct(self, r):
         self._discount_rate = r 
-        self['dsct'] = NaN
-        grouped = self.groupby(level = ['sex', 'age'])['dsct']
+        self._recipes['dsct'] = ('gen_dsct', (r,))
         nb_years = len(self.index_sets['year'])
-        self['dsct'] = grouped.transform(lambda x: 1/((1+r)**arange(nb_years)))
+        self['dsct'] = self._broadcast_years(factor_table.discount(r, nb_years, self._year_min).astype(self._precision()))
     
     def gen_actualization(self, arg1 , arg2):
         """
@@ -183,24 +350,26 @@ class Cohorts(DataFrame):
         
         Parameters
         ----------
-        arg1 : any growth rate 
-        arg2 : any discount rate (such as interest rate)
+        arg1 : any growth rate or year-indexed path of growth rates
+        arg2 : any discount rate (such as interest rate) or year-indexed path of discount rates
         """
-        self['actualization']= NaN
-        grouped = self.groupby(level = ['sex', 'age'])['actualization']
+        self._recipes['actualization'] = ('gen_actualization', (arg1, arg2))
         nb_years = len(self.index_sets['year'])
-        self['actualization'] = grouped.transform(lambda x: ((1+ arg1)/(1+ arg2)**arange(nb_years)))        
+        factors = factor_table.actualization(arg1, arg2, nb_years, self._year_min)
+        self['actualization'] = self._broadcast_years(factors.astype(self._precision()))
 
 
     def filter_value(self, age=None, sex=None, year=None, typ=None):
         """
         A method to filter a multi-index Cohort in an easy fashion.
+        The filters are evaluated on the codes of the index levels, a contiguous
+        selection is returned as a slice of the cohort.
         
         Parameters
         ----------
         age : List
             The values of the age index have to be between 0 and 100 included
-        sex : 0 or 1
+        sex : 0 or 1 (or a list)
             The sex index we are interested in. 0 stands for males and 1 for females. Default is both.
         year : List
             The years we are interested in.
@@ -214,59 +383,45 @@ class Cohorts(DataFrame):
         #Setting up defaults arguments if not given
         if typ is None:
             typ = self._types
-        #Setting up filter to check if the arguments are valid
-#         if typ not in self._types:
-#             raise Exception('This is not a valid column of the cohort')
-        #Setting up filters
-        if age is not None:
-            filter_age = array([x in age for x in self.index.get_level_values(0)])
-        if sex is not None:
-            filter_sex = array(self.index.get_level_values(1) == sex)     
-        if year is not None:
-            filter_year = array([x in year for x in self.index.get_level_values(2)])
-        
-        #Filtering the cohort
-        if age is None:
-            if sex is None:
-                if year is None:
-                    restricted_cohort = self.loc[:, typ]  
-#                     return restricted_cohort
-                else:
-                    restricted_cohort = self.loc[filter_year, typ]
-#                     return restricted_cohort
-            else:
-                if year is None:
-                    restricted_cohort = self.loc[filter_sex, typ]
-#                     return restricted_cohort
-                else:
-                    filter_SY = array(filter_sex & filter_year)
-                    restricted_cohort = self.loc[filter_SY, typ]
-#                     return restricted_cohort
-        else:
-            if sex is None:
-                if year is None:
-                    restricted_cohort = self.loc[filter_age, typ]  
-#                     return restricted_cohort
-                else:
-                    filter_AY = array(filter_age & filter_year)
-                    restricted_cohort = self.loc[filter_AY, typ]
-#                     return restricted_cohort
-            else:
-                if year is None:
-                    filter_AS = array(filter_age & filter_sex)
-                    restricted_cohort = self.loc[filter_AS, typ]
-#                     return restricted_cohort
-                else:
-                    filter3 = array(filter_age & filter_sex & filter_year)
-#                     print filter3
-                    restricted_cohort = self.loc[ filter3, typ]
-#                     return restricted_cohort
+        rows = self._filter_rows(age = age, sex = sex, year = year)
+        restricted_cohort = self.iloc[rows][typ]
         restricted_cohort_ = Cohorts(restricted_cohort)
         restricted_cohort_.columns = [typ]
         return restricted_cohort_
 
 
 
+    def _filter_rows(self, **values):
+        """
+        Returns the rows of the cohort whose index levels take the given values,
+        as a slice when they are contiguous and as an array of positions otherwise
+
+        Parameters
+        ----------
+        values : the values kept for each level name, None keeps all of them
+        """
+        index = self.index
+        mask = None
+        for name, kept in values.iteritems():
+            if kept is None:
+                continue
+            level = index.names.index(name)
+            # Membership is tested once per distinct value of the level, then read by code.
+            # The missing entries have code -1 and are never kept
+            wanted = in1d(index.levels[level], atleast_1d(kept))
+            codes = index.codes[level]
+            level_mask = (codes >= 0) & wanted[codes]
+            mask = level_mask if mask is None else mask & level_mask
+        if mask is None:
+            return slice(None)
+        rows = flatnonzero(mask)
+        if len(rows) == 0:
+            return rows
+        if rows[-1] - rows[0] + 1 == len(rows):
+            return slice(rows[0], rows[-1] + 1)
+        return rows
+
+
     def get_unknown_years(self, typ):
         """
         
@@ -0,0 +1,849 @@
+# -*- coding:utf-8 -*-
+# Copyright © 2012 Clément Schaff, Mahdi Ben Jelloul
+'''
+Created on 18 oct. 2013
+
+@author: Mahdi Ben Jelloul, Jérôme Santoul
+'''
+from __future__ import division
+from pandas import DataFrame, Index, MultiIndex
+from numpy import (NaN, arange, array, asarray, empty, zeros, ones, unique,
+                   searchsorted, newaxis, broadcast_to, tensordot, dtype as dtype_of)
+from src.lib.cohorts.factors import factor_table
+
+
+# Scratch columns derived from the index and the rates. They are computed again when they are read
+# after an eviction, and they are neither copied into clones nor into accounting results
+DERIVED_COLUMNS = ['grth', 'dsct', 'actualization', 'inflation', 'total_taxes', 'total_payments', 'tmp']
+
+
+def generation_present_value(flows):
+    """
+    Sums flows along birth cohorts, backward in time.
+    The last three axes of flows must be (age, sex, year), leading axes are kept.
+
+    Parameters
+    ----------
+    flows : ndarray
+            (discounted) flows, the last three axes being age, sex and year
+
+    Returns
+    -------
+    res : ndarray of the same shape such that
+          res[..., a, s, t] = flows[..., a, s, t] + res[..., a+1, s, t+1]
+    """
+    flows = asarray(flows, dtype=float)
+    nb_ages, nb_years = flows.shape[-3], flows.shape[-1]
+    planes = flows.swapaxes(-3, -2)   # (..., sex, age, year)
+
+    # Shear the age x year plane so that every birth cohort lies on a column,
+    # then sum each column from the oldest age down to the youngest
+    ages = arange(nb_ages)[:, newaxis]
+    diagonals = arange(nb_years)[newaxis, :] - ages + nb_ages - 1
+    sheared = zeros(planes.shape[:-1] + (nb_years + nb_ages - 1,))
+    sheared[..., ages, diagonals] = planes
+    sheared = sheared[..., ::-1, :].cumsum(axis=-2)[..., ::-1, :]
+
+    return sheared[..., ages, diagonals].swapaxes(-3, -2).copy()
+
+
+def generation_matrix(values, ages, years):
+    """
+    Re-indexes an (age, sex, year) array by birth cohort, shearing the age x year plane
+    as generation_present_value does.
+
+    Parameters
+    ----------
+    values : ndarray
+             the (age, sex, year) array
+    ages, years : ndarray
+                  the ages and the years of the axes of values
+
+    Returns
+    -------
+    births : ndarray of the birth years, from the oldest age the first year to the newborns of the last one
+    matrix : (birth, sex, age) ndarray, NaN for the ages a cohort does not reach within the years
+    """
+    ages = asarray(ages)
+    years = asarray(years)
+    births = arange(years.min() - ages.max(), years.max() - ages.min() + 1)
+    diagonals = years[newaxis, :] - ages[:, newaxis] - births[0]
+    matrix = empty((len(births), len(ages), values.shape[1]))
+    matrix.fill(NaN)
+    matrix[diagonals, arange(len(ages))[:, newaxis]] = values.swapaxes(1, 2)
+    return births, matrix.swapaxes(1, 2)
+
+
+def truncated_present_value(pv, start, stop):
+    """
+    Returns the generational present values of the flows of the years start to stop
+    (positions along the year axis, stop included) from the present values pv
+    of the flows of a longer horizon, by removing the part of each birth cohort beyond stop.
+
+    Parameters
+    ----------
+    pv : ndarray
+         present values returned by generation_present_value
+    start : int
+            position of the first year kept
+    stop : int
+           position of the last year of the horizon
+    """
+    res = pv[..., start:stop+1].copy()
+    if stop + 1 < pv.shape[-1]:
+        nb_ages = pv.shape[-3]
+        # The birth cohort of (age, year) reaches the year stop+1 at age + stop+1 - year
+        ages = arange(nb_ages)[:, newaxis] + (stop + 1 - arange(start, stop + 1))[newaxis, :]
+        alive = ages < nb_ages
+        tail = pv[..., :, :, stop+1][..., ages.clip(0, nb_ages - 1), :]   # (..., age, year, sex)
+        res -= tail.swapaxes(-1, -2)*alive[:, newaxis, :]
+    return res
+
+
+def geometric_tail(first_flows, ratio):
+    """
+    Returns the present values of the flows beyond the last projected year when the (age, sex)
+    discounted flows of the first year after the horizon are multiplied by ratio every following year.
+
+    Parameters
+    ----------
+    first_flows : ndarray
+                  (age, sex) discounted flows of the first year after the horizon
+    ratio : float
+            yearly ratio of the discounted flows, lower than 1
+
+    Returns
+    -------
+    entering : ndarray (age, sex), present value of the flows beyond the horizon of a birth cohort
+               reaching the first year after the horizon at each age
+    unborn : ndarray (sex), present value of all the generations born after the horizon
+    """
+    if not abs(ratio) < 1:
+        raise Exception('the tail is infinite: the discounted flows do not decrease after the horizon')
+    first_flows = asarray(first_flows, dtype=float)
+    entering = zeros(first_flows.shape)
+    following = 0
+    for age in range(first_flows.shape[0] - 1, -1, -1):
+        following = first_flows[age] + ratio*following
+        entering[age] = following
+    # The generation born k years after the horizon gets ratio**(k-1) times the first one
+    return entering, entering[0]/(1 - ratio)
+
+
+def add_tail(pv, entering):
+    """
+    Returns the generational present values of an (age, sex, year) array pv to which the tail
+    beyond the last year is added, entering being returned by geometric_tail.
+    It is the converse of truncated_present_value.
+    """
+    nb_ages, nb_years = pv.shape[-3], pv.shape[-1]
+    # The birth cohort of (age, year) reaches the first year after the horizon at age + nb_years - year
+    ages = arange(nb_ages)[:, newaxis] + (nb_years - arange(nb_years))[newaxis, :]
+    alive = ages < nb_ages
+    tail = entering[ages.clip(0, nb_ages - 1), :]   # (age, year, sex)
+    return pv + tail.swapaxes(-1, -2)*alive[:, newaxis, :]
+
+
+def intertemporal_public_liability(pv, net_gov_wealth=0, net_gov_spendings=0, precision=False):
+    """
+    Returns the intertemporal public liability from an (age, sex, year) array
+    of aggregated present values of net transfers.
+    Leading axes (scenarios for instance) are kept.
+
+    Parameters
+    ----------
+    pv : ndarray
+         Aggregated generational present values
+    net_gov_wealth : the present value of the wealth of the government
+    net_gov_spendings : the present value of unventilated government spendings
+    precision : bool, default False
+                if True returns the relative contribution of the last projected year instead
+    """
+    return liability_from_terms(indicator_terms(pv), net_gov_wealth, net_gov_spendings, precision)
+
+
+def indicator_terms(pv):
+    """
+    Returns the reductions of an (age, sex, year) array of aggregated or per capita present values
+    the indicators are computed from. Leading axes (scenarios for instance) are kept.
+
+    Returns
+    -------
+    terms : dict
+            'past' sum over the generations alive the first year,
+            'future' sum over the newborns of all the years,
+            'newborn' the newborns of the first year by sex,
+            'last' the newborns of the last sex the last year
+    """
+    return {'past': pv[..., :, :, 0].sum(axis=-1).sum(axis=-1),
+            'future': pv[..., 0, :, :].sum(axis=-1).sum(axis=-1),
+            'newborn': pv[..., 0, :, 0].copy(),
+            'last': pv[..., 0, -1, -1].copy()}
+
+
+def liability_from_terms(terms, net_gov_wealth=0, net_gov_spendings=0, precision=False):
+    """
+    Returns the intertemporal public liability from the terms returned by indicator_terms,
+    see intertemporal_public_liability
+    """
+    #Note : do not forget to eliminate values counted twice
+    ipl = net_gov_spendings - net_gov_wealth - terms['future'] - terms['past'] + terms['newborn'][..., 0]
+
+    if precision:
+        last_ipl = ipl + terms['last']
+        return (ipl - last_ipl)/ipl
+    return ipl
+
+
+def extension_contribution(block_pv, start):
+    """
+    Returns the change of the intertemporal public liability when the horizon is extended
+    by a block of years, from the present values of the flows of the block only.
+
+    Parameters
+    ----------
+    block_pv : ndarray
+               (age, sex, year) present values returned by generation_present_value
+               for the flows of the block of years
+    start : int
+            position of the first year of the block, counted from the first year of the projection
+    """
+    # Generations alive the first year reach the block at age start or older,
+    # the following ones at an age between 1 and start
+    past_gen_transfer = block_pv[start:, :, 0].sum()
+    future_gen_transfer = block_pv[1:start+1, :, 0].sum() + block_pv[0, :, :].sum()
+    contribution = - past_gen_transfer - future_gen_transfer
+    if start < block_pv.shape[0]:
+        contribution += block_pv[start, 0, 0]
+    return contribution
+
+
+def generational_imbalance(past_gen_transfer, newborn_pv, unborn_population, actualization,
+                           net_gov_wealth=0, net_gov_spendings=0):
+    """
+    Returns the ratio between the per capita net transfer of the unborn generations
+    which satisfies the government budget constraint and the one of the newborns.
+    Leading axes (scenarios for instance) are kept.
+
+    Parameters
+    ----------
+    past_gen_transfer : aggregated present value of the generations alive the first year
+    newborn_pv : ndarray
+                 per capita present values of the newborns of the first year, by sex
+    unborn_population : ndarray
+                        newborns of both sexes of the following years
+    actualization : ndarray
+                    actualization factors of the following years
+    net_gov_wealth : the present value of the wealth of the government
+    net_gov_spendings : the present value of unventilated government spendings
+    """
+    unborn_population = asarray(unborn_population, dtype=float)
+    future_gen_transfer = net_gov_spendings - net_gov_wealth - past_gen_transfer
+    mu_1 = (actualization*unborn_population).sum(axis=-1)/unborn_population[..., 0]
+    n_1 = future_gen_transfer/(mu_1*unborn_population[..., 0]) # = percapita_future_gen_transfer
+    n_0 = newborn_pv[..., 0]/2 + newborn_pv[..., 1]/2 # = actual_gen_transfer
+    return n_1/n_0
+
+
+def net_transfers_weights(taxes_list, payments_list, weights=None):
+    """
+    Returns the weights of the profiles in the net transfers, taxes counting positively
+    and payments negatively, multiplied by their weight if one is given
+
+    Parameters
+    ----------
+    taxes_list : list
+                 the names of the taxes profiles
+    payments_list : list
+                    the names of the subsidies and payments profiles
+    weights : dict, default None
+              multipliers of some profiles, the others are counted fully
+    """
+    if weights is None:
+        weights = dict()
+    combined = dict()
+    for sign, names in [(1, taxes_list), (-1, payments_list)]:
+        for name in names:
+            combined[name] = combined.get(name, 0) + sign*weights.get(name, 1)
+    return combined
+
+
+def weights_matrix(aggregates):
+    """
+    Returns the names of the aggregates, the profiles they combine
+    and the (profiles x aggregates) matrix of their weights
+
+    Parameters
+    ----------
+    aggregates : dict
+                 the weights of the profiles (a dict or a Series indexed by profile) of each aggregate
+    """
+    names = list(aggregates)
+    columns = list()
+    for name in names:
+        for column in dict(aggregates[name]):
+            if column not in columns:
+                columns.append(column)
+    matrix = zeros((len(columns), len(names)))
+    for position, name in enumerate(names):
+        for column, weight in dict(aggregates[name]).iteritems():
+            matrix[columns.index(column), position] = weight
+    return names, columns, matrix
+
+
+class CohortsCube(object):
+    """
+    Dense storage for cohorts. Every column is kept as a contiguous (age, sex, year)
+    array indexed by integer offsets. Growth, discount and inflation factors are only
+    stored as year vectors, and profiles filled for all the years as (age, sex) arrays
+    until they are expanded. Clones share the arrays of their columns copy-on-write.
+    The MultiIndex DataFrame is only built when to_frame is called.
+    """
+    def __init__(self, ages, sexes, years, data=None, dtype=float):
+        super(CohortsCube, self).__init__()
+        self.dtype = dtype_of(dtype)
+        self._data = dict()
+        self._columns = list()
+        self._factors = dict()
+        self._profiles = dict()
+        self._shared = set()   # columns whose read-only arrays are shared with clones
+        self._types = list()
+        self._types_years = dict()
+        self.name = None
+        self.version = 0   # number of edits, see Cohorts.version
+        self._set_axes(ages, sexes, years)
+        if data is not None:
+            for name, values in data.iteritems():
+                self[name] = values
+
+    def _set_axes(self, ages, sexes, years):
+        self.ages = asarray(ages)
+        self.sexes = asarray(sexes)
+        self.years = asarray(years)
+        self.shape = (len(self.ages), len(self.sexes), len(self.years))
+        self._agemin = self.ages.min()
+        self._agemax = self.ages.max()
+        self._year_min = self.years.min()
+        self._year_max = self.years.max()
+        self.index_sets = {'age': set(self.ages), 'sex': set(self.sexes), 'year': set(self.years)}
+
+    def clone(self):
+        """
+        Returns a copy of the cube keeping its types and their years.
+        Factor vectors and profiles that are not expanded are shared since they are read-only.
+        The arrays of the columns are shared copy-on-write: they become read-only and a column
+        is only copied when one of the cubes expands it to edit it in place
+        """
+        res = CohortsCube(self.ages, self.sexes, self.years, dtype=self.dtype)
+        for name, data in self._data.iteritems():
+            data.flags.writeable = False
+            res._data[name] = data
+        self._shared.update(self._data)
+        res._shared = set(self._data)
+        res._columns = list(self._columns)
+        res._factors = dict(self._factors)
+        res._profiles = dict(self._profiles)
+        res._types = list(self._types)
+        res._types_years = dict(self._types_years)
+        res.name = self.name
+        return res
+
+    @classmethod
+    def from_frame(cls, df, columns=None, copy=True, dtype=float):
+        """
+        Builds a cube from a (age, sex, year) MultiIndex DataFrame
+
+        Parameters
+        ----------
+        df : DataFrame
+             The data, missing cells are filled with NaN
+        columns : list of str, default None
+                  The columns to store, all the columns if None
+        copy : bool, default True
+               if False and df is sorted and complete, the arrays are views on df data
+        dtype : numpy dtype, default float
+                precision of the stored arrays, for instance float32 to halve the memory used
+        """
+        if columns is None:
+            # Derived columns are kept as factors of the years
+            columns = [name for name in df.columns if name not in DERIVED_COLUMNS]
+        index = df.index
+        if set(['age', 'sex', 'year']) != set(index.names):
+            raise Exception('Need  age, sex and year indexes')
+
+        values = [asarray(index.get_level_values(name)) for name in ['age', 'sex', 'year']]
+        ages, sexes, years = [unique(value) for value in values]
+        years = arange(years.min(), years.max() + 1)
+        cube = cls(ages, sexes, years, dtype=dtype)
+
+        dense = (list(index.names) == ['age', 'sex', 'year'] and len(index) == cube.size
+                 and index.is_monotonic_increasing and index.is_unique)
+        if not dense:
+            positions = tuple(searchsorted(axis, value)
+                              for axis, value in zip([ages, sexes, years], values))
+        for col in columns:
+            if dense:
+                data = asarray(df[col], dtype=cube.dtype).reshape(cube.shape)
+                if copy:
+                    cube[col] = data
+                else:
+                    cube._columns.append(col)
+                    cube._data[col] = data
+            else:
+                data = empty(cube.shape, dtype=cube.dtype)
+                data.fill(NaN)
+                data[positions] = asarray(df[col], dtype=cube.dtype)
+                cube[col] = data
+
+        if hasattr(df, '_types'):
+            cube._types = [typ for typ in df._types if typ in columns]
+            cube._types_years = dict(df._types_years)
+            cube.name = df.name
+            for name, (method, args) in df._recipes.iteritems():
+                if name not in columns and hasattr(cube, method):
+                    getattr(cube, method)(*args)
+        return cube
+
+    def to_frame(self, columns=None, cls=None):
+        """
+        Builds the (age, sex, year) MultiIndex DataFrame of the given columns
+
+        Parameters
+        ----------
+        columns : list of str, default None
+                  The columns to export, all columns and factors if None
+        cls : class, default None
+              A Cohorts class used to wrap the result
+        """
+        if columns is None:
+            columns = self.columns
+        index = MultiIndex.from_product([self.ages, self.sexes, self.years],
+                                        names=['age', 'sex', 'year'])
+        data = dict((col, self._expand(col).ravel()) for col in columns)
+        df = DataFrame(data, index=index, columns=columns)
+        if cls is None:
+            return df
+        res = cls(df)
+        res._types = [typ for typ in self._types if typ in columns]
+        res._types_years = dict(self._types_years)
+        res.name = self.name
+        return res
+
+    def to_cube(self, columns=None, copy=True):
+        return self
+
+    @property
+    def size(self):
+        return self.shape[0]*self.shape[1]*self.shape[2]
+
+    @property
+    def columns(self):
+        return self._columns + sorted(self._factors.keys())
+
+    def __contains__(self, name):
+        return name in self._data or name in self._profiles or name in self._factors
+
+    def __getitem__(self, name):
+        if name in self._data:
+            return self._data[name]
+        if name in self._profiles:
+            return broadcast_to(self._profiles[name][:, :, newaxis], self.shape)
+        if name in self._factors:
+            return self._factors[name][newaxis, newaxis, :]
+        raise KeyError(name)
+
+    def __setitem__(self, name, values):
+        data = empty(self.shape, dtype=self.dtype)
+        data[...] = values
+        if name not in self._data and name not in self._profiles:
+            self._columns.append(name)
+        self._factors.pop(name, None)
+        self._profiles.pop(name, None)
+        self._shared.discard(name)
+        self._data[name] = data
+        self._edited(name)
+
+    def __delitem__(self, name):
+        self._edited(name)
+        self._shared.discard(name)
+        if name in self._data or name in self._profiles:
+            self._data.pop(name, None)
+            self._profiles.pop(name, None)
+            self._columns.remove(name)
+        else:
+            del self._factors[name]
+
+    def _edited(self, name):
+        # The derived columns only depend on rates, they are evicted and restored freely
+        if name not in DERIVED_COLUMNS:
+            self.version += 1
+
+    def _expand(self, name):
+        if name in self._data:
+            return self._data[name]
+        data = empty(self.shape, dtype=self.dtype)
+        data[...] = self[name]
+        return data
+
+    def expand(self, name):
+        """
+        Returns the dense (age, sex, year) array of a column, a profile kept as an (age, sex) array
+        is expanded along the years first and a column shared with a clone is copied,
+        so that specific years can be edited in place. The edits of the arrays returned by
+        __getitem__ are not counted in the version of the cube, those of expand are
+        """
+        if name in self._profiles or name in self._shared:
+            self[name] = self[name]
+        self._edited(name)
+        return self._data[name]
+
+    def memory_report(self, counted=None):
+        """
+        Returns the memory footprint of each column of the cube, see Cohorts.memory_report.
+        Factors and profiles that are not expanded only count their vectors
+
+        Parameters
+        ----------
+        counted : set, default None
+                  ids of the arrays already counted, which count no bytes, for instance
+                  the arrays shared with another cube. The ids of the arrays of the cube are added
+        """
+        names = self._columns + sorted(self._factors.keys())
+        nbytes = list()
+        for name in names:
+            if name in self._data:
+                data = self._data[name]
+            elif name in self._profiles:
+                data = self._profiles[name]
+            else:
+                data = self._factors[name]
+            if counted is None or id(data) not in counted:
+                nbytes.append(data.nbytes)
+            else:
+                nbytes.append(0)
+            if counted is not None:
+                counted.add(id(data))
+        return DataFrame({'bytes': nbytes, 'derived': [name in DERIVED_COLUMNS for name in names]},
+                         index = names, columns = ['bytes', 'derived'])
+
+    def evict_derived(self, budget=None):
+        """
+        Drops the derived columns stored as full arrays, see Cohorts.evict_derived.
+        Factors are kept since they are only year vectors
+        """
+        for name in [name for name in self._data if name in DERIVED_COLUMNS]:
+            del self[name]
+        return self.memory_report()['bytes'].sum()
+
+    def restore_derived(self):
+        """
+        Factors are never evicted, see Cohorts.restore_derived
+        """
+        pass
+
+    def _year_positions(self, years):
+        return searchsorted(self.years, years)
+
+    def new_type(self, name):
+        """
+        Creates a new empty column
+
+        Parameters
+        ----------
+        name : str
+               Name of the new empty column
+        """
+        if name not in self._types:
+            self[name] = NaN
+            self._types.append(name)
+        else:
+            raise Exception('%s already exists'% name)
+
+    def gen_grth(self, g):
+        self._growth_rate = g
+        self._factors['grth'] = factor_table.growth(g, self.shape[2], self._year_min)
+
+    def gen_dsct(self, r):
+        self._discount_rate = r
+        self._factors['dsct'] = factor_table.discount(r, self.shape[2], self._year_min)
+
+    def population_project(self, year_length=None, method=None, growth_rate=None):
+        """
+        Continuation of population to provide convergent present values
+
+        Parameters
+        ----------
+        year_length : int, default None
+                      Duration to continue the population projection
+        method : str, default None
+                 The value must be 'stable' or 'exp_growth'
+        growth_rate : float or year-indexed path (dict or Series), default None
+                      growth rate of the population with the 'exp_growth' method
+        """
+        if 'pop' not in self._data:
+            raise Exception('pop is not a column of cohort')
+        if year_length is None:
+            raise Exception('a duration in years should be provided')
+        if method is None:
+            raise Exception('a method should be specified')
+
+        first_year = self._year_min
+        last_year = self._year_max
+        if ( first_year + year_length ) > last_year:
+            new_last_year = first_year + year_length
+        else:
+            return
+
+        nb_added = new_last_year - last_year
+        if method == 'stable':
+            growth = ones(nb_added)
+        elif method == 'exp_growth':
+            if growth_rate is None:
+                raise Exception('a growth rate must be provided for the method')
+            growth = factor_table.growth(growth_rate, nb_added, last_year + 1)
+        else:
+            return
+
+        pop = self._data['pop']
+        nb_years = self.shape[2]
+        self.__init__(self.ages, self.sexes, arange(first_year, new_last_year + 1), dtype=self.dtype)
+        projected = empty(self.shape, dtype=self.dtype)
+        projected[:, :, :nb_years] = pop
+        projected[:, :, nb_years:] = pop[:, :, -1:]*growth
+        self._data['pop'] = projected
+        self._columns.append('pop')
+
+    def _fill(self, df, year=None):
+        """
+        Takes age, sex profile (per capita transfers) found in df
+        to fill year 'year' or all empty years if year is None
+        This is a private method.
+
+        Parameters
+        ----------
+        df : DataFrame
+             a dataframe containing the profiles
+        year : int, default None
+               if None fill all the years else only the given year
+        """
+        if not isinstance(df, DataFrame):
+            df = DataFrame(df)
+
+        index = df.index
+        age_pos = searchsorted(self.ages, index.get_level_values('age'))
+        sex_pos = searchsorted(self.sexes, index.get_level_values('sex'))
+        age_pos = age_pos.clip(0, self.shape[0] - 1)
+        sex_pos = sex_pos.clip(0, self.shape[1] - 1)
+        known = ((self.ages[age_pos] == index.get_level_values('age')) &
+                 (self.sexes[sex_pos] == index.get_level_values('sex')))
+        for typ in df.columns:
+            if typ in self._types:
+                raise Exception("column already exists")
+            self.new_type(typ)
+            values = asarray(df[typ], dtype=float)
+            filled = values == values
+            self._types_years[typ] = unique(asarray(index.get_level_values('year'))[filled])
+            keep = known & filled
+            if year is None:
+                # Kept as an (age, sex) array, broadcast along the years when read
+                profile = empty(self.shape[:2], dtype=self.dtype)
+                profile.fill(NaN)
+                profile[age_pos[keep], sex_pos[keep]] = values[keep]
+                profile.flags.writeable = False
+                del self._data[typ]
+                self._profiles[typ] = profile
+            else:
+                self.expand(typ)[age_pos[keep], sex_pos[keep], self._year_positions(year)] = values[keep]
+
+    def proj_tax(self, rate=None, inflation_rate=None, typ=None, method=None, payments_list=[]):
+        """
+        Projects taxes either per_capita or aggregate at the constant growth_rate rate or desynchronized.
+        See DataCohorts.proj_tax
+        """
+        if rate is None:
+            raise Exception('no growth_rate provided')
+        if inflation_rate is None:
+            self.proj_tax(rate, 0, typ, method)
+            return
+        if method is None or not method in ['aggregate', 'per_capita', 'desynchronized']:
+            raise Exception('a method should be specified')
+        if typ is None:
+            for typ in self._types:
+                self.proj_tax(rate, inflation_rate, typ, method)
+            return
+
+        self.gen_grth(rate)
+        if method == "per_capita":
+            self[typ] = self[typ]*self['grth']
+
+        if method == 'desynchronized':
+            for tax in typ:
+                self[tax] = self[tax]*self['grth']
+            inflation = factor_table.growth(inflation_rate, self.shape[2], self._year_min)
+            for payment in payments_list:
+                self[payment] = self[payment]*inflation
+
+        if method == "aggregate":
+            last_typ_year = max(self._types_years[typ])
+            pop = self._data['pop']
+            frozen_pop = pop[:, :, self._year_positions(last_typ_year)][:, :, newaxis]
+            self[typ] = self[typ]*self['grth']*frozen_pop/pop
+
+    def compute_net_transfers(self, name='net_transfers', taxes_list=[], payments_list=[], weights=None):
+        """
+        Creates a new column which combines the profiles.
+
+        Parameters
+        ----------
+        name : str (default net_transfers)
+            The name of the computed column
+        taxes_list : list
+            A list of the name of the columns containing all the taxes profiles
+        payments_list : list
+            A list of the names of the columns containing all the subsidies and payments profiles
+        weights : dict, default None
+            multipliers of some profiles (partial incidence, reform...), the others are counted fully
+        """
+        for typ in taxes_list + payments_list:
+            if typ not in self._types:
+                self._types.append(typ)
+        self.compute_aggregates({name: net_transfers_weights(taxes_list, payments_list, weights)})
+        if not self[name].any():
+            raise Exception('The computed column contains only zeros')
+
+    def compute_aggregates(self, aggregates):
+        """
+        Creates new columns which are weighted sums of the profiles, computed
+        in a single product of the (profiles x cells) block with the matrix of the weights.
+        See DataCohorts.compute_aggregates
+        """
+        names, columns, matrix = weights_matrix(aggregates)
+        block = empty((len(columns),) + self.shape, dtype=self.dtype)
+        for position, column in enumerate(columns):
+            block[position] = self[column]
+        combined = tensordot(matrix.T.astype(self.dtype), block, axes=1)
+        for position, name in enumerate(names):
+            # A column computed before is computed again
+            if name not in self._types:
+                self.new_type(name)
+            self[name] = combined[position]
+
+    def _present_value(self, typ, discount_rate, weighted):
+        if isinstance(typ, basestring):
+            typ = [typ]
+        for name in typ:
+            if name not in self._types:
+                raise Exception('cohort: variable %s is not in self._types' %name)
+        if discount_rate is None:
+            discount_rate = 0.0
+        self.gen_dsct(discount_rate)
+        # The present values are summed in double precision whatever the precision of the cube
+        flows = array([self[name] for name in typ], dtype=float)*self['dsct']
+        if weighted:
+            flows *= self['pop']
+        res = CohortsCube(self.ages, self.sexes, self.years)
+        for name, pv in zip(typ, generation_present_value(flows)):
+            res[name] = pv
+        res._types = list(typ)
+        return res
+
+    def aggregate_generation_present_value(self, typ, discount_rate=None):
+        """
+        Computes the present value of one or several columns for the whole generation
+
+        Parameters
+        ----------
+        typ : str or list of str
+              Name of the column(s) of the per capita profile of tax or transfer
+        discount_rate : float
+                        Rate used to calculate the present value
+        Returns
+        -------
+        res : a CohortsCube with column 'typ' containing the aggregate present value of typ
+        """
+        return self._present_value(typ, discount_rate, weighted=True)
+
+    def per_capita_generation_present_value(self, typ, discount_rate=None):
+        """
+        Returns present net value per capita of the data typ
+
+        Returns
+        -------
+        res : a CohortsCube with columns 'typ' and 'pop'
+        """
+        res = self._present_value(typ, discount_rate, weighted=True)
+        for name in res._types:
+            res[name] = res[name]/self['pop']
+        res['pop'] = self['pop']
+        return res
+
+    def generation_present_values(self, typ, discount_rate=None):
+        """
+        Returns the aggregate and the per capita present values computed with a single
+        backward recursion, see DataCohorts.generation_present_values
+
+        Returns
+        -------
+        aggregate_pv, percapita_pv : CohortsCubes with the columns typ and 'pop'
+        """
+        res = self._present_value(typ, discount_rate, weighted=True)
+        percapita = res.clone()
+        for name in res._types:
+            percapita[name] = res[name]/self['pop']
+        res['pop'] = self['pop']
+        percapita['pop'] = self['pop']
+        return res, percapita
+
+    def new_per_capita_generation_present_value(self, typ, discount_rate=None):
+        """
+        Returns present net value per capita of the data typ, discarding population changes
+        """
+        return self._present_value(typ, discount_rate, weighted=False)
+
+    def lifetime_accounts(self, typ, sex=None, discount_rate=None, base=None):
+        """
+        Returns the flows of every birth cohort by age, see AccountingCohorts.lifetime_accounts
+        """
+        values = asarray(self[typ], dtype=float)
+        if discount_rate is not None:
+            factors = factor_table.discount(discount_rate, self.shape[2], self._year_min)
+            if base is None:
+                base = self._year_min
+            if base != 'birth':
+                if base not in self.index_sets['year']:
+                    raise Exception('the base year should be one of the years')
+                factors = factors/factors[self._year_positions(base)]
+            values = values*factors
+        births, matrix = generation_matrix(values, self.ages, self.years)
+        if base == 'birth' and discount_rate is not None:
+            # The flows are discounted to the birth year, or to the first year for the generations born before
+            first = self._year_positions(births.clip(self._year_min, self._year_max))
+            matrix = matrix/factors[first][:, newaxis, newaxis]
+
+        if sex is not None:
+            return DataFrame(matrix[:, searchsorted(self.sexes, sex), :], columns=Index(self.ages, name='age'),
+                             index=Index(births, name='birth'))
+        index = MultiIndex.from_product([births, self.sexes], names=['birth', 'sex'])
+        return DataFrame(matrix.reshape(-1, len(self.ages)), columns=Index(self.ages, name='age'), index=index)
+
+    def compute_ipl(self, typ, net_gov_wealth=None, net_gov_spendings=None, precision=False):
+        """
+        Return a value of the intertemporal public liability.
+        The cube has to contain the aggregated present values of transfer
+        See AccountingCohorts.compute_ipl
+        """
+        if net_gov_wealth is None:
+            net_gov_wealth = 0
+        if net_gov_spendings is None:
+            net_gov_spendings = 0
+        return liability_from_terms(self.indicator_terms(typ), net_gov_wealth, net_gov_spendings, precision)
+
+    def indicator_terms(self, typ):
+        """
+        Returns the reductions of the column typ the indicators are computed from, see AccountingCohorts.indicator_terms
+        """
+        return indicator_terms(self[typ])
+
+
+if __name__ == '__main__':
+    pass
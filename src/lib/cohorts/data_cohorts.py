@@ -7,9 +7,11 @@ Created on 14 mai 2013
 '''
 from __future__ import division
 from pandas import DataFrame, read_csv, concat, ExcelFile, HDFStore
-from numpy import NaN, arange, hstack, array
+from numpy import NaN, arange, array, asarray, empty, dot
 from src.lib.cohorts.accounting_cohorts import AccountingCohorts
 from src.lib.cohorts.cohort import Cohorts
+from src.lib.cohorts.cube import CohortsCube, generation_present_value, net_transfers_weights, weights_matrix
+from src.lib.cohorts.factors import factor_table
 
 class DataCohorts(Cohorts):
     '''
@@ -67,32 +69,39 @@ class DataCohorts(Cohorts):
             else:
                 raise Exception("column already exists")
         
+        # The profiles are broadcast along the years by reading their (age, sex) table
+        # with the codes of the cohort index, without building a frame of the cohort size
+        index = self.index
+        age_level, sex_level, year_level = [index.names.index(name) for name in ['age', 'sex', 'year']]
+        age_pos = index.levels[age_level].get_indexer(df.index.get_level_values('age'))
+        sex_pos = index.levels[sex_level].get_indexer(df.index.get_level_values('sex'))
+        known = (age_pos >= 0) & (sex_pos >= 0)
         if year is None:
-            df_insert = df.reset_index(level='year', drop=True)
-            years = sorted(self.index_sets['year'])
-            list_df = [df_insert] * len(years)
-            df_tot = concat(list_df, keys = years, names =['year'])
-            df_tot = df_tot.reorder_levels(['age','sex','year'], axis=0)
-            
+            rows = slice(None)
         else:
-            yr = year
-            df_tot = None
-            df_insert = df.reset_index()
-            df_insert['year'] = yr
-            if df_tot is None:
-                df_tot = df_insert
+            rows = index.codes[year_level] == index.levels[year_level].get_loc(year)
+        age_codes = index.codes[age_level][rows]
+        sex_codes = index.codes[sex_level][rows]
+
+        for typ in df.columns:
+            values = asarray(df[typ], dtype=float)
+            keep = known & (values == values)
+            profile = empty((len(index.levels[age_level]), len(index.levels[sex_level])), dtype = self._precision())
+            profile.fill(NaN)
+            profile[age_pos[keep], sex_pos[keep]] = values[keep]
+            if year is None:
+                self[typ] = profile[age_codes, sex_codes]
             else:
-                df_tot.append(df_insert, ignore_index=True)
-                df_tot = df_tot.set_index(['age','sex','year'])
-        
-#         print df_tot
-#         print len(df_tot)
-        self.update(df_tot)
+                column = self[typ].values.copy()
+                column[rows] = profile[age_codes, sex_codes]
+                self[typ] = column
 
 
     def population_project(self, year_length = None, method = None, growth_rate = None):
         """
-        Continuation of population to provide convergent present values
+        Continuation of population to provide convergent present values.
+        The projected population is computed on the dense cube of the cohort
+        and the cohort is built once on the final horizon.
         
         Parameters
         ----------
@@ -100,6 +109,8 @@ class DataCohorts(Cohorts):
                       Duration to continue the population projection
         method : str, default None
                  The value must be 'stable' or 'exp_growth'  
+        growth_rate : float or year-indexed path (dict or Series), default None
+                      growth rate of the population with the 'exp_growth' method
         """
 
         if 'pop' not in self.columns:
@@ -108,45 +119,13 @@ class DataCohorts(Cohorts):
             raise Exception('a duration in years should be provided')
         if method is None:
             raise Exception('a method should be specified')
-        years = self.index_sets['year']
-        first_year = min(years)
-        last_year = max(years)
-        
-        if ( first_year + year_length ) > last_year:
-            new_last_year = first_year + year_length
-        else:
-            return
-
-        if method == 'stable':
-            last_pop = self.xs(last_year, level='year', axis=0)
-            pop = DataFrame(self['pop'])
-            years = range(last_year+1,new_last_year+1)
-            list_df = [last_pop] * len(years)
+        if method == 'exp_growth' and growth_rate is None:
+            raise Exception('a growth rate must be provided for the method')
 
-            pop = concat(list_df, keys = years, names =['year'])
-            pop = pop.reorder_levels(['age','sex','year'], axis=0)
-            combined = self.combine_first(pop)
-            self.__init__(data = combined, columns = ['pop'])
-            
-
-        if method == 'exp_growth':
-            if growth_rate is None:
-                    raise Exception('a growth rate must be provided for the method')
-            
-            last_pop = self.xs(last_year, level='year', axis=0)
-            pop = DataFrame(self['pop'])
-            years = range(last_year+1,new_last_year+1)
-            list_df = [last_pop] * len(years) 
-
-            pop = concat(list_df, keys = years, names =['year'])
-            pop = pop.reorder_levels(['age','sex','year'], axis=0)
-            pop = Cohorts(pop)
-            pop.gen_grth(growth_rate)
-            pop['pop'] *= pop['grth']
-            del pop['grth']
-            
-            combined = self.combine_first(pop)
-            self.__init__(data = combined, columns = ['pop'])
+        cube = self.to_cube(['pop'], copy = False)
+        cube.population_project(year_length, method = method, growth_rate = growth_rate)
+        if cube._year_max > self._year_max:
+            self.__init__(data = cube.to_frame(['pop']), columns = ['pop'])
 
 
     def proj_tax(self, rate = None , inflation_rate = None , typ = None, method = None, payments_list=[]):
@@ -191,15 +170,11 @@ class DataCohorts(Cohorts):
                 for tax in typ:
                     self[tax] *= self['grth']
                 
-                self['inflation'] = NaN
-                grouped = self.groupby(level = ['sex', 'age'])['inflation']
                 nb_years = len(self.index_sets['year'])
-                self['inflation'] = grouped.transform(lambda x: ((1+inflation_rate)**(arange(nb_years))))
-                
+                inflation = factor_table.growth(inflation_rate, nb_years, self._year_min).astype(self._precision())
+                inflation = self._broadcast_years(inflation)
                 for payment in payments_list:
-                    self[payment] *= self['inflation']
-                
-                del self['inflation']
+                    self[payment] *= inflation
                 
             if method == "aggregate":
                 typ_years = self._types_years[typ]
@@ -218,9 +193,9 @@ class DataCohorts(Cohorts):
 #             else:
 #                 raise NotImplementedError
 
-    def compute_net_transfers(self, name = 'net_transfers', taxes_list = [], payments_list = []):
+    def compute_net_transfers(self, name = 'net_transfers', taxes_list = [], payments_list = [], weights = None):
         """
-        Creates a new column total_payments in the DataCohorts which combines the profiles.
+        Creates a new column which combines the profiles.
         
         Parameters
         ----------
@@ -230,27 +205,36 @@ class DataCohorts(Cohorts):
             A list of the name of the columns containing all the taxes profiles
         payments_list : list
             A list of the names of the columns containing all the subsidies and payments profiles
+        weights : dict, default None
+            multipliers of some profiles (partial incidence, reform...), the others are counted fully
         """
-
-        self.new_type(name)
-        self['total_taxes'] = 0
-        self['total_payments'] = 0
-        for typ in taxes_list:
+        for typ in taxes_list + payments_list:
             if typ not in self._types:
                 self._nb_type += 1
                 self._types.append(typ)
-            self['total_taxes'] += hstack(self[typ])
-        
-        for typ in payments_list:
-                if typ not in self._types:
-                    self._nb_type += 1
-                    self._types.append(typ)
-                self['total_payments'] += hstack(self[typ])
-    
-        self[name] = self['total_taxes'] - self['total_payments']
-        if self[name].all() == 0:
+        self.compute_aggregates({name: net_transfers_weights(taxes_list, payments_list, weights)})
+        if not self[name].any():
             raise Exception('The computed column contains only zeros')
 
+    def compute_aggregates(self, aggregates):
+        """
+        Creates new columns which are weighted sums of the profiles, computed
+        in a single product of the (rows x profiles) block with the matrix of the weights
+        
+        Parameters
+        ----------
+        aggregates : dict
+            the weights of the profiles (a dict or a Series indexed by column) of each new column,
+            for instance {'net_transfers': {'tax': 1, 'sub': -1}, 'health': {'health_care': -1}}
+        """
+        names, columns, matrix = weights_matrix(aggregates)
+        combined = dot(self[columns].values, matrix.astype(self._precision()))
+        for position, name in enumerate(names):
+            # A column computed before is computed again
+            if name not in self._types:
+                self.new_type(name)
+            self[name] = combined[:, position]
+
          
     def aggregate_generation_present_value(self, typ, discount_rate=None):
         """
@@ -258,42 +242,42 @@ class DataCohorts(Cohorts):
         
         Parameters
         ----------
-        typ : str
-              Name of the column of the per capita profile of tax or transfer
+        typ : str or list of str
+              Name of the column of the per capita profile of tax or transfer.
+              A list of columns are all computed in the same pass
         discount_rate : float
                         Rate used to calculate the present value
         Returns
         -------
         res : an AccountingCohorts with column 'typ' containing the aggregat present value of typ 
         """
-        if typ not in self._types:
-            raise Exception('cohort: variable %s is not in self._types' %typ)
-            return
+        pv = self._generation_present_value(typ, discount_rate, weighted = True)
+        return pv.to_frame(cls = AccountingCohorts)
+
+    def _generation_present_value(self, typ, discount_rate = None, weighted = True):
+        """
+        Runs the backward generational recursion of one or several columns
+        on the dense cube of the cohort and returns a CohortsCube
+        """
+        if isinstance(typ, basestring):
+            typ = [typ]
+        for name in typ:
+            if name not in self._types:
+                raise Exception('cohort: variable %s is not in self._types' %name)
         if discount_rate is None:
             discount_rate = 0.0
         if 'dsct' not in self._types:
             self.gen_dsct(discount_rate)
-        tmp = self['dsct']*self[typ]*self['pop']
-        tmp = tmp.unstack(level = 'year')  # untack year indices to columns
-        
-        pvm = tmp.xs(0, level='sex')
-        pvf = tmp.xs(1, level='sex') #Assuming 1 is the index for females resp. 0 is male.
-        
-        yr_min = array(list(self.index_sets['year'])).min()
-        yr_max = array(list(self.index_sets['year'])).max()
-        
-        for yr in arange(yr_min, yr_max)[::-1]:
-            pvm[yr] += hstack( [ pvm[yr+1].values[1:], 0]  )
-            pvf[yr] += hstack( [ pvf[yr+1].values[1:], 0]  )
-            
-        pieces = [pvm, pvf]
-        res =  concat(pieces, keys = [0,1], names = ["sex"] )
-        res = res.stack()
-        res = res.reset_index()
-        res = res.set_index(['age', 'sex', 'year'])
-        res.columns = [typ]
-        res = DataFrame(res)
-        return AccountingCohorts(res)
+
+        cube = self.to_cube(typ + ['dsct', 'pop'], copy = False)
+        # The present values are summed in double precision whatever the precision of the cohort
+        flows = array([cube[name] for name in typ], dtype = float)*cube['dsct']
+        if weighted:
+            flows *= cube['pop']
+        res = CohortsCube(cube.ages, cube.sexes, cube.years)
+        for name, pv in zip(typ, generation_present_value(flows)):
+            res[name] = pv
+        return res
 
 
     def per_capita_generation_present_value(self, typ, discount_rate = None):
@@ -302,8 +286,8 @@ class DataCohorts(Cohorts):
         
         Parameters
         ----------
-        typ : str
-              Column name
+        typ : str or list of str
+              Column name(s)
         discount_rate : float
         
         Returns
@@ -311,15 +295,43 @@ class DataCohorts(Cohorts):
         pv_percapita : an AccountingCohorts with column 'typ' containing the per capita present value of typ 
         
         """
+        pv = self._generation_present_value(typ, discount_rate, weighted = True)
+        return self._per_capita(pv).to_frame(cls = AccountingCohorts)
+
+    def generation_present_values(self, typ, discount_rate = None):
+        """
+        Computes the aggregate and the per capita present values of one or several columns
+        with a single backward recursion, the per capita values being the aggregate ones
+        divided by the population
+        
+        Parameters
+        ----------
+        typ : str or list of str
+              Column name(s), for instance all the profiles and the net transfers
+        discount_rate : float
+        
+        Returns
+        -------
+        aggregate_pv, percapita_pv : AccountingCohorts with the columns typ and 'pop'
+        """
+        pv = self._generation_present_value(typ, discount_rate, weighted = True)
+        percapita = self._per_capita(pv)
+        columns = pv.columns
+        pv['pop'] = percapita['pop']
+        return (pv.to_frame(columns + ['pop'], cls = AccountingCohorts),
+                percapita.to_frame(cls = AccountingCohorts))
 
-        if typ not in self._types:
-            raise Exception('cohort: variable %s is not in self._types' %typ)
-        pv_gen = self.aggregate_generation_present_value(typ, discount_rate)
-        pop = DataFrame({'pop' : self['pop']})
-        pv_percapita = DataFrame(pv_gen[typ]/pop['pop'])
-        pv_percapita['pop'] = pop['pop']
-        pv_percapita.columns = [typ, 'pop']
-        return AccountingCohorts(pv_percapita)
+    def _per_capita(self, pv):
+        """
+        Returns a CohortsCube holding the present values of the CohortsCube pv divided by the population
+        and the population
+        """
+        pop = self.to_cube(['pop'], copy = False)['pop']
+        res = CohortsCube(pv.ages, pv.sexes, pv.years)
+        for name in pv.columns:
+            res[name] = pv[name]/pop
+        res['pop'] = pop
+        return res
     
     def new_per_capita_generation_present_value(self, typ, discount_rate = None):
         """
@@ -327,8 +339,8 @@ class DataCohorts(Cohorts):
         
         Parameters
         ----------
-        typ : str
-              Column name
+        typ : str or list of str
+              Column name(s)
         discount_rate : float
         
         Returns
@@ -336,34 +348,8 @@ class DataCohorts(Cohorts):
         pv_percapita : an AccountingCohorts with column 'typ' containing the per capita present value of typ 
         
         """
-        if typ not in self._types:
-            raise Exception('cohort: variable %s is not in self._types' %typ)
-            return
-        if discount_rate is None:
-            discount_rate = 0.0
-        if 'dsct' not in self._types:
-            self.gen_dsct(discount_rate)
-        tmp = self['dsct']*self[typ]
-        tmp = tmp.unstack(level = 'year')  # untack year indices to columns
-        
-        pvm = tmp.xs(0, level='sex')
-        pvf = tmp.xs(1, level='sex') #Assuming 1 is the index for females resp. 0 is male.
-        
-        yr_min = array(list(self.index_sets['year'])).min()
-        yr_max = array(list(self.index_sets['year'])).max()
-        
-        for yr in arange(yr_min, yr_max)[::-1]:
-            pvm[yr] += hstack( [ pvm[yr+1].values[1:], 0]  )
-            pvf[yr] += hstack( [ pvf[yr+1].values[1:], 0]  )
-            
-        pieces = [pvm, pvf]
-        res =  concat(pieces, keys = [0,1], names = ["sex"] )
-        res = res.stack()
-        res = res.reset_index()
-        res = res.set_index(['age', 'sex', 'year'])
-        res.columns = [typ]
-        res = DataFrame(res)
-        return AccountingCohorts(res)
+        pv = self._generation_present_value(typ, discount_rate, weighted = False)
+        return pv.to_frame(cls = AccountingCohorts)
     
     def get_average_difference(self, consumption=[], income=[], year=None):
         """
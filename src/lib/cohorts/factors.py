@@ -0,0 +1,152 @@
+# -*- coding:utf-8 -*-
+# Copyright © 2012 Clément Schaff, Mahdi Ben Jelloul
+'''
+Created on 18 oct. 2013
+
+@author: Mahdi Ben Jelloul, Jérôme Santoul
+'''
+from __future__ import division
+from numpy import arange, asarray, isscalar, ones, cumprod, cumsum
+from pandas import Series
+
+
+def is_path(rate):
+    """
+    Returns True if rate is a year-indexed path of rates rather than a single rate
+    """
+    return not isscalar(rate)
+
+
+def yearly_rates(rate, year_min, nb_years):
+    """
+    Returns the rates of the years year_min, ..., year_min + nb_years - 1
+
+    Parameters
+    ----------
+    rate : float or year-indexed path (dict or Series)
+           A path gives the rate from each of its years on, until the next one.
+           The first rate of the path also applies to the years before it
+    year_min : int
+               first year
+    nb_years : int
+               the horizon
+    """
+    if not is_path(rate):
+        return rate*ones(nb_years)
+    if year_min is None:
+        raise Exception('a first year is needed to use a path of rates')
+    path = Series(rate).sort_index()
+    positions = path.index.values.searchsorted(arange(year_min, year_min + nb_years), side = 'right') - 1
+    return asarray(path.values, dtype = float)[positions.clip(0, len(path) - 1)]
+
+
+def rate_key(rate):
+    """
+    Returns a hashable key identifying a rate or a path of rates
+    """
+    if not is_path(rate):
+        return rate
+    path = Series(rate).sort_index()
+    return tuple(zip(path.index, path.values))
+
+
+class FactorTable(object):
+    """
+    Cache of growth, discount and actualization factor vectors.
+    Each vector is computed once per (rate, horizon) and is meant to be broadcast
+    along the year axis of the cohorts. Vectors are read-only since they are shared.
+    """
+    def __init__(self, max_size = 1000):
+        super(FactorTable, self).__init__()
+        self.max_size = max_size
+        self._factors = dict()
+
+    def clear(self):
+        self._factors.clear()
+
+    def _get(self, key, compute):
+        if key not in self._factors:
+            if len(self._factors) >= self.max_size:
+                self.clear()
+            factors = compute()
+            factors.flags.writeable = False
+            self._factors[key] = factors
+        return self._factors[key]
+
+    def growth(self, rate, nb_years, year_min = None):
+        """
+        Returns the vector (1+rate)**t for t in 0, ..., nb_years-1
+        or the cumulated product of (1+rate) when rate is a year-indexed path
+
+        Parameters
+        ----------
+        rate : float or year-indexed path (dict or Series)
+               growth rate (of the economy, of prices or of the population)
+        nb_years : int
+                   the horizon
+        year_min : int, default None
+                   first year of the horizon, needed when rate is a path
+        """
+        if not is_path(rate):
+            return self._get(('growth', rate, nb_years),
+                             lambda: (1+rate)**arange(nb_years))
+        return self._get(('growth', rate_key(rate), nb_years, year_min),
+                         lambda: self._cumulate(1 + yearly_rates(rate, year_min, nb_years)))
+
+    def discount(self, rate, nb_years, year_min = None):
+        """
+        Returns the vector 1/(1+rate)**t for t in 0, ..., nb_years-1
+        or its cumulated counterpart when rate is a year-indexed path
+        """
+        if not is_path(rate):
+            return self._get(('discount', rate, nb_years),
+                             lambda: 1/((1+rate)**arange(nb_years)))
+        return self._get(('discount', rate_key(rate), nb_years, year_min),
+                         lambda: self._cumulate(1/(1 + yearly_rates(rate, year_min, nb_years))))
+
+    def actualization(self, growth_rate, discount_rate, nb_years, year_min = None):
+        """
+        Returns the vector (1+growth_rate)/(1+discount_rate)**t for t in 0, ..., nb_years-1,
+        the actualization gen_actualization and the generational imbalance have always used,
+        or its counterpart when one of the rates is a year-indexed path, the growth factor
+        being the one of the first year
+        """
+        if not (is_path(growth_rate) or is_path(discount_rate)):
+            year_min = None
+        return self._get(('actualization', rate_key(growth_rate), rate_key(discount_rate), nb_years, year_min),
+                         lambda: ((1 + yearly_rates(growth_rate, year_min, 1)[0])*
+                                  self.discount(discount_rate, nb_years, year_min)))
+
+    def log_derivative(self, rate, nb_years, year_min = None):
+        """
+        Returns the derivative of the logarithm of the growth factors with respect to the rate,
+        t/(1+rate) for t in 0, ..., nb_years-1. When rate is a year-indexed path, the derivative
+        is taken with respect to a uniform shift of the rates of the path.
+        The derivative of the logarithm of the discount factors is its opposite.
+        """
+        if not is_path(rate):
+            return self._get(('log_derivative', rate, nb_years),
+                             lambda: arange(nb_years)/(1+rate))
+
+        def compute():
+            yearly = 1/(1 + yearly_rates(rate, year_min, nb_years))
+            if len(yearly):
+                yearly[0] = 0
+            return cumsum(yearly)
+        return self._get(('log_derivative', rate_key(rate), nb_years, year_min), compute)
+
+    def _cumulate(self, yearly_factors):
+        """
+        Cumulates yearly factors from the first year, whose factor is 1
+        """
+        if len(yearly_factors):
+            yearly_factors[0] = 1
+        return cumprod(yearly_factors)
+
+
+# Table shared by every cohort, in particular by the default and alternative ones of a simulation
+factor_table = FactorTable()
+
+
+if __name__ == '__main__':
+    pass
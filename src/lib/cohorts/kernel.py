@@ -0,0 +1,111 @@
+# -*- coding:utf-8 -*-
+# Copyright © 2012 Clément Schaff, Mahdi Ben Jelloul
+'''
+Created on 18 oct. 2013
+
+@author: Mahdi Ben Jelloul, Jérôme Santoul
+'''
+from __future__ import division
+from pandas import DataFrame
+from numpy import arange, asarray, ones, zeros, newaxis, tensordot
+
+
+class ResponseKernel(object):
+    """
+    Linear response of the intertemporal public liability and of the generational accounts
+    to every (age, sex, year) cell of a projected per capita profile.
+    Since the present values are linear in the profiles, a reform is scored by a dot product
+    of its change of the profile with the kernel.
+    """
+    def __init__(self, pop, dsct, year_min):
+        """
+        Parameters
+        ----------
+        pop : ndarray
+              (age, sex, year) projected population
+        dsct : ndarray
+               discount factors of the years
+        year_min : int
+                   first year of the projection
+        """
+        super(ResponseKernel, self).__init__()
+        pop = asarray(pop, dtype=float)
+        nb_ages, nb_sexes, nb_years = pop.shape
+        self.shape = pop.shape
+        self.year_min = year_min
+        self.pop = pop
+
+        # Aggregate present value of a unit of profile in each cell
+        self.weights = pop*asarray(dsct)[newaxis, newaxis, :]
+
+        # Birth cohort of each cell, the first one being born nb_ages-1 years before year_min
+        ages = arange(nb_ages)[:, newaxis]
+        self._diagonals = arange(nb_years)[newaxis, :] - ages + nb_ages - 1
+        self.birth_years = year_min - nb_ages + 1 + arange(nb_years + nb_ages - 1)
+
+        # The IPL counts every cell once with a minus sign, the newborns of the first year
+        # of the second sex being counted twice as in compute_ipl
+        multiplicity = ones(self.shape)
+        diagonal = arange(min(nb_ages, nb_years))
+        multiplicity[diagonal, 1:, diagonal] = 2
+        self.ipl = -self.weights*multiplicity
+
+        # Population of each generation on its first cell of the projection
+        first_pop = zeros((nb_sexes, nb_years + nb_ages - 1))
+        first_pop[:, :nb_ages] = pop[::-1, :, 0].T
+        first_pop[:, nb_ages - 1:] = pop[0, :, :]
+        self.generation_pop = first_pop
+
+    def _generations_sum(self, values):
+        """
+        Sums (..., age, sex, year) values along each birth cohort, returns (..., sex, birth year)
+        """
+        planes = values.swapaxes(-3, -2)   # (..., sex, age, year)
+        ages = arange(self.shape[0])[:, newaxis]
+        sheared = zeros(planes.shape[:-1] + (self.shape[2] + self.shape[0] - 1,))
+        sheared[..., ages, self._diagonals] = planes
+        return sheared.sum(axis=-2)
+
+    def score_ipl(self, delta):
+        """
+        Returns the change of the intertemporal public liability
+
+        Parameters
+        ----------
+        delta : ndarray
+                change of the projected per capita net transfers, the last three axes
+                being age, sex and year. Leading axes (several reforms) are kept
+        """
+        return tensordot(asarray(delta, dtype=float), self.ipl, axes=3)
+
+    def score_accounts(self, delta, per_capita=True):
+        """
+        Returns the change of the generational accounts, valued on the first year
+        of each generation in the projection
+
+        Parameters
+        ----------
+        delta : ndarray
+                change of the projected per capita net transfers, the last three axes
+                being age, sex and year. Leading axes (several reforms) are kept
+        per_capita : bool, default True
+                     if False returns the change of the aggregate accounts
+
+        Returns
+        -------
+        accounts : ndarray (..., sex, birth year), the birth years being given by birth_years
+        """
+        accounts = self._generations_sum(asarray(delta, dtype=float)*self.weights)
+        if per_capita:
+            accounts /= self.generation_pop
+        return accounts
+
+    def accounts_frame(self, accounts):
+        """
+        Returns a DataFrame of (sex, birth year) accounts indexed by birth year with a column by sex
+        """
+        return DataFrame(asarray(accounts).T, index=self.birth_years)
+
+
+if __name__ == '__main__':
+    pass
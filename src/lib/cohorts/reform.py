@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+# Copyright © 2012 Clément Schaff, Mahdi Ben Jelloul
+'''
+Created on 18 oct. 2013
+
+@author: Mahdi Ben Jelloul, Jérôme Santoul
+'''
+from __future__ import division
+from numpy import asarray, in1d, ones, newaxis, where
+from src.lib.cohorts.cube import CohortsCube
+
+
+def _selected(values, bounds):
+    """
+    Returns the boolean mask of the values selected by bounds
+
+    Parameters
+    ----------
+    values : ndarray
+    bounds : None (all the values), a value, a (first, last) tuple of included bounds,
+             either of them being None for an open range, or a list of values
+    """
+    values = asarray(values)
+    if bounds is None:
+        return ones(values.shape, dtype=bool)
+    if isinstance(bounds, tuple):
+        first, last = bounds
+        mask = ones(values.shape, dtype=bool)
+        if first is not None:
+            mask &= values >= first
+        if last is not None:
+            mask &= values <= last
+        return mask
+    if isinstance(bounds, list):
+        return in1d(values, bounds)
+    return values == bounds
+
+
+class Reform(object):
+    """
+    A change of a projected profile on ranges of ages, sexes and years, multiplying
+    the profile by factor then adding shift, for instance halving the pensions from 2015 on:
+    Reform('retraite', years=(2015, None), factor=0.5)
+    """
+    def __init__(self, column, ages=None, sexes=None, years=None, factor=1, shift=0):
+        """
+        Parameters
+        ----------
+        column : str
+                 the profile changed by the reform
+        ages, sexes, years : default None (all)
+                             a value, a (first, last) tuple of included bounds, either of them
+                             being None for an open range, or a list of values
+        factor : float, default 1
+                 multiplicative change
+        shift : float, default 0
+                additive change of the per capita profile
+        """
+        super(Reform, self).__init__()
+        self.column = column
+        self.ages = ages
+        self.sexes = sexes
+        self.years = years
+        self.factor = factor
+        self.shift = shift
+
+    def mask(self, ages, sexes, years):
+        """
+        Returns the (age, sex, year) boolean mask of the cells changed by the reform,
+        the outer product of the masks of the axes
+        """
+        return (_selected(ages, self.ages)[:, newaxis, newaxis] &
+                _selected(sexes, self.sexes)[newaxis, :, newaxis] &
+                _selected(years, self.years)[newaxis, newaxis, :])
+
+    def change(self, values, ages, sexes, years):
+        """
+        Returns the change of the (age, sex, year) array values of the profile, zero outside the reform
+        """
+        return where(self.mask(ages, sexes, years), values*(self.factor - 1) + self.shift, 0)
+
+    def apply(self, cohorts):
+        """
+        Changes the profile of cohorts (DataCohorts or CohortsCube) in place
+        """
+        if isinstance(cohorts, CohortsCube):
+            values = cohorts.expand(self.column)
+            values += self.change(values, cohorts.ages, cohorts.sexes, cohorts.years)
+            return
+        index = cohorts.index
+        rows = (_selected(index.get_level_values('age'), self.ages) &
+                _selected(index.get_level_values('sex'), self.sexes) &
+                _selected(index.get_level_values('year'), self.years))
+        values = cohorts[self.column].values.copy()
+        values[rows] = values[rows]*self.factor + self.shift
+        cohorts[self.column] = values
+
+
+if __name__ == '__main__':
+    pass
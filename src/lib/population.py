@@ -0,0 +1,137 @@
+# -*- coding:utf-8 -*-
+# Copyright © 2012 Clément Schaff, Mahdi Ben Jelloul
+'''
+Created on 18 oct. 2013
+
+@author: M Benjelloul, J Santoul
+'''
+from __future__ import division
+import os
+from pandas import HDFStore
+from numpy import NaN, arange, asarray, empty, unique, searchsorted, hstack
+
+from cohorts.cube import CohortsCube
+
+
+# Repositories already read, by file, modification time and prefix
+_repositories = dict()
+
+
+def population_repository(filename, prefix = 'projpop0760_'):
+    """
+    Returns the PopulationRepository of an HDF5 file, reading the file only the first time
+    or when it has been modified since
+
+    Parameters
+    ----------
+    filename : str
+               complete path to the hdf5 file
+    prefix : str, default 'projpop0760_'
+             the prefix of the names of the tables to load, all the tables if None
+    """
+    key = (os.path.abspath(filename), os.path.getmtime(filename), prefix)
+    if key not in _repositories:
+        for previous in [previous for previous in _repositories if previous[0] == key[0]]:
+            del _repositories[previous]
+        _repositories[key] = PopulationRepository.from_hdf(filename, prefix = prefix)
+    return _repositories[key]
+
+
+class PopulationRepository(object):
+    """
+    Population scenarios (for instance the INSEE projections of proj_pop.h5) read once
+    and stacked in a single (scenario, age, sex, year) array.
+    The scenarios are then served as slices of the array, or as copies of their tables.
+    """
+    def __init__(self, tables):
+        """
+        Parameters
+        ----------
+        tables : dict
+                 the population DataFrames indexed by age, sex and year with a 'pop' column,
+                 by scenario name
+        """
+        super(PopulationRepository, self).__init__()
+        self.scenarios = sorted(tables)
+        self._tables = dict(tables)
+        self._positions = dict((name, position) for position, name in enumerate(self.scenarios))
+
+        cubes = [CohortsCube.from_frame(tables[name], columns = ['pop']) for name in self.scenarios]
+        if cubes:
+            self.ages = unique(hstack([cube.ages for cube in cubes]))
+            self.sexes = unique(hstack([cube.sexes for cube in cubes]))
+            years = hstack([cube.years for cube in cubes])
+            self.years = arange(years.min(), years.max() + 1)
+        else:
+            self.ages, self.sexes, self.years = [asarray([], dtype = int)]*3
+
+        # Missing cells, when the scenarios do not have the same ages or years, are NaN
+        self.values = empty((len(cubes), len(self.ages), len(self.sexes), len(self.years)))
+        self.values.fill(NaN)
+        for position, cube in enumerate(cubes):
+            cells = [searchsorted(axis, values)
+                     for axis, values in zip([self.ages, self.sexes, self.years], [cube.ages, cube.sexes, cube.years])]
+            self.values[position][cells[0][:, None, None], cells[1][None, :, None], cells[2][None, None, :]] = cube['pop']
+        self.values.flags.writeable = False
+
+    @classmethod
+    def from_hdf(cls, filename, prefix = 'projpop0760_'):
+        """
+        Reads the tables of an HDF5 file in a single opening of the store
+
+        Parameters
+        ----------
+        filename : str
+                   complete path to the hdf5 file
+        prefix : str, default 'projpop0760_'
+                 the prefix of the names of the tables to load, all the tables if None.
+                 The other tables are only listed by choices
+        """
+        store = HDFStore(filename, 'r')
+        try:
+            keys = store.keys()
+            tables = dict((key.lstrip('/'), store[key]) for key in keys
+                          if prefix is None or key.lstrip('/').startswith(prefix))
+        finally:
+            store.close()
+        repository = cls(tables)
+        repository.keys = keys
+        return repository
+
+    def choices(self):
+        """
+        Returns the names of the tables of the file, as HDFStore.keys does
+        """
+        return list(getattr(self, 'keys', ['/' + name for name in self.scenarios]))
+
+    def loaded(self, scenario):
+        """
+        Returns True if the scenario is in the repository
+        """
+        return scenario.lstrip('/') in self._positions
+
+    def position(self, scenario):
+        """
+        Returns the position of a scenario along the first axis of values
+        """
+        name = scenario.lstrip('/')
+        if not self.loaded(name):
+            raise Exception('%s is not a loaded population scenario' % scenario)
+        return self._positions[name]
+
+    def cube(self, scenario):
+        """
+        Returns the read-only (age, sex, year) array of the population of a scenario
+        """
+        return self.values[self.position(scenario)]
+
+    def frame(self, scenario):
+        """
+        Returns a copy of the population table of a scenario, as read from the file,
+        which can be modified without changing the repository
+        """
+        return self._tables[self.scenarios[self.position(scenario)]].copy()
+
+
+if __name__ == '__main__':
+    pass
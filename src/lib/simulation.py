@@ -6,10 +6,51 @@ Created on 20 mars 2013
 @author: M Benjelloul, J Santoul
 '''
 from __future__ import division
-from pandas import HDFStore
+from pandas import HDFStore, DataFrame, Series, MultiIndex, concat
 from pandas.io.parsers import ExcelFile
+from numpy import arange, array, empty, ones, zeros, hstack, nanmax
+from copy import copy
 
 from cohorts.data_cohorts import DataCohorts
+from cohorts.accounting_cohorts import AccountingCohorts
+from cohorts.cube import (CohortsCube, generation_present_value, truncated_present_value,
+                          geometric_tail, add_tail, net_transfers_weights, intertemporal_public_liability,
+                          extension_contribution, generational_imbalance, liability_from_terms)
+from cohorts.factors import factor_table, rate_key, yearly_rates
+from cohorts.kernel import ResponseKernel
+from population import population_repository
+
+
+# Stages of the simulation, a stage is recomputed when the parameters it depends on change
+# and the computation of a stage invalidates all the following ones
+STAGES = ['population', 'profiles', 'taxes', 'net_transfers', 'present_values', 'indicators']
+
+# Stages whose results are never modified in place, so that the default and alternative
+# hypotheses sets share them when their parameters are the same
+SHARED_STAGES = ['population', 'profiles', 'taxes']
+
+
+def stage_key(*values):
+    """
+    Returns a hashable key of the parameters a stage depends on.
+    DataFrames and cohorts are identified by their id and, for the cohorts, by the number of
+    their edits in place (see Cohorts.version). Lists, dicts and rate paths are identified by their content.
+    The DataFrames of the population and of the profiles are not versioned: they are set again
+    with set_population and set_profiles after an edit in place
+    """
+    key = []
+    for value in values:
+        if isinstance(value, (DataFrame, CohortsCube)):
+            key.append((id(value), getattr(value, 'version', None)))
+        elif isinstance(value, Series):
+            key.append(rate_key(value))
+        elif isinstance(value, dict):
+            key.append(tuple(sorted((name, stage_key(item)) for name, item in value.iteritems())))
+        elif isinstance(value, (list, tuple)):
+            key.append(stage_key(*value))
+        else:
+            key.append(value)
+    return tuple(key)
 
 
 class Simulation(object):
@@ -23,6 +64,10 @@ class Simulation(object):
         self.population_projection = None
         self.tax_projection = None
         self.year_length = 0
+        self.storage = 'frame'
+        self.precision = 'float64'
+        self.tail = False
+        self.memory_budget = None
 
         # Base hypothesis set :
         self.population = None
@@ -31,9 +76,11 @@ class Simulation(object):
         self.discount_rate = None
         self.country = None
         self.net_gov_spendings = 0
+        self.year_gov_spendings = None # Spendings of the reference year when the present value is computed
         self.cohorts = None #A DataCohorts object
         self.aggregate_pv = None #An AccountingCohorts object
         self.percapita_pv = None #An AccountingCohorts object
+        self.unborn_pv = dict() #Present values of the generations born after the horizon when the tail is added
         self.net_gov_wealth = 0
        
         # Duplicated attributes to compute elasticities (alt stands for alternate):
@@ -41,11 +88,17 @@ class Simulation(object):
         self.growth_rate_alt = None
         self.discount_rate_alt = None
         self.net_gov_spendings_alt = 0
+        self.year_gov_spendings_alt = None
         self.population_growth_rate_alt = None
         self.net_gov_wealth_alt = 0
         self.cohorts_alt = None #A DataCohorts object
         self.aggregate_pv_alt = None #An AccountingCohorts object
         self.percapita_pv_alt = None #An AccountingCohorts object        
+        self.unborn_pv_alt = dict()
+
+        # Cached results of the stages for the default and alternative hypotheses sets
+        self._stages = {True: dict(), False: dict()}
+        self._kernels = dict()
 
         
 #===============================================================================
@@ -65,10 +118,11 @@ class Simulation(object):
         
         
     def get_population_choices(self, filename):
-        store_pop = HDFStore(filename,'r')
-        choices = store_pop.keys()
-        store_pop.close()
-        return choices
+        """
+        Returns the names of the tables of a population hdf5 file, the file is read once
+        for all the simulations
+        """
+        return population_repository(filename).choices()
         
     def set_population(self, dataframe, default=True):
         """
@@ -84,6 +138,7 @@ class Simulation(object):
             self.population = dataframe
         else:
             self.population_alt = dataframe 
+        self.invalidate('population', default)
         
     
     def load_population(self, population_filename, population_scenario, default=True):
@@ -98,11 +153,18 @@ class Simulation(object):
                    
         popualtion_scenario : str
                           name of the table in the hdf5 file
+        
+        The INSEE scenarios (projpop0760_ tables) are read all at once the first time and
+        then served from the repository, each load getting its own copy of the table
         """
-        store_pop = HDFStore(population_filename,'r')
-        dataframe = store_pop[population_scenario]
+        repository = population_repository(population_filename)
+        if repository.loaded(population_scenario):
+            dataframe = repository.frame(population_scenario)
+        else:
+            store_pop = HDFStore(population_filename,'r')
+            dataframe = store_pop[population_scenario]
+            store_pop.close()
         self.set_population(dataframe, default=default)
-        store_pop.close()
 
 
     def set_profiles(self, dataframe):
@@ -114,6 +176,8 @@ class Simulation(object):
         
         """
         self.profiles = dataframe
+        self.invalidate('profiles')
+        self.invalidate('profiles', default=False)
     
     def set_gov_spendings(self, G, default=True, compute=False):
         """
@@ -133,22 +197,31 @@ class Simulation(object):
         if default:
             g = self.growth_rate
             r = self.discount_rate
+            population = self.population
         else:
             g = self.growth_rate_alt
             r = self.discount_rate_alt
+            population = self.population_alt
             
+        year_gov_spendings = None
         if compute:
-            net_gov_spendings = 0
-            for t in range(1, self.year_length+1):
-                year_gov_spending = G*((1+g)/(1+r))**t
-                net_gov_spendings += year_gov_spending
+            year_gov_spendings = G
+            year_min = None
+            if population is not None:
+                year_min = population.index.get_level_values('year').min()
+            actualization = (factor_table.growth(g, self.year_length + 1, year_min)*
+                             factor_table.discount(r, self.year_length + 1, year_min))
+            net_gov_spendings = G*actualization[1:].sum()
         else:
             net_gov_spendings = G
         
         if default:
             self.net_gov_spendings = net_gov_spendings
+            self.year_gov_spendings = year_gov_spendings
         else:
             self.net_gov_spendings_alt = net_gov_spendings
+            self.year_gov_spendings_alt = year_gov_spendings
+        self.invalidate('indicators', default)
     
     def set_gov_wealth(self, W, default=True):
         """
@@ -161,6 +234,7 @@ class Simulation(object):
             self.net_gov_wealth = W
         else:
             self.net_gov_wealth_alt = W
+        self.invalidate('indicators', default)
             
         
     def set_year_length(self, nb_year = 300):
@@ -169,6 +243,125 @@ class Simulation(object):
         """
         self.year_length = nb_year
 
+    def set_storage(self, storage = 'frame'):
+        """
+        Set the storage used for cohorts and present values
+        
+        Parameters
+        ----------
+        
+        storage : str, default 'frame'
+                  'frame' stores cohorts as (age, sex, year) MultiIndex DataFrames,
+                  'cube' stores every column as a dense (age, sex, year) array,
+                  DataFrames are then only built on demand with to_frame
+        """
+        if storage not in ['frame', 'cube']:
+            raise Exception("storage should be 'frame' or 'cube'")
+        self.storage = storage
+        self.invalidate('population')
+        self.invalidate('population', default=False)
+
+    def set_precision(self, precision = 'float64'):
+        """
+        Set the precision of the population, the profiles and the factors of the cohorts
+        
+        Parameters
+        ----------
+        
+        precision : str, default 'float64'
+                    'float32' halves the memory used by the cohorts and the bandwidth of their products.
+                    The present values, the Intertemporal Public Liability and the other indicators
+                    are summed in double precision, compute_precision_drift measures the difference
+        """
+        if precision not in ['float32', 'float64']:
+            raise Exception("precision should be 'float32' or 'float64'")
+        self.precision = precision
+        self.invalidate('population')
+        self.invalidate('population', default=False)
+
+    def set_memory_budget(self, budget = None):
+        """
+        Set the memory budget of the cohorts held by the simulation
+        
+        Parameters
+        ----------
+        
+        budget : int, default None
+                 number of bytes. When the cohorts and the present values of both hypotheses sets
+                 and the cached stages use more, their derived columns (growth and discount factors,
+                 scratch columns) are evicted, they are computed again when read
+        """
+        self.memory_budget = budget
+        self._apply_memory_budget()
+
+    def _held_cohorts(self):
+        """
+        Returns the names and the cohorts held by the simulation, the cached stages first
+        """
+        held = list()
+        for default, suffix in [(True, ''), (False, '_alt')]:
+            for stage in STAGES:
+                result = self._stages[default].get(stage, (None, None))[1]
+                if hasattr(result, 'memory_report'):
+                    held.append((stage + suffix, result))
+        for name in ['cohorts', 'aggregate_pv', 'percapita_pv']:
+            for suffix in ['', '_alt']:
+                cohorts = getattr(self, name + suffix)
+                if cohorts is not None and all(cohorts is not other for _, other in held):
+                    held.append((name + suffix, cohorts))
+        return held
+
+    def memory_report(self):
+        """
+        Returns the memory footprint of each column of the cohorts held by the simulation
+        
+        Returns
+        -------
+        report : DataFrame indexed by (cohorts, column) with the number of 'bytes' and a 'derived' flag
+        """
+        names, reports = list(), list()
+        # The arrays shared by several cohorts are only counted once
+        counted = set()
+        for name, cohorts in self._held_cohorts():
+            names.append(name)
+            reports.append(cohorts.memory_report(counted))
+        if not reports:
+            return DataFrame(columns = ['bytes', 'derived'])
+        return concat(reports, keys = names, names = ['cohorts', 'column'])
+
+    def _apply_memory_budget(self):
+        """
+        Evicts the derived columns of the held cohorts, the cached stages first,
+        until they use less than the memory budget
+        """
+        if self.memory_budget is None:
+            return
+        excess = self.memory_report()['bytes'].sum() - self.memory_budget
+        for _, cohorts in self._held_cohorts():
+            if excess <= 0:
+                break
+            size = cohorts.memory_report()['bytes'].sum()
+            excess -= size - cohorts.evict_derived(max(size - excess, 0))
+
+    def set_tail(self, tail = False):
+        """
+        Set wether the present values include the tail beyond the last projected year
+        
+        Parameters
+        ----------
+        
+        tail : bool, default False
+               if True the population and the profiles are continued after the horizon as
+               the 'stable' or 'exp_growth' population projection and the tax projection would do.
+               The discounted flows are then geometric and the tail is added in closed form
+               to the generational accounts and to the Intertemporal Public Liability,
+               so that a short horizon gives the result of an infinite one.
+               The rates of year-indexed paths are those of the second year after the horizon from then on
+        """
+        self.tail = tail
+        self.invalidate('present_values')
+        self.invalidate('present_values', default=False)
+
     def set_discount_rate(self, r=0, default=True):
         """
         Set discount rate
@@ -176,8 +369,8 @@ class Simulation(object):
         Parameters
         ----------
         
-        r : float, default set to 0
-            The discount rate
+        r : float or year-indexed path (dict or Series), default set to 0
+            The discount rate. A path gives the rate from each of its years on
         default : True or False
                   indicates wether this is the discount rate for the default hypotheses set or 
                   alternate one
@@ -187,6 +380,7 @@ class Simulation(object):
             self.discount_rate = r
         else:
             self.discount_rate_alt = r
+        self.invalidate('present_values', default)
         
         
     def set_growth_rate(self, g=0, default=True):
@@ -196,8 +390,8 @@ class Simulation(object):
         Parameters
         ----------
         
-        g : float, default set to 0
-            The growth rate
+        g : float or year-indexed path (dict or Series), default set to 0
+            The growth rate. A path gives the rate from each of its years on
         default : True or False
                   indicates wether this is the growth rate for the default hypotheses set or alternate one
 
@@ -206,6 +400,7 @@ class Simulation(object):
             self.growth_rate = g
         else:
             self.growth_rate_alt = g
+        self.invalidate('taxes', default)
 
     def set_population_growth_rate(self, n=0, default=True):
         """
@@ -214,8 +409,8 @@ class Simulation(object):
         Parameters
         ----------
         
-        n : float, default set to 0
-            The growth rate
+        n : float or year-indexed path (dict or Series), default set to 0
+            The growth rate of the 'exp_growth' population projection. A path gives the rate from each of its years on
         default : True or False
                   indicates wether this is the growth rate for the default hypotheses set or alternate one
         """
@@ -223,6 +418,7 @@ class Simulation(object):
             self.population_growth_rate = n
         else:
             self.population_growth_rate_alt = n
+        self.invalidate('population', default)
             
     def set_population_projection(self, **kwargs):
         """
@@ -238,6 +434,8 @@ class Simulation(object):
             self.population_projection = dict()
         for key, value in kwargs.iteritems():
             self.population_projection[key] = value
+        self.invalidate('population')
+        self.invalidate('population', default=False)
 
 
     def set_tax_projection(self, **kwargs):
@@ -249,12 +447,16 @@ class Simulation(object):
         
         method : str
                  method use to project taxes
+        inflation_rate : float or year-indexed path (dict or Series)
+                         growth rate of payments with the 'desynchronized' method
         """
         if self.tax_projection is None:
             self.tax_projection = dict()
         
         for key, value in kwargs.iteritems():
             self.tax_projection[key] = value
+        self.invalidate('taxes')
+        self.invalidate('taxes', default=False)
 
 
     def load_profiles(self, profiles_filename, profiles_name = "profiles"):
@@ -275,7 +477,23 @@ class Simulation(object):
         dataframe = store['profiles']
         self.set_profiles(dataframe)
         
-    def compute_net_transfers(self, name = 'net_transfers', taxes_list = None, payments_list = None, default=True):
+    def compute_net_transfers(self, name = 'net_transfers', taxes_list = None, payments_list = None, default=True, weights = None):
+        """
+        Creates the column name of the cohorts combining the taxes and the payments
+        
+        Parameters
+        ----------
+        
+        name : str, default 'net_transfers'
+               the name of the computed column
+        taxes_list : list
+                     the columns of the profiles counted as taxes
+        payments_list : list
+                        the columns of the profiles counted as payments
+        default : indicate wether to use the default or alternative cohorts
+        weights : dict, default None
+                  multipliers of some profiles (partial incidence, reform...), the others are counted fully
+        """
         if taxes_list is None:
             taxes_list = []
             raise Warning('No list of taxes provided, using an empty list for computation')
@@ -283,9 +501,54 @@ class Simulation(object):
             payments_list = []
             raise Warning('No list of subsidies or payments provided, using an empty list for computation')
         if default:
-            self.cohorts.compute_net_transfers(name, taxes_list, payments_list)
+            cohorts = self.cohorts
         else:
-            self.cohorts_alt.compute_net_transfers(name, taxes_list, payments_list)
+            cohorts = self.cohorts_alt
+        def compute():
+            cohorts.compute_net_transfers(name, taxes_list, payments_list, weights)
+            return name
+        self._run_stage('net_transfers', [cohorts, name, taxes_list, payments_list, weights], compute, default)
+        self._apply_memory_budget()
+
+    def invalidate(self, stage = 'population', default = True):
+        """
+        Drops the cached results of a stage of the simulation and of all the following ones.
+        The setters call it, the edits of the cohorts in place are detected by their versions in the keys of the stages.
+        
+        Parameters
+        ----------
+        
+        stage : str, default 'population'
+                one of 'population', 'profiles', 'taxes', 'net_transfers', 'present_values', 'indicators'
+        default : True or False
+                  indicates wether to invalidate the default hypotheses set or the alternate one
+        """
+        stages = self._stages[default]
+        for name in STAGES[STAGES.index(stage):]:
+            stages.pop(name, None)
+
+    def _run_stage(self, stage, parameters, compute, default = True):
+        """
+        Returns the cached result of a stage if the parameters it depends on did not change,
+        otherwise computes it and invalidates the following stages.
+        The result of the other hypotheses set is shared when it was computed from the same stages
+        """
+        key = stage_key(*parameters)
+        stages = self._stages[default]
+        if stage in stages and stages[stage][0] == key:
+            return stages[stage][1]
+        self.invalidate(stage, default)
+        other = self._stages[not default]
+        if (stage in SHARED_STAGES and stage in other and other[stage][0] == key and
+            all(name in stages and name in other and stages[name][1] is other[name][1]
+                for name in STAGES[:STAGES.index(stage)])):
+            stages[stage] = other[stage]
+            return stages[stage][1]
+        result = compute()
+        # The key is taken again since some stages add columns to the cohorts they depend on.
+        # The parameters are kept alive so that the ids of the key cannot be reused
+        stages[stage] = (stage_key(*parameters), result, parameters)
+        return result
 
 #===============================================================================
 # Set of methods to conduct the simulation itself
@@ -295,37 +558,73 @@ class Simulation(object):
     def create_cohorts(self, default = True):
         """
         Create cohorts according to population, tax and transfers,
-        and state expenses projection    
+        and state expenses projection.
+        The population projection, the filling of the profiles and the tax projection
+        are only recomputed if the parameters they depend on changed.
+        The following stages (net transfers, present values and indicators) are cached for
+        the version of the cohorts, they are computed again after the cohorts are edited in place
         """
         if default:
             population = self.population
-        else:
-            population = self.population_alt
-            
-        cohorts = DataCohorts(data = population, columns = ['pop'])
-        
-        # Loading parameters to create a cohort :
-        year_length = self.population_projection["year_length"]
-
-        if default:
             growth_rate = self.growth_rate
             discount_rate = self.discount_rate
             pop_growth_rate = self.population_growth_rate
         else:
+            population = self.population_alt
             growth_rate = self.growth_rate_alt
             discount_rate = self.discount_rate_alt
             pop_growth_rate = self.population_growth_rate_alt
-            
+
         # Complete population projection
-        method = self.population_projection["method"]        
-        cohorts.population_project(year_length, method = method, growth_rate = pop_growth_rate)
-        
-        # Generate discount factor and growth factor
+        projected = self._run_stage('population', [self.storage, self.precision, population,
+                                                   self.population_projection, pop_growth_rate],
+                                    lambda: self._project_population(population, pop_growth_rate), default)
+        # Fill profiles
+        filled = self._run_stage('profiles', [self.profiles],
+                                 lambda: self._fill_profiles(projected), default)
+        # Project taxes
+        projected_taxes = self._run_stage('taxes', [growth_rate, self.tax_projection],
+                                          lambda: self._project_taxes(filled, growth_rate), default)
+
+        # The cohorts are a copy of the cached stage since they are modified afterwards
+        cohorts = projected_taxes.clone()
+        cohorts.restore_derived()
         cohorts.gen_dsct(discount_rate)
-        cohorts.gen_grth(growth_rate)
+        if default:
+            self.cohorts = cohorts
+            self.cohorts.name = 'cohorte'
+        else:
+            self.cohorts_alt = cohorts
+            self.cohorts_alt.name = "cohorte_alternative"
+        self._apply_memory_budget()
 
-        # Fill profiles
+    def _project_population(self, population, population_growth_rate):
+        """
+        Returns the cohorts holding the projected population
+        """
+        if self.storage == 'cube':
+            cohorts = CohortsCube.from_frame(population, columns = ['pop'], dtype = self.precision)
+        else:
+            cohorts = DataCohorts(data = population, columns = ['pop'], dtype = self.precision)
+        year_length = self.population_projection["year_length"]
+        method = self.population_projection["method"]
+        cohorts.population_project(year_length, method = method, growth_rate = population_growth_rate)
+        return cohorts
+
+    def _fill_profiles(self, population):
+        """
+        Returns a copy of the population cohorts filled with the profiles
+        """
+        cohorts = population.clone()
         cohorts._fill(self.profiles)
+        return cohorts
+
+    def _project_taxes(self, profiles, growth_rate):
+        """
+        Returns a copy of the filled cohorts with the projected profiles
+        """
+        cohorts = profiles.clone()
+        cohorts.gen_grth(growth_rate)
         method = self.tax_projection["method"]
         if method == 'desynchronized':
             taxes_list = self.tax_projection["typ"]
@@ -333,39 +632,188 @@ class Simulation(object):
             inflation_rate = self.tax_projection['inflation_rate']
             cohorts.proj_tax(rate=growth_rate, inflation_rate=inflation_rate, typ = taxes_list, method=method, payments_list = payments_list)
         else: cohorts.proj_tax(rate=growth_rate, method=method)
+        # The cached stage does not keep the scratch columns of the projection
+        cohorts.evict_derived()
+        return cohorts
 
-        # Project net taxes TOOD: see MainWindow widget
-        if default:
-            self.cohorts = cohorts
-            self.cohorts.name = 'cohorte'
-        else:
-            self.cohorts_alt = cohorts
-            self.cohorts_alt.name = "cohorte_alternative"
-        
-    
     def create_present_values(self, typ, default=True):
         """
         Create aggregated and per capita present values of net transfers according to the given cohort
         and state expenses projection 
         """
         if default:
-            self.aggregate_pv = self.cohorts.aggregate_generation_present_value(typ, discount_rate = self.discount_rate)
+            cohorts = self.cohorts
+            discount_rate = self.discount_rate
+        else:
+            cohorts = self.cohorts_alt
+            discount_rate = self.discount_rate_alt
+        aggregate_pv, percapita_pv, unborn_pv = self._run_stage('present_values', [cohorts, typ, discount_rate, self.tail],
+                                                                lambda: self._present_values(cohorts, typ, discount_rate, default),
+                                                                default)
+        if default:
+            self.unborn_pv = unborn_pv
+            self.aggregate_pv = aggregate_pv
             self.aggregate_pv.name = 'comptes_gen_agrégés'
-            self.aggregate_pv['pop'] = self.cohorts['pop']
-            
-            self.percapita_pv = self.cohorts.per_capita_generation_present_value(typ, discount_rate = self.discount_rate)
+            self.percapita_pv = percapita_pv
             self.percapita_pv.name = 'comptes_gen_indiv'
-            self.percapita_pv['pop'] = self.cohorts['pop']
-            
         else:
-            self.aggregate_pv_alt = self.cohorts_alt.aggregate_generation_present_value(typ, discount_rate = self.discount_rate_alt)
+            self.unborn_pv_alt = unborn_pv
+            self.aggregate_pv_alt = aggregate_pv
             self.aggregate_pv_alt.name = 'comptes_agrégés_alternatifs'
-            self.aggregate_pv_alt['pop'] = self.cohorts_alt['pop']
-            
-            self.percapita_pv_alt = self.cohorts_alt.per_capita_generation_present_value(typ, discount_rate = self.discount_rate_alt)
+            self.percapita_pv_alt = percapita_pv
             self.percapita_pv_alt.name = 'comptes_indiv_alternatifs'
-            self.percapita_pv_alt['pop'] = self.cohorts_alt['pop']
+        self._apply_memory_budget()
+
+    def create_all_present_values(self, default=True):
+        """
+        Create aggregated and per capita present values of all the profiles of the cohorts
+        and of the columns combining them (net transfers...) with a single backward recursion.
+        The accounting cohorts then hold one column per profile
+        
+        Returns
+        -------
+        columns : list
+                  the columns of the present values
+        """
+        if default:
+            cohorts = self.cohorts
+        else:
+            cohorts = self.cohorts_alt
+        columns = list(cohorts._types)
+        self.create_present_values(columns, default)
+        return columns
+
+    def decompose_ipl(self, columns = None, default=True):
+        """
+        Returns the contribution of the generational accounts of each column to the
+        Intertemporal Public Liability, the net government wealth and spendings excluded.
+        The contributions of all the columns are computed in one reduction
+        
+        Parameters
+        ----------
+        
+        columns : list, default None
+                  the columns of the present values, all the columns if None
+        default : indicate wether to use the default or alternative present values
+        
+        Returns
+        -------
+        contributions : Series indexed by column
+        """
+        if default:
+            aggregate_pv = self.aggregate_pv
+            unborn_pv = self.unborn_pv
+        else:
+            aggregate_pv = self.aggregate_pv_alt
+            unborn_pv = self.unborn_pv_alt
+        if columns is None:
+            columns = [name for name in aggregate_pv.columns if name != 'pop']
+
+        def compute():
+            cube = aggregate_pv.to_cube(columns, copy = False)
+            ipl = intertemporal_public_liability(array([cube[name] for name in columns]))
+            unborn = array([unborn_pv.get(name, 0) for name in columns])
+            return Series(ipl - unborn, index = columns)
+        return self._indicator(['decompose_ipl', columns], compute, default)
+
+    def _present_values(self, cohorts, typ, discount_rate, default = True):
+        aggregate_pv, percapita_pv = cohorts.generation_present_values(typ, discount_rate = discount_rate)
+
+        unborn_pv = dict()
+        if self.tail:
+            pop = cohorts.to_cube(['pop'], copy = False)['pop']
+            for name in ([typ] if isinstance(typ, basestring) else typ):
+                entering, unborn = self._tail(cohorts, name, default)
+                tail = add_tail(zeros(pop.shape), entering)
+                # The present values are ordered as the (age, sex, year) cube
+                for pv, cells in [(aggregate_pv, tail), (percapita_pv, tail/pop)]:
+                    if isinstance(pv, CohortsCube):
+                        pv[name] = pv[name] + cells
+                    else:
+                        pv[name] += cells.ravel()
+                unborn_pv[name] = unborn.sum()
+        return aggregate_pv, percapita_pv, unborn_pv
+
+    def _rates(self, default = True):
+        """
+        Returns the growth rate, the discount rate, the population growth rate and the last observed year
+        """
+        if default:
+            return (self.growth_rate, self.discount_rate, self.population_growth_rate,
+                    self.population.index.get_level_values('year').max())
+        return (self.growth_rate_alt, self.discount_rate_alt, self.population_growth_rate_alt,
+                self.population_alt.index.get_level_values('year').max())
+
+    def _tail_flows(self, cube, parts, default = True):
+        """
+        Returns the discounted flows of the parts and the population of the first year after the horizon,
+        and the yearly ratio of each part and of the population afterwards
+        """
+        if self.population_projection['method'] not in ['stable', 'exp_growth']:
+            raise Exception("the tail can only be added with the 'stable' or 'exp_growth' population projection")
+        growth_rate, discount_rate, pop_growth_rate, last_observed = self._rates(default)
+        nb_years = cube.shape[2]
+        flows, pop = self._continued_flows(cube, parts, nb_years, nb_years + 1, growth_rate, discount_rate,
+                                           pop_growth_rate, last_observed)
+
+        # After the first year, the population, the profiles and the discount factors are geometric
+        if self.population_projection['method'] == 'exp_growth':
+            # The rate of a path after the horizon is its last one
+            pop_ratio = 1 + yearly_rates(pop_growth_rate, cube._year_max + 2, 1)[0]
+        else:
+            pop_ratio = 1
+        factors = self._projection_factors(growth_rate, nb_years + 2, cube._year_min)
+        dsct = factor_table.discount(discount_rate, nb_years + 2, cube._year_min)
+        ratios = dict()
+        for name in flows:
+            ratios[name] = factors[name][-1]/factors[name][-2]*dsct[-1]/dsct[-2]
+            if self.tax_projection['method'] != 'aggregate':
+                ratios[name] *= pop_ratio
+        return flows, pop[..., 0], ratios, pop_ratio
+
+    def _tail(self, cohorts, typ, default = True):
+        """
+        Returns the tail beyond the horizon of the present values of the column typ, see geometric_tail
+        """
+        cube = cohorts.to_cube(copy = False)
+        flows, pop, ratios, pop_ratio = self._tail_flows(cube, self._projection_parts(cube, typ, default = default), default)
+        entering = zeros(cube.shape[:2])
+        unborn = zeros(cube.shape[1])
+        for name, part in flows.iteritems():
+            part_entering, part_unborn = geometric_tail(part[..., 0], ratios[name])
+            entering += part_entering
+            unborn += part_unborn
+        return entering, unborn
 
+    def _indicator(self, parameters, compute, default = True):
+        """
+        Returns an indicator computed on the present values, cached until the present values
+        or the parameters of the indicator change.
+        The present values are identified by the result of the present values stage they come from
+        and by their versions, the edits in place of the cohorts or of the present values being counted
+        """
+        if default:
+            data = [self.cohorts, self.aggregate_pv, self.percapita_pv]
+        else:
+            data = [self.cohorts_alt, self.aggregate_pv_alt, self.percapita_pv_alt]
+        present_values = self._stages[default].get('present_values', (None, None))[1]
+        # A reused id of a previous result is told apart by the present values of data, which are kept alive
+        indicators = self._run_stage('indicators', [id(present_values)] + data, dict, default)
+        key = stage_key(*parameters)
+        if key not in indicators:
+            indicators[key] = compute()
+        return indicators[key]
+
+    def _indicator_terms(self, typ, default = True):
+        """
+        Returns the reductions of the aggregate and per capita present values of typ the indicators
+        are computed from, see AccountingCohorts.indicator_terms. They are cached with the indicators
+        """
+        if default:
+            present_values = [self.aggregate_pv, self.percapita_pv]
+        else:
+            present_values = [self.aggregate_pv_alt, self.percapita_pv_alt]
+        return self._indicator(['terms', typ], lambda: [pv.indicator_terms(typ) for pv in present_values], default)
 
     def compute_ipl(self, typ, default=True, precision=False):
         """
@@ -382,20 +830,94 @@ class Simulation(object):
         """
         
         if default:
-            IPL = self.aggregate_pv.compute_ipl(typ, net_gov_wealth = self.net_gov_wealth, net_gov_spendings=self.net_gov_spendings, precision=precision)
+            aggregate_pv = self.aggregate_pv
+            unborn_pv = self.unborn_pv
+            net_gov_wealth = self.net_gov_wealth
+            net_gov_spendings = self.net_gov_spendings
         else:
-            IPL = self.aggregate_pv_alt.compute_ipl(typ, net_gov_wealth = self.net_gov_wealth_alt, net_gov_spendings=self.net_gov_spendings_alt, precision=precision)
-        return IPL
+            aggregate_pv = self.aggregate_pv_alt
+            unborn_pv = self.unborn_pv_alt
+            net_gov_wealth = self.net_gov_wealth_alt
+            net_gov_spendings = self.net_gov_spendings_alt
+
+        def compute():
+            terms = self._indicator_terms(typ, default)[0]
+            value = liability_from_terms(terms, net_gov_wealth, net_gov_spendings, precision)
+            if typ not in unborn_pv:
+                return value
+            # The generations born after the horizon are added when the tail is
+            ipl = liability_from_terms(terms, net_gov_wealth, net_gov_spendings)
+            if precision:
+                return value*ipl/(ipl - unborn_pv[typ])
+            return ipl - unborn_pv[typ]
+        return self._indicator(['ipl', typ, net_gov_wealth, net_gov_spendings, precision], compute, default)
     
-    def create_age_class(self, typ, step = 1, default = True):
+    def compute_precision_drift(self, typ, default = True):
+        """
+        Returns the relative differences between the results of the simulation and those
+        of the same simulation run in double precision
+        
+        Parameters
+        ----------
+        
+        typ : str
+              the column of the present values
+        default : indicate wether to compare the default or alternative cohorts
+        
+        Returns
+        -------
+        drift : Series indexed by 'ipl', 'gen_imbalance' and 'accounts' (the largest difference of
+                the per capita generational accounts relative to the largest account)
+        """
+        reference = copy(self)
+        reference._stages = {True: dict(), False: dict()}
+        reference._kernels = dict()
+        reference.precision = 'float64'
+        reference.memory_budget = None
+        reference.create_cohorts(default)
+        if 'net_transfers' in self._stages[default]:
+            _, name, taxes_list, payments_list, weights = self._stages[default]['net_transfers'][2]
+            reference.compute_net_transfers(name, taxes_list, payments_list, default, weights)
+        reference.create_present_values(typ, default)
+
+        def relative(value, exact):
+            return abs(value - exact)/abs(exact) if exact != 0 else abs(value)
+
+        if default:
+            accounts, exact_accounts = self.percapita_pv, reference.percapita_pv
+        else:
+            accounts, exact_accounts = self.percapita_pv_alt, reference.percapita_pv_alt
+        accounts = accounts.to_cube([typ], copy = False)[typ]
+        exact_accounts = exact_accounts.to_cube([typ], copy = False)[typ]
+        return Series({'ipl': relative(self.compute_ipl(typ, default), reference.compute_ipl(typ, default)),
+                       'gen_imbalance': relative(self.compute_gen_imbalance(typ, default),
+                                                 reference.compute_gen_imbalance(typ, default)),
+                       'accounts': nanmax(abs(accounts - exact_accounts))/nanmax(abs(exact_accounts))},
+                      index = ['ipl', 'gen_imbalance', 'accounts'])
+
+    def create_age_class(self, typ, step = 1, default = True, breaks = None):
         """
         Returns a dataframe containing the average net transfer present values for each age class.
+        The age classes are cached by step (or breaks) until the present values change,
+        a copy is returned so that the caller can edit it
+        
+        Parameters
+        ----------
+        
+        typ : the name of the column containing the aggregated values of generational accounts
+        step : the number of years of the age classes
+        default : indicate wether to use the default or alternative present values
+        breaks : list, default None
+                 the first ages of custom classes, see AccountingCohorts.create_age_class
         """
         if default:
-            age_class = self.aggregate_pv.create_age_class(step, typ)
+            aggregate_pv = self.aggregate_pv
         else:
-            age_class = self.aggregate_pv_alt.create_age_class(step, typ)
-        return age_class
+            aggregate_pv = self.aggregate_pv_alt
+        age_class = self._indicator(['age_class', typ, step, breaks],
+                                    lambda: self._to_accounting(aggregate_pv).create_age_class(step, typ, breaks),
+                                    default)
+        return age_class.clone()
         
     def compute_gen_imbalance(self, typ, default=True):
         """
@@ -416,6 +938,19 @@ class Simulation(object):
         - n_1/n_0 is the ratio of the payments.
          
         """   
+        parameters = ['gen_imbalance', typ] + self._gen_imbalance_hypotheses(default)
+        return self._indicator(parameters, lambda: self._gen_imbalance(typ, default), default)
+
+    def _gen_imbalance_hypotheses(self, default=True):
+        """
+        Returns the growth rate, the discount rate, the net government wealth and spendings
+        of a hypotheses set
+        """
+        if default:
+            return [self.growth_rate, self.discount_rate, self.net_gov_wealth, self.net_gov_spendings]
+        return [self.growth_rate_alt, self.discount_rate_alt, self.net_gov_wealth_alt, self.net_gov_spendings_alt]
+
+    def _gen_imbalance(self, typ, default=True):
         # On définit les dataframes sur avec les quelles on veut travailler :     
         if default:
             aggregate_pv = self.aggregate_pv
@@ -425,48 +960,499 @@ class Simulation(object):
             aggregate_pv = self.aggregate_pv_alt
             cohorts = self.cohorts_alt
             percapita_pv = self.percapita_pv_alt
+        growth_rate, discount_rate, net_gov_wealth, net_gov_spendings = self._gen_imbalance_hypotheses(default)
         
         year_min = aggregate_pv._year_min
         year_max = aggregate_pv._year_max
-#         age_min = self.aggregate_pv._agemin
-        age_max = aggregate_pv._agemax
-         
-        #Calculating the past transfers for both genders then deducting the equilibrium future transfers
-        past_gen_dataframe = aggregate_pv.xs(year_min, level = 'year')
-        past_gen_dataframe = past_gen_dataframe.cumsum()
-        past_gen_transfer = past_gen_dataframe.get_value((age_max, 1), typ)
-         
-        future_gen_transfer = self.net_gov_spendings - self.net_gov_wealth - past_gen_transfer
-          
-        #Computing the number of people of the unborn generation
-        population_unborn_ma = cohorts.get_value((0,0, year_min+1), 'pop')
-        population_unborn_fe = cohorts.get_value((0,1,year_min+1), 'pop')
-        population_unborn = population_unborn_ma + population_unborn_fe
-         
-        #Reorganizing data to prepare the computation of mu_1
-        population_dataframe = cohorts.filter_value(age = [0], year = range(year_min+1, year_max+1), typ='pop')
-        population_dataframe.gen_actualization(self.growth_rate, self.discount_rate)
-        population_dataframe = population_dataframe.unstack(level='sex')
-        del population_dataframe[('actualization', 1)] #TODO : check if this line is necessary
-        
-        population_dataframe['unborn'] = population_unborn
-        population_dataframe['mixed'] = population_dataframe[('pop', 0)] + population_dataframe[('pop', 1)]
-        population_dataframe[('actualization', 0)] *= population_dataframe['mixed']/population_dataframe['unborn']
- 
-        #Computing the coefficient mu_1
-        population_dataframe = population_dataframe.cumsum()        
-        mu_1 = population_dataframe.get_value((0,year_max), ('actualization', 0))
-        
-        #Computing the final imbalance coefficients
-        population_unborn = population_unborn_ma + population_unborn_fe
-        n_1 = future_gen_transfer/(mu_1*population_unborn) # = percapita_future_gen_transfer
-        n_0 = (percapita_pv.get_value((0, 0, year_min), typ)/2 + 
-                               percapita_pv.get_value((0, 1, year_min), typ)/2) # = actual_gen_transfer
-        imbalance = n_1 - n_0
-        imbalance_ratio = n_1/n_0
-        coefficients = [n_1, imbalance, imbalance_ratio]
-        return imbalance_ratio
+        aggregate_terms, percapita_terms = self._indicator_terms(typ, default)
+        past_gen_transfer = aggregate_terms['past']
+        newborn_pv = percapita_terms['newborn']
+        population = cohorts.to_cube(['pop'], copy = False)
+        start, end = population.years.searchsorted([year_min + 1, year_max])
+        
+        #Computing the number of people of the unborn generations
+        population_unborn = population['pop'][0, :, start:end+1].sum(axis = 0)
+        actualization = factor_table.actualization(growth_rate, discount_rate, len(population_unborn), year_min + 1)
+        if self.tail:
+            # The unborn generations after the horizon are summed as one more geometric year
+            _, first_pop, _, pop_ratio = self._tail_flows(population, {}, default)
+            factors = factor_table.actualization(growth_rate, discount_rate, len(population_unborn) + 2, year_min + 1)
+            ratio = factors[-1]/factors[-2]*pop_ratio
+            if not abs(ratio) < 1:
+                raise Exception('the tail is infinite: the discounted flows do not decrease after the horizon')
+            population_unborn = hstack([population_unborn, first_pop[0].sum()])
+            actualization = hstack([actualization, factors[-2]/(1 - ratio)])
+        
+        return generational_imbalance(past_gen_transfer, newborn_pv, population_unborn, actualization,
+                                      net_gov_wealth = net_gov_wealth, net_gov_spendings = net_gov_spendings)
     
+    def create_response_kernel(self, default=True):
+        """
+        Returns the linear response of the Intertemporal Public Liability and of the generational
+        accounts to the projected per capita net transfers of the cohorts.
+        The kernel is only computed again when the cohorts or the discount rate change.
+        """
+        if default:
+            cohorts = self.cohorts
+            discount_rate = self.discount_rate
+        else:
+            cohorts = self.cohorts_alt
+            discount_rate = self.discount_rate_alt
+        # The kernel keeps the version of the cohorts it was built from
+        key = (id(cohorts), cohorts.version, rate_key(discount_rate))
+        if default not in self._kernels or self._kernels[default][0] != key:
+            cube = cohorts.to_cube(['pop'], copy = False)
+            dsct = factor_table.discount(discount_rate, cube.shape[2], cube._year_min)
+            # The cohorts are kept alive so that their id cannot be reused
+            self._kernels[default] = (key, ResponseKernel(cube['pop'], dsct, cube._year_min), cohorts)
+        return self._kernels[default][1]
+
+    def score_reform(self, reform, default=True):
+        """
+        Returns the change of the Intertemporal Public Liability and of the per capita generational
+        accounts caused by a change of the projected net transfers, without computing
+        the present values again
+        
+        Parameters
+        ----------
+        reform : Series indexed by (age, sex, year) or (age, sex, year) ndarray
+                 the change of the per capita net transfers, missing cells are left unchanged
+        default : indicate wether to use the default or alternative parameters
+        
+        Returns
+        -------
+        ipl : the change of the Intertemporal Public Liability
+        accounts : DataFrame indexed by birth year with a column by sex
+        """
+        if default:
+            cohorts = self.cohorts
+        else:
+            cohorts = self.cohorts_alt
+        kernel = self.create_response_kernel(default)
+        if isinstance(reform, Series):
+            cube = cohorts.to_cube(['pop'], copy = False)
+            index = MultiIndex.from_product([cube.ages, cube.sexes, cube.years], names = ['age', 'sex', 'year'])
+            reform = reform.reindex(index).fillna(0).values.reshape(kernel.shape)
+        return kernel.score_ipl(reform), kernel.accounts_frame(kernel.score_accounts(reform))
+
+    def apply_reforms(self, reforms):
+        """
+        Builds the alternative cohorts and present values as the default ones changed by reforms.
+        The alternative population and rates which are not set are those of the default hypotheses set.
+        When they are the same as the default ones, the reforms are applied with masks
+        and the present values are only computed again on the generations and the years
+        the reforms touch, the other ones being those of the default simulation.
+        Otherwise the alternative cohorts and present values are computed fully.
+        The Intertemporal Public Liability of the alternative set uses its own wealth and spendings.
+        
+        Parameters
+        ----------
+        
+        reforms : list of Reform
+                  applied in order. The column combining the profiles (net transfers) is
+                  changed by the weighted changes of its profiles after all the reforms
+        """
+        stages = self._stages[True]
+        if 'present_values' not in stages:
+            raise Exception('the present values of the default simulation should be created first')
+        typ = stages['present_values'][2][1]
+
+        hypotheses = ['population', 'growth_rate', 'discount_rate', 'population_growth_rate']
+        for name in hypotheses:
+            if getattr(self, name + '_alt') is None:
+                setattr(self, name + '_alt', getattr(self, name))
+        if (self.population_alt is not self.population or
+            any(rate_key(getattr(self, name + '_alt')) != rate_key(getattr(self, name)) for name in hypotheses[1:])):
+            self.create_cohorts(default=False)
+            for reform in reforms:
+                reform.apply(self.cohorts_alt)
+            if 'net_transfers' in stages:
+                name, taxes_list, payments_list, weights = stages['net_transfers'][2][1:]
+                self.compute_net_transfers(name, taxes_list, payments_list, default=False, weights=weights)
+            self.create_present_values(typ, default=False)
+            return
+        self.invalidate('population', default=False)
+
+        cohorts = self.cohorts
+        cohorts_alt = cohorts.clone()
+        cohorts_alt.restore_derived()
+        cohorts_alt.name = "cohorte_alternative"
+        columns = list()
+        for reform in reforms:
+            reform.apply(cohorts_alt)
+            if reform.column not in columns:
+                columns.append(reform.column)
+        if 'net_transfers' in stages:
+            parameters = stages['net_transfers'][2]
+            name, weights = parameters[1], net_transfers_weights(*parameters[2:])
+            combined = [column for column in columns if column in weights]
+            if combined:
+                change = sum(weights[column]*(cohorts_alt[column] - cohorts[column]) for column in combined)
+                cohorts_alt[name] = cohorts_alt[name] + change
+                columns.append(name)
+            self._stages[False]['net_transfers'] = (stage_key(cohorts_alt, *parameters[1:]), name,
+                                                    [cohorts_alt] + parameters[1:])
+        self.cohorts_alt = cohorts_alt
+
+        present_values = [self.aggregate_pv.clone(), self.percapita_pv.clone(), dict(self.unborn_pv)]
+        pop = cohorts.to_cube(['pop'], copy = False)['pop']
+        dsct = cohorts.to_cube(['dsct'], copy = False)['dsct']
+        last_year = pop.shape[2] - 1
+        for column in [column for column in columns if column in present_values[0].columns]:
+            delta = (cohorts_alt.to_cube([column], copy = False)[column] -
+                     cohorts.to_cube([column], copy = False)[column])
+            ages, _, years = delta.nonzero()
+            if not len(ages):
+                continue
+            if self.tail and years.max() == last_year:
+                # The tail is continued from the last year
+                self.create_present_values(typ, default=False)
+                return
+            # The generations touched are alive between the first year of the reform minus the oldest age
+            # and its last year, and younger than its oldest age
+            age_stop, year_start, year_stop = ages.max() + 1, max(years.min() - ages.max(), 0), years.max() + 1
+            block = (slice(0, age_stop), slice(None), slice(year_start, year_stop))
+            cells = zeros((2,) + pop.shape)
+            cells[0][block] = generation_present_value(delta[block]*dsct[block]*pop[block])
+            cells[1][block] = cells[0][block]/pop[block]
+            for pv, values in zip(present_values, cells):
+                if isinstance(pv, CohortsCube):
+                    pv[column] = pv[column] + values
+                else:
+                    # The present values are ordered as the (age, sex, year) cube
+                    pv[column] += values.ravel()
+
+        aggregate_pv, percapita_pv, unborn_pv = present_values
+        self._stages[False]['present_values'] = (stage_key(cohorts_alt, typ, self.discount_rate, self.tail),
+                                                 tuple(present_values),
+                                                 [cohorts_alt, typ, self.discount_rate, self.tail])
+        self.unborn_pv_alt = unborn_pv
+        self.aggregate_pv_alt = aggregate_pv
+        self.aggregate_pv_alt.name = 'comptes_agrégés_alternatifs'
+        self.percapita_pv_alt = percapita_pv
+        self.percapita_pv_alt.name = 'comptes_indiv_alternatifs'
+        self._apply_memory_budget()
+
+    def adapt_horizon(self, typ, tolerance, taxes_list = None, payments_list = None, block = 10, max_year_length = 1000):
+        """
+        Extends the projection of the default hypotheses set by blocks of years until the relative
+        contribution of the last block to the Intertemporal Public Liability is below tolerance,
+        then creates the cohorts and the present values on this horizon.
+        Only the flows of each new block are computed during the search.
+        The cohorts should have been created with a short projection, and typ computed.
+        
+        Parameters
+        ----------
+        typ : str
+              the name of the column of the cohorts containing the net transfers
+        tolerance : float
+                    relative tolerance on the Intertemporal Public Liability
+        taxes_list : list, default None
+                     the taxes combined in typ, needed if typ is not a profile
+        payments_list : list, default None
+                        the payments combined in typ, needed if typ is not a profile
+        block : int, default 10
+                number of years added at each step
+        max_year_length : int, default 1000
+                          the projection is not extended further
+        
+        Returns
+        -------
+        year_length : the duration of the retained projection
+        """
+        if self.population_projection['method'] not in ['stable', 'exp_growth']:
+            raise Exception("the horizon can only be adapted with the 'stable' or 'exp_growth' population projection")
+        cube = self.cohorts.to_cube(copy = False)
+        last_observed = self.population.index.get_level_values('year').max()
+        parts = self._projection_parts(cube, typ, taxes_list, payments_list)
+        rates = (self.growth_rate, self.discount_rate, self.population_growth_rate, last_observed)
+
+        stop = cube.shape[2]
+        flows, pop = self._continued_flows(cube, parts, 0, stop, *rates)
+        ipl = intertemporal_public_liability(generation_present_value(sum(flows.values())),
+                                             self.net_gov_wealth, self.net_gov_spendings)
+        while stop - 1 < max_year_length:
+            nb_added = min(block, max_year_length + 1 - stop)
+            flows, pop = self._continued_flows(cube, parts, stop, stop + nb_added, *rates)
+            contribution = extension_contribution(generation_present_value(sum(flows.values())), stop)
+            ipl += contribution
+            stop += nb_added
+            if abs(contribution) < tolerance*abs(ipl):
+                break
+
+        year_length = stop - 1
+        if year_length > cube.shape[2] - 1:
+            self.set_population_projection(year_length = year_length)
+            self.create_cohorts()
+            if taxes_list is not None or payments_list is not None:
+                self.compute_net_transfers(typ, taxes_list or [], payments_list or [])
+        self.create_present_values(typ)
+        return year_length
+
+    def compute_base_year_evolution(self, typ, years, taxes_list = None, payments_list = None, default = True):
+        """
+        Returns the Intertemporal Public Liability, its precision and the generational imbalance
+        for several base years, as if the years before each base year were dropped from the population
+        and the whole simulation was run again.
+        The generational present values are computed once and re-discounted to each base year.
+        
+        Parameters
+        ----------
+        typ : str
+              the name of the column of the cohorts containing the net transfers
+        years : list of int
+                the base years
+        taxes_list : list, default None
+                     the taxes combined in typ, needed with the desynchronized tax projection
+        payments_list : list, default None
+                        the payments combined in typ, needed with the desynchronized tax projection
+        default : indicate wether to perform the computation on the default or alternative parameters
+        
+        Returns
+        -------
+        evolution : DataFrame indexed by base year with columns 'ipl', 'precision' and 'gen_imbalance'
+        """
+        if default:
+            cohorts = self.cohorts
+            population = self.population
+            growth_rate = self.growth_rate
+            discount_rate = self.discount_rate
+            pop_growth_rate = self.population_growth_rate
+            net_gov_wealth = self.net_gov_wealth
+            net_gov_spendings = self.net_gov_spendings
+        else:
+            cohorts = self.cohorts_alt
+            population = self.population_alt
+            growth_rate = self.growth_rate_alt
+            discount_rate = self.discount_rate_alt
+            pop_growth_rate = self.population_growth_rate_alt
+            net_gov_wealth = self.net_gov_wealth_alt
+            net_gov_spendings = self.net_gov_spendings_alt
+
+        cube = cohorts.to_cube(copy = False)
+        year_min = cube._year_min
+        nb_years = cube.shape[2]
+        years = sorted(years)
+        last_observed = population.index.get_level_values('year').max()
+        if years[0] < year_min or years[-1] > last_observed:
+            raise Exception('the base years should be observed years of the population')
+
+        # Horizon of each base year, as set by the population projection
+        method = self.population_projection['method']
+        if method in ['stable', 'exp_growth']:
+            horizons = [max(year + self.population_projection['year_length'], last_observed) for year in years]
+        else:
+            horizons = [last_observed]*len(years)
+        nb_total = max(max(horizons) - year_min + 1, nb_years)
+
+        # Present values of the parts of typ projected with the same factor
+        parts = self._projection_parts(cube, typ, taxes_list, payments_list, default)
+        flows, pop = self._continued_flows(cube, parts, 0, nb_total, growth_rate, discount_rate,
+                                           pop_growth_rate, last_observed)
+        present_values = dict((name, generation_present_value(part)) for name, part in flows.iteritems())
+        factors = self._projection_factors(growth_rate, nb_total, year_min)
+        dsct = factor_table.discount(discount_rate, nb_total, year_min)
+
+        evolution = DataFrame(index = years, columns = ['ipl', 'precision', 'gen_imbalance'], dtype = float)
+        for year, horizon in zip(years, horizons):
+            start, stop = year - year_min, horizon - year_min
+            pv = sum(truncated_present_value(present_values[name], start, stop)/(factors[name][start]*dsct[start])
+                     for name in present_values)
+            evolution.loc[year, 'ipl'] = intertemporal_public_liability(pv, net_gov_wealth, net_gov_spendings)
+            evolution.loc[year, 'precision'] = intertemporal_public_liability(pv, net_gov_wealth, net_gov_spendings, precision = True)
+
+            population_unborn = pop[0, :, start+1:stop+1].sum(axis = 0)
+            actualization = factor_table.actualization(self.growth_rate, self.discount_rate, len(population_unborn), year + 1)
+            evolution.loc[year, 'gen_imbalance'] = generational_imbalance(pv[:, :, 0].sum(), pv[0, :, 0]/pop[0, :, start],
+                                                                          population_unborn, actualization,
+                                                                          net_gov_wealth = self.net_gov_wealth,
+                                                                          net_gov_spendings = self.net_gov_spendings)
+        return evolution
+
+    def compute_derivatives(self, typ, taxes_list = None, payments_list = None, default = True):
+        """
+        Returns the exact derivatives of the Intertemporal Public Liability and of the generational
+        imbalance with respect to the discount rate, the growth rate, the population growth rate
+        and the inflation rate. The present values and their derivatives are computed in the same pass.
+        For a year-indexed path of rates, the derivative is taken with respect to a uniform shift of the path.
+        The rates, wealth and spendings are those of the hypotheses set differentiated.
+        
+        Parameters
+        ----------
+        typ : str
+              the name of the column of the cohorts containing the net transfers
+        taxes_list : list, default None
+                     the taxes combined in typ, needed with the desynchronized tax projection
+        payments_list : list, default None
+                        the payments combined in typ, needed with the desynchronized tax projection
+        default : indicate wether to perform the computation on the default or alternative parameters
+        
+        Returns
+        -------
+        derivatives : DataFrame indexed by 'discount_rate', 'growth_rate', 'population_growth_rate'
+                      and 'inflation_rate' with columns 'ipl' and 'gen_imbalance'
+        """
+        if default:
+            cohorts = self.cohorts
+            population = self.population
+            growth_rate = self.growth_rate
+            discount_rate = self.discount_rate
+            pop_growth_rate = self.population_growth_rate
+            year_gov_spendings = self.year_gov_spendings
+            net_gov_wealth = self.net_gov_wealth
+            net_gov_spendings = self.net_gov_spendings
+        else:
+            cohorts = self.cohorts_alt
+            population = self.population_alt
+            growth_rate = self.growth_rate_alt
+            discount_rate = self.discount_rate_alt
+            pop_growth_rate = self.population_growth_rate_alt
+            year_gov_spendings = self.year_gov_spendings_alt
+            net_gov_wealth = self.net_gov_wealth_alt
+            net_gov_spendings = self.net_gov_spendings_alt
+        inflation_rate = self.tax_projection.get('inflation_rate', 0)
+
+        cube = cohorts.to_cube(copy = False)
+        year_min = cube._year_min
+        nb_years = cube.shape[2]
+        pop = cube['pop']
+        dsct = factor_table.discount(discount_rate, nb_years, year_min)
+        flows = dict((name, profile*dsct*pop)
+                     for name, profile in self._projection_parts(cube, typ, taxes_list, payments_list, default).iteritems())
+        total = sum(flows.values())
+        zero = zeros(cube.shape)
+
+        # Derivative of the logarithm of the population, the first projected year keeps the last observed population
+        pop_derivative = zeros(nb_years)
+        nb_projected = cube._year_max - population.index.get_level_values('year').max()
+        if self.population_projection['method'] == 'exp_growth' and nb_projected > 0:
+            pop_derivative[-nb_projected:] = factor_table.log_derivative(pop_growth_rate, nb_projected, cube._year_max - nb_projected + 1)
+        if self.tax_projection['method'] == 'aggregate':
+            # Aggregate transfers do not depend on the population
+            pop_flows = zero
+        else:
+            pop_flows = total*pop_derivative
+
+        names = ['discount_rate', 'growth_rate', 'population_growth_rate', 'inflation_rate']
+        log_derivatives = [-factor_table.log_derivative(discount_rate, nb_years, year_min),
+                           factor_table.log_derivative(growth_rate, nb_years, year_min)]
+        pvs = generation_present_value(array([total, total*log_derivatives[0], flows.get('growth', zero)*log_derivatives[1],
+                                              pop_flows, flows.get('inflation', zero)*
+                                              factor_table.log_derivative(inflation_rate, nb_years, year_min)]))
+        pv, d_pv = pvs[0], pvs[1:]
+
+        # Derivatives of the present value of the spendings computed from the reference year
+        d_spendings = zeros(4)
+        if year_gov_spendings is not None:
+            horizon = self.year_length + 1
+            spendings_year_min = population.index.get_level_values('year').min()
+            actualization = (factor_table.growth(growth_rate, horizon, spendings_year_min)*
+                             factor_table.discount(discount_rate, horizon, spendings_year_min))
+            d_spendings[0] = -year_gov_spendings*(actualization*factor_table.log_derivative(discount_rate, horizon, spendings_year_min))[1:].sum()
+            d_spendings[1] = year_gov_spendings*(actualization*factor_table.log_derivative(growth_rate, horizon, spendings_year_min))[1:].sum()
+
+        derivatives = DataFrame(index = names, columns = ['ipl', 'gen_imbalance'], dtype = float)
+        derivatives['ipl'] = intertemporal_public_liability(d_pv, 0, d_spendings)
+
+        unborn = pop[0, :, 1:].sum(axis = 0)
+        actualization = factor_table.actualization(growth_rate, discount_rate, nb_years - 1, year_min + 1)
+        d_log_weights = zeros((4, nb_years - 1))
+        d_log_weights[0] = -factor_table.log_derivative(discount_rate, nb_years - 1, year_min + 1)
+        # The growth factor of the actualization is not raised to the power of the years
+        d_log_weights[1] = 1/(1 + yearly_rates(growth_rate, year_min + 1, 1)[0])
+        d_log_weights[2] = pop_derivative[1:]
+        future = net_gov_spendings - net_gov_wealth - pv[:, :, 0].sum()
+        d_future = d_spendings - d_pv[:, :, :, 0].sum(axis = 2).sum(axis = 1)
+        unborn_weight = (actualization*unborn).sum()
+        d_unborn_weight = (actualization*unborn*d_log_weights).sum(axis = 1)
+        n_1 = future/unborn_weight
+        d_n_1 = d_future/unborn_weight - future*d_unborn_weight/unborn_weight**2
+        n_0 = (pv[0, :, 0]/pop[0, :, 0]).mean()
+        d_n_0 = (d_pv[:, 0, :, 0]/pop[0, :, 0]).mean(axis = 1)
+        derivatives['gen_imbalance'] = (d_n_1*n_0 - n_1*d_n_0)/n_0**2
+        return derivatives
+
+    def _projection_factors(self, growth_rate, nb_years, year_min):
+        """
+        Returns the factors of the parts of the profiles in the tax projection
+        """
+        return {'growth': factor_table.growth(growth_rate, nb_years, year_min),
+                'inflation': factor_table.growth(self.tax_projection.get('inflation_rate', 0), nb_years, year_min),
+                'fixed': ones(nb_years)}
+
+    def _continued_flows(self, cube, parts, start, stop, growth_rate, discount_rate, pop_growth_rate, last_observed):
+        """
+        Returns the discounted flows of the parts of the profiles and the population for the year
+        positions start to stop-1 of the cube. After the last year of the cube, the population
+        and the profiles are continued as the population and tax projections would do.
+        """
+        nb_years = cube.shape[2]
+        year_min = cube._year_min
+        inside = max(min(stop, nb_years) - start, 0)
+        first = max(start, nb_years)
+
+        pop = empty(cube.shape[:2] + (stop - start,))
+        pop[..., :inside] = cube['pop'][..., start:start + inside]
+        if inside < stop - start:
+            if self.population_projection['method'] == 'exp_growth':
+                # The first projected year keeps the population of the last observed year,
+                # the factors are counted from it and rebased on the last year of the cube
+                nb_projected = cube._year_max - last_observed
+                growth = factor_table.growth(pop_growth_rate, stop - nb_years + nb_projected, last_observed + 1)
+                base = growth[nb_projected - 1] if nb_projected > 0 else 1
+                growth = growth[first - nb_years + nb_projected:]/base
+            else:
+                growth = 1
+            pop[..., inside:] = cube['pop'][..., -1:]*growth
+
+        factors = self._projection_factors(growth_rate, stop, year_min)
+        dsct = factor_table.discount(discount_rate, stop, year_min)[start:]
+        flows = dict()
+        for name, profile in parts.iteritems():
+            continued = empty(pop.shape)
+            continued[..., :inside] = profile[..., start:start + inside]
+            if inside < stop - start:
+                factor = factors[name]
+                continued[..., inside:] = profile[..., -1:]*factor[first:]/factor[nb_years - 1]
+                if self.tax_projection['method'] == 'aggregate':
+                    continued[..., inside:] *= cube['pop'][..., -1:]/pop[..., inside:]
+            flows[name] = continued*dsct*pop
+        return flows, pop
+
+    def _projection_parts(self, cube, typ, taxes_list = None, payments_list = None, default = True):
+        """
+        Splits the column typ of the cube by factor of the tax projection ('growth', 'inflation' or 'fixed').
+        Without lists, the ones given to compute_net_transfers for typ are used, as well as its weights
+        """
+        if self.tax_projection['method'] != 'desynchronized':
+            return {'growth': cube[typ]}
+
+        def factor(name):
+            if name in self.tax_projection['typ']:
+                return 'growth'
+            if name in self.tax_projection['payments_list']:
+                return 'inflation'
+            return 'fixed'
+
+        if taxes_list is None and payments_list is None and typ in cube._types_years:
+            return {factor(typ): cube[typ]}
+
+        # Lists and weights given to compute_net_transfers
+        weights = None
+        stage = self._stages[default].get('net_transfers')
+        if stage is not None and stage[2][1] == typ:
+            weights = stage[2][4]
+            if taxes_list is None and payments_list is None:
+                taxes_list, payments_list = stage[2][2], stage[2][3]
+        elif taxes_list is None and payments_list is None:
+            raise Exception('the profiles combined in %s are needed with the desynchronized tax projection' % typ)
+
+        parts = dict()
+        for name, weight in net_transfers_weights(taxes_list or [], payments_list or [], weights).iteritems():
+            part = factor(name)
+            parts[part] = parts.get(part, 0) + weight*cube[name]
+        return parts
+
     def saving_simulation(self, file_path=None):
         """
         CANNOT BE COMPLETED FOR NOW BECAUSE OF A BUG OF PANDAS
@@ -514,11 +1500,19 @@ class Simulation(object):
         """
         
         if default:
-            break_down = self.aggregate_pv.break_down_ipl(typ, net_gov_wealth = self.net_gov_wealth, net_gov_spendings=self.net_gov_spendings, threshold = threshold)
+            break_down = self._to_accounting(self.aggregate_pv).break_down_ipl(typ, net_gov_wealth = self.net_gov_wealth, net_gov_spendings=self.net_gov_spendings, threshold = threshold)
         else:
-            break_down = self.aggregate_pv_alt.break_down_ipl(typ, net_gov_wealth = self.net_gov_wealth_alt, net_gov_spendings=self.net_gov_spendings_alt, threshold = threshold)
+            break_down = self._to_accounting(self.aggregate_pv_alt).break_down_ipl(typ, net_gov_wealth = self.net_gov_wealth_alt, net_gov_spendings=self.net_gov_spendings_alt, threshold = threshold)
         return break_down
 
+    def _to_accounting(self, pv):
+        """
+        Returns pv as an AccountingCohorts, converting it if it is stored as a cube
+        """
+        if isinstance(pv, CohortsCube):
+            return pv.to_frame(cls = AccountingCohorts)
+        return pv
+
 
 if __name__ == '__main__':
     pass
@@ -10,6 +10,7 @@ from __future__ import division
 import os
 from src.lib.simulation import Simulation
 from src.lib.cohorts.accounting_cohorts import AccountingCohorts
+from src.lib.cohorts.reform import Reform
 from pandas import read_csv, HDFStore, concat, ExcelFile, DataFrame, MultiIndex
 from numpy import array, hstack, arange, NaN
 import matplotlib.pyplot as plt
@@ -197,8 +198,6 @@ def compute_elasticities():
     
     simulation.set_population_projection(year_length=simulation.year_length, method="exp_growth")
 
-    epsilon = 0.5
-
     levels = ['haut', 'cent', 'bas']
     record = DataFrame(index=levels)
     print record
@@ -262,16 +261,22 @@ def compute_elasticities():
     print 'IPL_alt=  ', ipl_alt
     
     #Elasticities
+    # The semi elasticities to the rates are the exact derivatives of the IPL.
+    # The population scenarios are discrete hypotheses with no derivative: they are only
+    # compared by their IPL, no elasticity to the population scenario is computed
     print "COMPUTING ELASTICITIES"
     print '------------------------'
-    ipl_derivative = (ipl_alt - ipl)/epsilon
-    print '    semi élasticité of IPL:', ipl_derivative/ipl
+    for default, value in [(True, ipl), (False, ipl_alt)]:
+        derivatives = simulation.compute_derivatives('net_transfers', taxes_list = taxes_list,
+                                                     payments_list = payments_list, default = default)
+        print '    semi élasticités of IPL to r, g, n and pi (%s):' % (population_scenario if default else population_scenario_alt)
+        print (derivatives['ipl']/value).to_string()
     print 'Valeur de q :'
     print (1+g)/(1+r)
     
     col_name = 'MIG'+param3
     record[col_name] = NaN
-    record.loc[param1, col_name] = ipl_derivative/ipl
+    record.loc[param1, col_name] = ipl_alt
         
     print record.to_string()
             
@@ -333,7 +338,7 @@ def simple_scenario():
     simulation.set_population_growth_rate(n_alt, default=False)
     
     simulation.create_cohorts(default=False)
-    simulation.cohorts_alt.loc[[x>=2015 for x in simulation.cohorts_alt.index.get_level_values(2)], 'retraite'] *= (1/2)
+    Reform('retraite', years=(2015, None), factor=1/2).apply(simulation.cohorts_alt)
 
     simulation.set_gov_wealth(net_gov_wealth_alt, default=False)
     simulation.set_gov_spendings(year_gov_spending_alt, default=False, compute=True)
@@ -354,14 +359,13 @@ def simple_scenario():
     
     xls = "C:/Users/Utilisateur/Documents/GitHub/ga/src/countries/france/sources/Output_folder/"
 
+    # The flows of all the generations by age are extracted at once
+    flux = AccountingCohorts(tmp).lifetime_accounts('net_transfers', sex=0)
+    flux_alt = AccountingCohorts(tmp_2).lifetime_accounts('net_transfers', sex=0)
     for year in range(1996, 2007):
-        flux_df = AccountingCohorts(tmp).extract_generation(year=year, typ='net_transfers', age=0)
-        flux_df = flux_df.xs(0, level='sex')
+        flux_df = DataFrame({'net_transfers': flux.loc[year], year: flux_alt.loc[year]},
+                            columns = ['net_transfers', year]).dropna()
         print year
-
-        flux_df_alt = AccountingCohorts(tmp_2).extract_generation(year=year, typ='net_transfers', age=0)
-        flux_df_alt = flux_df_alt.xs(0, level='sex')
-        flux_df[year] = flux_df_alt['net_transfers']
     
         flux_df.to_excel(str(xls)+str(year)+'_.xlsx', 'flux')
 
@@ -424,52 +428,10 @@ def transition():
 
                 simulation.create_cohorts()
                 simulation.cohorts.compute_net_transfers(name = 'net_transfers', taxes_list = taxes_list, payments_list = payments_list)
-                simulation.create_present_values(typ='net_transfers')
-
-                for year in range(year_min, year_min+60):
-                    
-                    #On tente de tronquer la df au fil du temps
-                    try:
-                        simulation.aggregate_pv = simulation.aggregate_pv.drop(labels=year-1, level='year')
-                    except:
-                        print 'except path'
-                        pass
-                    simulation.aggregate_pv = AccountingCohorts(simulation.aggregate_pv)
-
-#                     imbalance = simulation.compute_gen_imbalance(typ='net_transfers')
-                    ipl = simulation.compute_ipl(typ='net_transfers')
-                    
-                    # Calcul du résidut de l'IPL pour vérifier la convergence 
-                    #(on se place tard dans la projection)
-                    precision_df = simulation.aggregate_pv
-                    print precision_df.head().to_string()
-                    
-                    year_min_ = array(list(precision_df.index.get_level_values(2))).min()
-                    year_max_ = array(list(precision_df.index.get_level_values(2))).max() - 1
-            #         age_min = array(list(self.index.get_level_values(0))).min()
-                    age_max_ = array(list(precision_df.index.get_level_values(0))).max()
-                    print 'CALIBRATION CHECK : ', year_min_, year_max_
-                    
-                    past_gen_dataframe = precision_df.xs(year_min_, level = 'year')
-                    past_gen_dataframe = past_gen_dataframe.cumsum()
-                    past_gen_transfer = past_gen_dataframe.get_value((age_max_, 1), 'net_transfers')
-#                     print '    past_gen_transfer = ', past_gen_transfer
-             
-                    future_gen_dataframe = precision_df.xs(0, level = 'age')
-                    future_gen_dataframe = future_gen_dataframe.cumsum()
-                    future_gen_transfer = future_gen_dataframe.get_value((1, year_max_), 'net_transfers')
-#                     print '    future_gen_transfer =', future_gen_transfer
-                    
-                    #Note : do not forget to eliminate values counted twice
-                    last_ipl = past_gen_transfer + future_gen_transfer + net_gov_wealth - simulation.net_gov_spendings - past_gen_dataframe.get_value((0, 0), 'net_transfers')
-                    last_ipl = -last_ipl
-                    
-                    print last_ipl, ipl
-                    precision = (ipl - last_ipl)/ipl
-                    print 'precision = ', precision
-                    
-                    record.loc[year, population_scenario] = ipl
-                    record.loc[year, col_name2] = precision
+
+                evolution = simulation.compute_base_year_evolution('net_transfers', arrays)
+                record[population_scenario] = evolution['ipl']
+                record[col_name2] = evolution['precision']
                 print record.head().to_string()
     xls = "C:/Users/Utilisateur/Documents/GitHub/ga/src/countries/france/sources/Carole_Bonnet/"+'ipl_evolution'+'.xlsx'
     print record.head(30).to_string()
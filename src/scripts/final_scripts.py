@@ -17,6 +17,7 @@ from __future__ import division
 import os
 from src.lib.simulation import Simulation
 from src.lib.cohorts.accounting_cohorts import AccountingCohorts
+from src.lib.cohorts.reform import Reform
 from pandas import read_csv, HDFStore, concat, ExcelFile, DataFrame, MultiIndex
 from numpy import array, hstack, arange, NaN
 import matplotlib.pyplot as plt
@@ -173,17 +174,14 @@ def produce_percap_transfert_flux(simulation=simulation, year_list = range(1996,
     tmp_2['net_transfers'] *= tmp_2['dsct']
     
 
+    # The flows of all the generations by age are extracted at once
+    flux = AccountingCohorts(tmp).lifetime_accounts('net_transfers', sex=0)
+    flux_alt = AccountingCohorts(tmp_2).lifetime_accounts('net_transfers', sex=0)
     for year in year_list:
-        flux_df = AccountingCohorts(tmp).extract_generation(year=year, typ='net_transfers', age=0)
-        flux_df = flux_df.xs(0, level='sex')
-        flux_df.columns = [year]
+        flux_df = DataFrame({year: flux.loc[year], str(year)+'_alt': flux_alt.loc[year]},
+                            columns = [year, str(year)+'_alt']).dropna()
         print year
 
-        flux_df_alt = AccountingCohorts(tmp_2).extract_generation(year=year, typ='net_transfers', age=0)
-        flux_df_alt = flux_df_alt.xs(0, level='sex')
-        flux_df_alt.columns = [str(year)+'_alt']
-        
-        flux_df = concat([flux_df, flux_df_alt], axis=1)#, ignore_index=True)
         flux_df[year] *= ((1+simulation.discount_rate)/(1+simulation.growth_rate))**(year - year_min)
         flux_df[str(year)+'_alt'] *= ((1+simulation.discount_rate_alt)/(1+simulation.growth_rate_alt))**(year - year_min)
         print flux_df.head()
@@ -202,17 +200,14 @@ def produce_agg_transfert_flux(simulation=simulation, year_list = range(1996, 20
     tmp_2['net_transfers'] *= tmp_2['dsct']*tmp_2['pop']
     
 
+    # The flows of all the generations by age are extracted at once
+    flux = AccountingCohorts(tmp).lifetime_accounts('net_transfers', sex=0)
+    flux_alt = AccountingCohorts(tmp_2).lifetime_accounts('net_transfers', sex=0)
     for year in year_list:
-        flux_df = AccountingCohorts(tmp).extract_generation(year=year, typ='net_transfers', age=0)
-        flux_df = flux_df.xs(0, level='sex')
-        flux_df.columns = [year]
+        flux_df = DataFrame({year: flux.loc[year], str(year)+'_alt': flux_alt.loc[year]},
+                            columns = [year, str(year)+'_alt']).dropna()
         print year
 
-        flux_df_alt = AccountingCohorts(tmp_2).extract_generation(year=year, typ='net_transfers', age=0)
-        flux_df_alt = flux_df_alt.xs(0, level='sex')
-        flux_df_alt.columns = [str(year)+'_alt']
-        
-        flux_df = concat([flux_df, flux_df_alt], axis=1)#, ignore_index=True)
         flux_df[year] *= ((1+simulation.discount_rate)/(1+simulation.growth_rate))**(year - year_min)
         flux_df[str(year)+'_alt'] *= ((1+simulation.discount_rate_alt)/(1+simulation.growth_rate_alt))**(year - year_min)
         print flux_df.head()
@@ -220,103 +215,39 @@ def produce_agg_transfert_flux(simulation=simulation, year_list = range(1996, 20
         flux_df.to_excel(str(xls)+str(year)+'_ESP_agg.xlsx', 'flux')
     gc.collect()
 
-def produce_ipl_evolution(simulation, year_min = 1996):
+def _reform_evolution(simulation, year_min = 1996):
+    """
+    Returns the evolution with the base year of the indicators of the default and reform simulations
+    """
+    taxes_list = ['tva', 'tipp', 'cot', 'irpp', 'impot', 'property']
+    payments_list = ['chomage', 'retraite', 'revsoc', 'maladie', 'educ']
+    years = range(year_min, year_min+60)
     
-    arrays=arange(year_min, year_min+60)
-    record = DataFrame(index=arrays)
-    record['ipl'] = NaN
-    record['ipl_réforme'] = NaN
+    simulation.create_cohorts(default=False)
+    Reform('cot', years=(2075, None), factor=1+0.1).apply(simulation.cohorts_alt)
+    simulation.cohorts_alt.compute_net_transfers(name = 'net_transfers', taxes_list = taxes_list, payments_list = payments_list)
     
-    for year in range(year_min, year_min+60):
-        print year
-        #On tente de tronquer la df au fil du temps
-        try:
-            simulation.population = simulation.population.drop(labels=year-1, level='year')
-            simulation.population_alt = simulation.population_alt.drop(labels=year-1, level='year')
-        except:
-            print 'except path'
-            pass
-        
-        taxes_list = ['tva', 'tipp', 'cot', 'irpp', 'impot', 'property']
-        payments_list = ['chomage', 'retraite', 'revsoc', 'maladie', 'educ']
-        
-        simulation.create_cohorts()
-        simulation.create_cohorts(default=False)
+    evolution = simulation.compute_base_year_evolution('net_transfers', years, taxes_list, payments_list)
+    evolution_alt = simulation.compute_base_year_evolution('net_transfers', years, taxes_list, payments_list, default=False)
+    return evolution, evolution_alt
 
-        simulation.cohorts.compute_net_transfers(name = 'net_transfers', taxes_list = taxes_list, payments_list = payments_list)
-        simulation.create_present_values('net_transfers', default=True)
-        
-        simulation.cohorts_alt.loc[[x>=2075 for x in simulation.cohorts_alt.index.get_level_values(2)], 'cot'] *= (1+0.1)
-        simulation.cohorts_alt.compute_net_transfers(name = 'net_transfers', taxes_list = taxes_list, payments_list = payments_list)
-        simulation.create_present_values('net_transfers', default=False)
-
-#                     imbalance = simulation.compute_gen_imbalance(typ='net_transfers')
-        ipl = simulation.compute_ipl(typ='net_transfers')
-        ipl_alt = simulation.compute_ipl(typ='net_transfers', default=False)
-       
-        
-        record.loc[year, "ipl"] = ipl/(8050.6e+09*(1+simulation.growth_rate)**(year-year_min))
-        record.loc[year, 'ipl_réforme'] = ipl_alt/(8050.6e+09*(1+simulation.growth_rate)**(year-year_min))
+def produce_ipl_evolution(simulation, year_min = 1996):
+    
+    evolution, evolution_alt = _reform_evolution(simulation, year_min)
+    record = DataFrame(index=evolution.index)
+    gdp = 8050.6e+09*(1+simulation.growth_rate)**(record.index.values - year_min)
+    record['ipl'] = evolution['ipl']/gdp
+    record['ipl_réforme'] = evolution_alt['ipl']/gdp
 
     record.to_excel(xls+'ipl_flux_ESP.xlsx', 'ipl_relative_au_pib')
     gc.collect()
 
 def produce_imbalance_evolution(simulation=simulation, year_min = 1996):
     
-    arrays=arange(year_min, year_min+60)
-    record = DataFrame(index=arrays)
-    record['déséquilibre'] = NaN
-    record['déséquilibre_alt'] = NaN
-    
-#     for year in range(year_min, year_min+60):
-#         print year
-#         #On tente de tronquer la df au fil du temps
-#         try:
-#             simulation.aggregate_pv = simulation.aggregate_pv.drop(labels=year-1, level='year')
-#             simulation.aggregate_pv_alt = simulation.aggregate_pv_alt.drop(labels=year-1, level='year')
-#         except:
-#             print 'except path'
-#             pass
-#         simulation.aggregate_pv = AccountingCohorts(simulation.aggregate_pv)
-#         simulation.aggregate_pv_alt = AccountingCohorts(simulation.aggregate_pv_alt)
-#         
-#         ratio_base = simulation.compute_gen_imbalance(typ='net_transfers')
-#         ratio_alt = simulation.compute_gen_imbalance(typ='net_transfers', default=False)
-#         record.loc[year, "déséquilibre"] = ratio_base
-#         record.loc[year, 'déséquilibre_alt'] = ratio_alt
-#     print record.head(30).to_string()
-#     record.to_excel(xls+'imbalance_flux.xlsx', 'flux de déséquilibre')
-
-    for year in range(year_min, year_min+60):
-        print year
-        #On tente de tronquer la df au fil du temps
-        try:
-            simulation.population = simulation.population.drop(labels=year-1, level='year')
-            simulation.population_alt = simulation.population_alt.drop(labels=year-1, level='year')
-        except:
-            print 'except path'
-            pass
-        
-        taxes_list = ['tva', 'tipp', 'cot', 'irpp', 'impot', 'property']
-        payments_list = ['chomage', 'retraite', 'revsoc', 'maladie', 'educ']
-        
-        simulation.create_cohorts()
-        simulation.create_cohorts(default=False)
-
-        simulation.cohorts.compute_net_transfers(name = 'net_transfers', taxes_list = taxes_list, payments_list = payments_list)
-        simulation.create_present_values('net_transfers', default=True)
-        
-        simulation.cohorts_alt.loc[[x>=2075 for x in simulation.cohorts_alt.index.get_level_values(2)], 'cot'] *= (1+0.1)
-        simulation.cohorts_alt.compute_net_transfers(name = 'net_transfers', taxes_list = taxes_list, payments_list = payments_list)
-        simulation.create_present_values('net_transfers', default=False)
-
-#                     imbalance = simulation.compute_gen_imbalance(typ='net_transfers')
-        imbalance = simulation.compute_gen_imbalance(typ='net_transfers')
-        imbalance_alt = simulation.compute_gen_imbalance(typ='net_transfers', default=False)
-       
-        
-        record.loc[year, "déséquilibre"] = imbalance
-        record.loc[year, 'déséquilibre_alt'] = imbalance_alt
+    evolution, evolution_alt = _reform_evolution(simulation, year_min)
+    record = DataFrame(index=evolution.index)
+    record['déséquilibre'] = evolution['gen_imbalance']
+    record['déséquilibre_alt'] = evolution_alt['gen_imbalance']
     record.to_excel(xls+'imbalance_flux_ESP.xlsx', 'flux de déséquilibre')
     
 
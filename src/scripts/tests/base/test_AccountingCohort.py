@@ -25,6 +25,35 @@ def test_compute_ipl():
     
     assert precision == size_generation/ipl
     assert ipl == -10.0
+
+    # The reductions follow the edits of the columns, whatever the way they are made
+    past_gen_transfer = cohort3.indicator_terms('tax')['past']
+    cohort3['tax'] += 1
+    assert cohort3.indicator_terms('tax')['past'] == past_gen_transfer + len(cohort3.xs(2001, level = 'year'))
+    cohort3.loc[(0, 0, 2001), 'tax'] += 1000
+    assert cohort3.indicator_terms('tax')['past'] == past_gen_transfer + len(cohort3.xs(2001, level = 'year')) + 1000
+    assert cohort3.compute_ipl(typ = 'tax', net_gov_wealth = 10) == AccountingCohorts(cohort3.copy()).compute_ipl(typ = 'tax', net_gov_wealth = 10)
+    
+
+def test_break_down_ipl():
+    size_generation = 3
+    cohort = create_neutral_profiles_cohort(population = size_generation)
+    pv = cohort.aggregate_generation_present_value('tax')
+    pv['pop'] = cohort['pop']
+    broken_down = pv.break_down_ipl('tax', threshold = 60)
+    assert list(broken_down.columns.names) == [None, 'sex', 'age']
+    for year in [2001, 2050]:
+        assert broken_down.loc[year, ('tax', 1, 0)] == pv.get_value((0, 1, year), 'tax')
+        assert broken_down.loc[year, ('pop', 0, 60)] == pv.get_value((60, 0, year), 'pop')
+
+    # The threshold must be one of the ages, of the classes for instance
+    age_class = pv.create_age_class(step = 5, typ = 'tax')
+    for threshold in [62, 200]:
+        try:
+            age_class.break_down_ipl('tax', threshold = threshold)
+            raise AssertionError('%s is not an age' % threshold)
+        except Exception, e:
+            assert str(e) == '%s is not an age of the cohorts' % threshold
     
 
 def test_generation_extraction():
@@ -55,6 +84,32 @@ def test_generation_extraction():
         assert abs((1+g)**(count+(start-2001)) + generation.get_value((count, 1, start+count), 'tax')) == 0.0
         count +=1
 
+def test_lifetime_accounts():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2061)
+    profile = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+    cohort = DataCohorts(population)
+    cohort._fill(profile)
+    g = 0.05
+    cohort.proj_tax(g, 0, None, method = 'per_capita')
+    cohort = AccountingCohorts(cohort)
+
+    accounts = cohort.lifetime_accounts('tax', sex = 1)
+    assert list(accounts.index) == range(2001 - 100, 2061)
+    for start, age in [(2030, 0), (2030, 20), (2005, 80)]:
+        generation = cohort.extract_generation(start, typ = 'tax', age = age).xs(1, level = 'sex')['tax']
+        for (age_gen, year), value in generation.iteritems():
+            assert accounts.loc[year - age_gen, age_gen] == value
+    assert accounts[0].isnull().sum() == 100 and accounts[100].isnull().sum() == 100
+
+    # Discounted to the birth year, the generations born in the first year or after have the same accounts
+    r = 0.03
+    discounted = cohort.lifetime_accounts('tax', discount_rate = r, base = 'birth').xs(0, level = 'sex')
+    assert abs(discounted.loc[2030, 10] + (1+g)**39/(1+r)**10) < 1e-12
+    assert abs(discounted.loc[1991, 50] + (1+g)**40/(1+r)**40) < 1e-12
+    discounted = cohort.lifetime_accounts('tax', discount_rate = r, base = 2011).xs(0, level = 'sex')
+    assert abs(discounted.loc[2030, 10] + (1+g)**39/(1+r)**29) < 1e-12
+
+
 def test_create_age_class():
     """
     Testing the method to regroup age classes
@@ -77,6 +132,27 @@ def test_create_age_class():
 
 
 
+def test_age_class_breaks():
+    population = create_testing_population_dataframe(2001, 2003)
+    profile = create_constant_profiles_dataframe(population, tax = 1.0, sub=-0.5)
+    cohort = DataCohorts(population)
+    cohort._fill(profile)
+    pv = cohort.aggregate_generation_present_value('tax', discount_rate=0)
+    pv['pop'] = cohort['pop']
+
+    age_class = pv.create_age_class(step = 10, typ = 'tax')
+    pv.loc[(0, 1, 2001), 'tax'] += 10
+    assert pv.create_age_class(step = 10, typ = 'tax').get_value((0, 1, 2001), 'tax') == age_class.get_value((0, 1, 2001), 'tax') + 1
+    pv.loc[(0, 1, 2001), 'tax'] -= 10
+    assert (pv.create_age_class(typ = 'tax', breaks = range(0, 101, 10)) == age_class).all().all()
+
+    age_class = pv.create_age_class(typ = 'tax', breaks = [0, 18, 65])
+    assert sorted(age_class.index_sets['age']) == [0, 18, 65]
+    adults = pv.xs(2002, level = 'year').xs(1, level = 'sex').loc[18:64]
+    assert abs(age_class.get_value((18, 1, 2002), 'pop') - adults['pop'].sum()) < 1e-9
+    assert abs(age_class.get_value((18, 1, 2002), 'tax') - adults['tax'].sum()/adults['pop'].sum()) < 1e-9
+
+
 if __name__ == "__main__":
 #     test_compute_ipl()
 #     test_create_age_class()
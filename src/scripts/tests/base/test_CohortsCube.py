@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+'''
+Created on 18 oct. 2013
+
+@author: Mahdi Ben Jelloul, Jérôme SANTOUL
+'''
+import nose
+from numpy import abs as np_abs
+from src.lib.cohorts.cube import CohortsCube
+from src.lib.cohorts.data_cohorts import DataCohorts
+from src.lib.simulation import Simulation
+from src.scripts.tests.utils import (create_testing_population_dataframe,
+                                     create_empty_population_dataframe,
+                                     create_constant_profiles_dataframe)
+
+
+def test_frame_round_trip():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.05)
+    cube = CohortsCube.from_frame(population)
+    assert cube.shape == (101, 2, 60)
+    assert cube['pop'][0, 1, 59] == population.get_value((0, 1, 2060), 'pop')
+
+    frame = cube.to_frame(cls = DataCohorts)
+    assert (frame['pop'] == population['pop']).all()
+    assert frame._year_max == 2060
+
+
+def test_population_projection():
+    population = create_empty_population_dataframe(2001, 2061)
+    cube = CohortsCube.from_frame(population, columns = ['pop'])
+    n = 0.05
+    cube.population_project(100, method = 'exp_growth', growth_rate = n)
+    assert cube._year_max == 2101
+    assert cube['pop'][0, 0, 2081 - 2001] == (1+n)**(2082 - 2061 - 1)
+
+
+def test_present_values_match_frame():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.01)
+    profile = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+
+    results = []
+    for storage in ['frame', 'cube']:
+        simulation = Simulation()
+        simulation.set_storage(storage)
+        simulation.set_population(population)
+        simulation.set_profiles(profile)
+        simulation.set_population_projection(year_length=100, method="stable")
+        simulation.set_tax_projection(method="per_capita", rate=0.02)
+        simulation.set_growth_rate(0.02)
+        simulation.set_discount_rate(0.03)
+        simulation.create_cohorts()
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        results.append(simulation)
+
+    frame, cube = results
+    assert isinstance(cube.cohorts, CohortsCube)
+    pv = frame.aggregate_pv.to_cube(['net_transfers'])['net_transfers']
+    assert np_abs(pv - cube.aggregate_pv['net_transfers']).max() < 1e-9
+    assert abs(frame.compute_ipl('net_transfers') - cube.compute_ipl('net_transfers')) < 1e-6
+
+
+def test_lazy_profiles():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.01)
+    profile = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+    frame = DataCohorts(population)
+    frame._fill(profile)
+    cube = CohortsCube.from_frame(population, columns = ['pop'])
+    cube._fill(profile)
+
+    # The profiles are kept by (age, sex) and read as the filled frame
+    assert 'tax' not in cube._data
+    assert (cube['tax'] == frame.to_cube(['tax'])['tax']).all()
+
+    # Expanding a profile lets a reform edit some years without changing the clones
+    clone = cube.clone()
+    cube.expand('tax')[:, :, 10:] *= 2
+    assert cube['tax'][0, 0, 10] == -2 and cube['tax'][0, 0, 9] == -1
+    assert (clone['tax'] == -1).all()
+
+
+if __name__ == '__main__':
+    nose.core.runmodule(argv=[__file__, '-v', '-i test_*.py'])
@@ -36,6 +36,17 @@ def test_population_projection():
     assert test_value == control_value
 
 
+def test_population_projection_path():
+    population = create_empty_population_dataframe(2001, 2061)
+    cohorts = DataCohorts(data = population, columns = ['pop'])
+    # The rate is 1% from 2061 and 2% from 2081, the first projected year keeps the last population
+    cohorts.population_project(100, method = 'exp_growth', growth_rate = {2061: 0.01, 2081: 0.02})
+    assert cohorts._year_max == 2101
+    assert cohorts.get_value((0, 0, 2060), "pop") == cohorts.get_value((0, 0, 2061), "pop")
+    assert abs(cohorts.get_value((0, 1, 2080), "pop") - 1.01**19) < 1e-12
+    assert abs(cohorts.get_value((0, 1, 2083), "pop") - 1.01**19*1.02**3) < 1e-12
+
+
 def test_fill_cohort():   
     population = create_empty_population_dataframe(2001, 2061)
     profiles = create_constant_profiles_dataframe(population, tax = -1, subsidies = 0.5)
@@ -57,6 +68,25 @@ def test_compute_net_transfers():
     
     pass
 
+def test_compute_aggregates():
+    population = create_empty_population_dataframe(2001, 2061)
+    profiles = create_constant_profiles_dataframe(population, tax = 1, subsidies = 0.5, health = 0.25)
+    cohorts_test = DataCohorts(data = population, columns = ['pop'])
+    cohorts_test._fill(profiles, year = None)
+    cohorts_test.compute_net_transfers(taxes_list = ['tax'], payments_list = ['subsidies', 'health'],
+                                       weights = {'tax': 0.5})
+    assert cohorts_test.get_value((0,0,2060), 'net_transfers') == 0.5 - 0.5 - 0.25
+    assert 'total_taxes' not in cohorts_test.columns
+
+    cohorts_test.compute_aggregates({'social': {'subsidies': 1, 'health': 1}, 'reformed_tax': {'tax': 1.1}})
+    assert cohorts_test.get_value((0,1,2030), 'social') == 0.75
+    assert abs(cohorts_test.get_value((0,1,2030), 'reformed_tax') - 1.1) < 1e-12
+
+    cube = cohorts_test.to_cube(['pop'] + list(profiles.columns))
+    cube.compute_aggregates({'social': {'subsidies': 1, 'health': 1}})
+    assert (cube['social'] == 0.75).all()
+
+
 def test_tax_projection():
 
     population = create_empty_population_dataframe(2001, 2061)
@@ -124,6 +154,27 @@ def test_present_value():
         assert cohort3.get_value((count, 1, 2001), 'tax')*size_generation == res_control.get_value((count, 0, 2001), 'tax')
         count +=1
 
+def test_present_value_several_columns():
+    """
+    Testing the present values of several columns computed in a single pass
+    """
+    population = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.01)
+    profile = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+    cohort = DataCohorts(population)
+    cohort._fill(profile)
+    cohort.proj_tax(0.02, 0, None, method = 'per_capita')
+    
+    res = cohort.aggregate_generation_present_value(['tax', 'sub'], discount_rate=0.03)
+    for typ in ['tax', 'sub']:
+        control = cohort.aggregate_generation_present_value(typ, discount_rate=0.03)
+        assert abs(res[typ] - control[typ]).max() < 1e-10
+    
+    res = cohort.per_capita_generation_present_value(['tax', 'sub'], discount_rate=0.03)
+    assert list(res.columns) == ['tax', 'sub', 'pop']
+    q = 1.02*1.01/1.03
+    assert abs(res.get_value((0, 1, 2001), 'sub') - 0.5*(1 - q**60)/(1 - q)) < 1e-10
+
+
 if __name__ == "__main__":
     
 #     test_population_projection()
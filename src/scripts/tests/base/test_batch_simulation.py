@@ -0,0 +1,104 @@
+# -*- coding:utf-8 -*-
+'''
+Created on 18 oct. 2013
+
+@author: Mahdi Ben Jelloul, Jérôme SANTOUL
+'''
+import nose
+from src.lib.simulation import Simulation
+from src.lib.batch_simulation import BatchSimulation
+from src.scripts.tests.utils import (create_testing_population_dataframe,
+                                     create_constant_profiles_dataframe)
+
+
+def create_simulation(population, profiles, r, g, n, method, tail = False):
+    simulation = Simulation()
+    simulation.set_tail(tail)
+    simulation.set_population(population)
+    simulation.set_profiles(profiles)
+    simulation.set_year_length(100)
+    simulation.set_population_projection(year_length=100, method="exp_growth")
+    simulation.set_tax_projection(method=method, rate=g, inflation_rate=0.01,
+                                  typ=['tax'], payments_list=['sub'])
+    simulation.set_growth_rate(g)
+    simulation.set_discount_rate(r)
+    simulation.set_population_growth_rate(n)
+    simulation.set_gov_wealth(-10)
+    simulation.set_gov_spendings(5, compute=True)
+    return simulation
+
+
+def test_batch_matches_simulations():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.01)
+    profiles = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+    scenarios = {'discount_rate' : [0.03, 0.04, 0.02],
+                 'growth_rate' : [0.01, 0.02, 0.01],
+                 'population_growth_rate' : [0, 0.01, -0.01],
+                 'year_gov_spendings' : [5, 5, 5]}
+
+    for method, tail in [('per_capita', False), ('desynchronized', False), ('aggregate', False),
+                         ('per_capita', True), ('desynchronized', True), ('aggregate', True)]:
+        batch = BatchSimulation(create_simulation(population, profiles, 0.03, 0.01, 0, method, tail),
+                                taxes_list = ['tax'], payments_list = ['sub'], batch_size = 2)
+        batch.set_scenarios(scenarios)
+        ipl = batch.compute_ipl()
+        gen_imbalance = batch.compute_gen_imbalance()
+        assert len(ipl) == 3
+
+        for k, (r, g, n) in enumerate(zip(scenarios['discount_rate'], scenarios['growth_rate'],
+                                           scenarios['population_growth_rate'])):
+            simulation = create_simulation(population, profiles, r, g, n, method, tail)
+            simulation.create_cohorts()
+            simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+            simulation.create_present_values('net_transfers')
+            expected = simulation.compute_ipl('net_transfers')
+            assert abs(ipl[k] - expected) < 1e-9*abs(expected)
+            expected = simulation.compute_gen_imbalance('net_transfers')
+            assert abs(gen_imbalance[k] - expected) < 1e-9*abs(expected)
+
+
+def test_batch_rate_paths():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.01)
+    profiles = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+    n = {2001: 0.005, 2080: 0}
+    g = {2001: 0.01, 2030: 0.02}
+    scenarios = {'discount_rate' : [0.03, 0.04],
+                 'population_growth_rate' : [n, {2001: 0.01}],
+                 'year_gov_spendings' : [5, 5]}
+
+    batch = BatchSimulation(create_simulation(population, profiles, 0.03, g, n, 'per_capita'),
+                            taxes_list = ['tax'], payments_list = ['sub'])
+    batch.set_scenarios(scenarios)
+    ipl = batch.compute_ipl()
+    gen_imbalance = batch.compute_gen_imbalance()
+
+    for k, (r, n) in enumerate(zip(scenarios['discount_rate'], scenarios['population_growth_rate'])):
+        simulation = create_simulation(population, profiles, r, g, n, 'per_capita')
+        simulation.create_cohorts()
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        expected = simulation.compute_ipl('net_transfers')
+        assert abs(ipl[k] - expected) < 1e-9*abs(expected)
+        expected = simulation.compute_gen_imbalance('net_transfers')
+        assert abs(gen_imbalance[k] - expected) < 1e-9*abs(expected)
+
+
+def test_batch_default_spendings():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.01)
+    profiles = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+    batch = BatchSimulation(create_simulation(population, profiles, 0.03, 0.01, 0, 'per_capita'),
+                            taxes_list = ['tax'], payments_list = ['sub'])
+    # The spendings of the reference year are actualized with the rates of the scenario
+    batch.set_scenarios({'discount_rate' : [0.05]})
+    ipl = batch.compute_ipl()
+
+    simulation = create_simulation(population, profiles, 0.05, 0.01, 0, 'per_capita')
+    simulation.create_cohorts()
+    simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+    simulation.create_present_values('net_transfers')
+    expected = simulation.compute_ipl('net_transfers')
+    assert abs(ipl[0] - expected) < 1e-9*abs(expected)
+
+
+if __name__ == '__main__':
+    nose.core.runmodule(argv=[__file__, '-v', '-i test_*.py'])
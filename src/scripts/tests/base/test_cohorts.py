@@ -9,8 +9,10 @@
 
 import nose
 from src.lib.cohorts.cohort import Cohorts
+from src.lib.cohorts.cube import CohortsCube
 from src.lib.cohorts.data_cohorts import DataCohorts
-from numpy import array
+from src.lib.cohorts.factors import factor_table
+from numpy import array, isnan, NaN
 from src.scripts.tests.utils import (create_testing_population_dataframe,
                                      create_empty_population_dataframe,
                                      create_constant_profiles_dataframe,
@@ -53,6 +55,17 @@ def test_dsct():
     
 
 
+def test_factors():
+    population = create_empty_population_dataframe(2001, 2061)
+    cohorts = Cohorts(data = population, columns = ['pop']) 
+    cohorts.gen_grth(0.02)
+    cohorts.gen_actualization(0.02, 0.05)
+    assert abs(cohorts.get_value((50, 1, 2060), 'grth') - 1.02**59) < 1e-12
+    # The growth factor of the actualization is not raised to the power of the years
+    assert abs(cohorts.get_value((50, 1, 2060), 'actualization') - 1.02/1.05**59) < 1e-12
+    assert factor_table.growth(0.02, 60) is factor_table.growth(0.02, 60)
+
+
 def test_filter_value():
     """
     Testing the method to filter data from a given cohort
@@ -73,9 +86,75 @@ def test_filter_value():
     while count <= 2060:
         assert abs(cohort_filtered.get_value((0, 1, count), 'tax') + (1+g)**(count-2001)) == 0.0
         count +=5
+    assert len(cohort_filtered) == 100*2*12
+
+    # A single age is a contiguous block of the sorted cohort
+    cohort_filtered = cohort.filter_value(age = [30], sex = 1, typ = 'pop')
+    assert list(cohort_filtered.index.get_level_values('year')) == list(range(cohort._year_min, cohort._year_max + 1))
+    assert (cohort_filtered['pop'].values == cohort.xs((30, 1), level = ['age', 'sex'])['pop'].values).all()
 
 
 
+def test_index_sets():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2011)
+    cohort = DataCohorts(population)
+    assert cohort.index_sets['sex'] == set([0, 1])
+    assert (cohort._agemin, cohort._agemax) == (0, 100)
+    assert cohort.index_sets['year'] == set(population.index.get_level_values('year'))
+
+    # The values of the levels no longer used by a selection are dropped
+    selected = DataCohorts(population.iloc[:5])
+    assert selected.index_sets['age'] == set([0])
+    assert selected._year_max == population.index.get_level_values('year')[4]
+
+    # The missing entries of a level are kept as NaN
+    missing = population.iloc[:5].reset_index()
+    missing.loc[0, 'sex'] = NaN
+    cohort = DataCohorts(missing.set_index(['age', 'sex', 'year']))
+    assert len(cohort.index_sets['sex']) == 2
+    assert 0 in cohort.index_sets['sex'] and isnan(list(cohort.index_sets['sex'])).any()
+
+    # and are not selected by the filters on the level
+    filtered = cohort.filter_value(sex = 0, typ = 'pop')
+    assert len(filtered) == 4
+    assert (filtered['pop'].values == population['pop'].values[1:5]).all()
+
+
+def test_version():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2011)
+    cohort = DataCohorts(population)
+    cohort.gen_dsct(0.03)
+    versions = [cohort.version]
+    cohort['tax'] = 1.0
+    versions.append(cohort.version)
+    cohort.loc[(0, 0, 2001), 'tax'] = 2
+    versions.append(cohort.version)
+    cohort.at[(0, 0, 2002), 'tax'] = 2
+    versions.append(cohort.version)
+    cohort['tax'] *= 2
+    versions.append(cohort.version)
+    column = cohort['tax']
+    column[:5] = 0
+    versions.append(cohort.version)
+    cohort.fillna(0, inplace = True)
+    versions.append(cohort.version)
+    assert all(version < following for version, following in zip(versions, versions[1:]))
+
+    # The derived columns are evicted and restored without changing the version
+    version = cohort.version
+    cohort.evict_derived()
+    cohort.restore_derived()
+    cohort['pop'].sum()
+    assert cohort.version == version
+
+    cube = CohortsCube.from_frame(population, columns = ['pop'])
+    version = cube.version
+    cube.gen_dsct(0.03)
+    assert cube.version == version
+    cube.expand('pop')[0, 0, 0] = 0
+    assert cube.version == version + 1
+
+
 if __name__ == '__main__':
 
 #     test_population_projection()
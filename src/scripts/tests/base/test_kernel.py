@@ -0,0 +1,56 @@
+# -*- coding:utf-8 -*-
+'''
+Created on 18 oct. 2013
+
+@author: Mahdi Ben Jelloul, Jérôme SANTOUL
+'''
+import nose
+from numpy import abs as np_abs
+from src.lib.simulation import Simulation
+from src.scripts.tests.utils import (create_testing_population_dataframe,
+                                     create_constant_profiles_dataframe)
+
+
+def test_reform_scoring():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2031, rate=0.01)
+    profiles = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+
+    simulation = Simulation()
+    simulation.set_population(population)
+    simulation.set_profiles(profiles)
+    simulation.set_population_projection(year_length=80, method="exp_growth")
+    simulation.set_tax_projection(method="per_capita", rate=0.01)
+    simulation.set_growth_rate(0.01)
+    simulation.set_discount_rate(0.03)
+    simulation.set_population_growth_rate(0.005)
+    simulation.create_cohorts()
+    simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+    simulation.create_present_values('net_transfers')
+    ipl = simulation.compute_ipl('net_transfers')
+    percapita_pv = simulation.percapita_pv['net_transfers'].copy()
+
+    # Halving the payments from 2015 on for the people older than 60
+    cohorts = simulation.cohorts
+    selection = ((cohorts.index.get_level_values('year') >= 2015) &
+                 (cohorts.index.get_level_values('age') > 60))
+    reform = cohorts['sub']*selection/2
+    d_ipl, d_accounts = simulation.score_reform(reform)
+    # The kernel is built again only when the cohorts are edited
+    kernel = simulation.create_response_kernel()
+    simulation.score_reform(reform)
+    assert simulation.create_response_kernel() is kernel
+
+    cohorts['net_transfers'] += reform
+    assert simulation.create_response_kernel() is not kernel
+    simulation.invalidate('net_transfers')
+    simulation.create_present_values('net_transfers')
+    assert abs(simulation.compute_ipl('net_transfers') - ipl - d_ipl) < 1e-9*abs(ipl)
+
+    d_percapita = simulation.percapita_pv['net_transfers'] - percapita_pv
+    assert abs(d_accounts.loc[1950, 1] - d_percapita.get_value((51, 1, 2001))) < 1e-9
+    assert abs(d_accounts.loc[2020, 0] - d_percapita.get_value((0, 0, 2020))) < 1e-9
+    assert np_abs(d_accounts.loc[2031:].values).max() == 0
+
+
+if __name__ == '__main__':
+    nose.core.runmodule(argv=[__file__, '-v', '-i test_*.py'])
@@ -0,0 +1,44 @@
+# -*- coding:utf-8 -*-
+'''
+Created on 18 oct. 2013
+
+@author: Mahdi Ben Jelloul, Jérôme SANTOUL
+'''
+import nose
+from numpy import isnan
+from src.lib.population import PopulationRepository
+from src.scripts.tests.utils import create_testing_population_dataframe
+
+
+def test_population_repository():
+    low = create_testing_population_dataframe(year_start=2001, year_end=2031)
+    high = create_testing_population_dataframe(year_start=2001, year_end=2041, rate=0.01)
+    repository = PopulationRepository({'projpop0760_FECbasESPbasMIGbas': low,
+                                       'projpop0760_FEChautESPhautMIGhaut': high})
+
+    assert repository.scenarios == ['projpop0760_FECbasESPbasMIGbas', 'projpop0760_FEChautESPhautMIGhaut']
+    assert '/projpop0760_FECbasESPbasMIGbas' in repository.choices()
+    assert repository.values.shape == (2, 101, 2, 40)
+    # The years a scenario does not cover are missing
+    assert isnan(repository.cube('projpop0760_FECbasESPbasMIGbas')[:, :, 30:]).all()
+
+    for name, population in [('projpop0760_FECbasESPbasMIGbas', low), ('/projpop0760_FEChautESPhautMIGhaut', high)]:
+        frame = repository.frame(name)
+        assert frame is not repository.frame(name)
+        assert frame.equals(population)
+        assert (frame.dtypes == population.dtypes).all()
+
+        # Modifying a loaded population does not change the next loads
+        frame['pop'] *= 2
+        frame.drop(frame.index[:10], inplace = True)
+        assert repository.frame(name).equals(population)
+
+    try:
+        repository.frame('projpop0760_FECcentESPcentMIGcent')
+        assert False
+    except Exception, e:
+        assert 'projpop0760_FECcentESPcentMIGcent' in str(e)
+
+
+if __name__ == '__main__':
+    nose.core.runmodule(argv=[__file__, '-v', '-i test_*.py'])
@@ -0,0 +1,98 @@
+# -*- coding:utf-8 -*-
+'''
+Created on 18 oct. 2013
+
+@author: Mahdi Ben Jelloul, Jérôme SANTOUL
+'''
+import nose
+from numpy import abs as np_abs
+from src.lib.cohorts.cube import CohortsCube
+from src.lib.cohorts.data_cohorts import DataCohorts
+from src.lib.cohorts.reform import Reform
+from src.lib.simulation import Simulation
+from src.scripts.tests.utils import (create_testing_population_dataframe,
+                                     create_constant_profiles_dataframe)
+
+
+def test_reform_masks():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2031)
+    profiles = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+    frame = DataCohorts(population)
+    frame._fill(profiles)
+    cube = CohortsCube.from_frame(population, columns = ['pop'])
+    cube._fill(profiles)
+
+    reforms = [Reform('sub', years=(2015, None), factor=0.5),
+               Reform('tax', ages=(20, 60), sexes=[1], years=2020, shift=-1)]
+    for reform in reforms:
+        reform.apply(frame)
+        reform.apply(cube)
+    assert (frame.to_cube(['sub', 'tax'])['sub'] == cube['sub']).all()
+    assert (frame.to_cube(['sub', 'tax'])['tax'] == cube['tax']).all()
+    assert frame.get_value((0, 0, 2014), 'sub') == 0.5 and frame.get_value((0, 0, 2015), 'sub') == 0.25
+    assert frame.get_value((20, 1, 2020), 'tax') == -2 and frame.get_value((61, 1, 2020), 'tax') == -1
+    assert frame.get_value((20, 0, 2020), 'tax') == -1 and frame.get_value((20, 1, 2021), 'tax') == -1
+
+
+def create_simulation(population, profiles, storage, discount_rate, reforms = None):
+    simulation = Simulation()
+    simulation.set_storage(storage)
+    simulation.set_population(population)
+    simulation.set_profiles(profiles)
+    simulation.set_population_projection(year_length=100, method="stable")
+    simulation.set_tax_projection(method="per_capita", rate=0.01)
+    simulation.set_growth_rate(0.01)
+    simulation.set_discount_rate(discount_rate)
+    simulation.create_cohorts()
+    for reform in reforms or []:
+        reform.apply(simulation.cohorts)
+    simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+    simulation.create_all_present_values()
+    return simulation
+
+
+def test_apply_reforms():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2031, rate=0.01)
+    profiles = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+    reforms = [Reform('sub', years=(2015, 2040), factor=0.5),
+               Reform('tax', ages=(20, 60), sexes=1, years=2030, shift=-0.1)]
+
+    for storage in ['frame', 'cube']:
+        simulation = create_simulation(population, profiles, storage, 0.03)
+        reformed = create_simulation(population, profiles, storage, 0.03, reforms)
+
+        # Only the generations touched by the reforms are computed again
+        ipl = simulation.compute_ipl('net_transfers')
+        simulation.apply_reforms(reforms)
+        assert simulation.compute_ipl('net_transfers') == ipl
+        for typ in ['net_transfers', 'tax', 'sub']:
+            ipl_alt = simulation.compute_ipl(typ, default = False)
+            assert abs(ipl_alt - reformed.compute_ipl(typ)) < 1e-9*abs(ipl_alt)
+            pv = simulation.percapita_pv_alt.to_cube([typ])[typ] - reformed.percapita_pv.to_cube([typ])[typ]
+            assert np_abs(pv).max() < 1e-9
+        # The alternative present values are cached
+        aggregate_pv = simulation.aggregate_pv_alt
+        simulation.create_all_present_values(default = False)
+        assert simulation.aggregate_pv_alt is aggregate_pv
+
+
+def test_apply_reforms_alternative_hypotheses():
+    population = create_testing_population_dataframe(year_start=2001, year_end=2031, rate=0.01)
+    profiles = create_constant_profiles_dataframe(population, tax=-1, sub=0.5)
+    reforms = [Reform('sub', years=(2015, 2040), factor=0.5)]
+
+    # The alternative rates and wealth are those of the reformed simulation
+    simulation = create_simulation(population, profiles, 'frame', 0.03)
+    simulation.set_discount_rate(0.04, default = False)
+    simulation.set_gov_wealth(-5, default = False)
+    simulation.apply_reforms(reforms)
+    reformed = create_simulation(population, profiles, 'frame', 0.04, reforms)
+    reformed.set_gov_wealth(-5)
+    for typ in ['net_transfers', 'tax', 'sub']:
+        ipl_alt = simulation.compute_ipl(typ, default = False)
+        assert abs(ipl_alt - reformed.compute_ipl(typ)) < 1e-9*abs(ipl_alt)
+    assert simulation.discount_rate == 0.03
+
+
+if __name__ == '__main__':
+    nose.core.runmodule(argv=[__file__, '-v', '-i test_*.py'])
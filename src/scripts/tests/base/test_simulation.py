@@ -14,6 +14,7 @@ from src.scripts.tests.utils import (create_testing_population_dataframe,
 import os
 from src.lib.simulation import Simulation
 from src.lib.cohorts.accounting_cohorts import AccountingCohorts
+from src.lib.cohorts.reform import Reform
 from pandas import read_csv, HDFStore, concat, ExcelFile, DataFrame, MultiIndex
 from numpy import array, hstack, arange, NaN
 import matplotlib.pyplot as plt
@@ -51,6 +52,483 @@ def test_simulation_creation():
 
 
 
+def test_rate_paths():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2061)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=1)
+
+    results = []
+    for g, r in [(0.01, 0.03), ({2001: 0.01}, {2001: 0.03, 2030: 0.03})]:
+        simulation = Simulation()
+        simulation.set_population(population_dataframe)
+        simulation.set_profiles(profiles_dataframe)
+        simulation.set_year_length(100)
+        simulation.set_population_projection(year_length=100, method="stable")
+        simulation.set_tax_projection(method="per_capita", rate=g)
+        simulation.set_growth_rate(g)
+        simulation.set_discount_rate(r)
+        simulation.set_gov_spendings(10, compute=True)
+        simulation.create_cohorts()
+        simulation.create_present_values('tax')
+        results.append((simulation.compute_ipl('tax'), simulation.net_gov_spendings))
+    assert abs(results[0][0] - results[1][0]) < 1e-6*abs(results[0][0])
+    assert abs(results[0][1] - results[1][1]) < 1e-9*abs(results[0][1])
+
+    simulation.set_growth_rate({2001: 0, 2011: 0.02})
+    simulation.create_cohorts()
+    assert abs(simulation.cohorts.get_value((0, 0, 2020), 'grth') - 1.02**10) < 1e-12
+    assert simulation.cohorts.get_value((0, 0, 2010), 'grth') == 1
+
+
+def test_actualization():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=1)
+    g, r = 0.01, 0.03
+    simulation = Simulation()
+    simulation.set_year_length(100)
+    simulation.set_population(population_dataframe)
+    simulation.set_profiles(profiles_dataframe)
+    simulation.set_population_projection(year_length=100, method="stable")
+    simulation.set_tax_projection(method="per_capita", rate=g)
+    simulation.set_growth_rate(g)
+    simulation.set_discount_rate(r)
+    simulation.set_gov_spendings(10, compute=True)
+    simulation.create_cohorts()
+    simulation.create_present_values('tax')
+    gen_imbalance = simulation.compute_gen_imbalance('tax')
+
+    # The spendings are actualized with ((1+g)/(1+r))**t
+    spendings = sum(10*((1+g)/(1+r))**t for t in range(1, simulation.year_length + 1))
+    assert abs(simulation.net_gov_spendings - spendings) < 1e-9*spendings
+
+    # The unborn generations are actualized with (1+g)/(1+r)**t
+    aggregate_pv, percapita_pv = simulation.aggregate_pv, simulation.percapita_pv
+    year_min, year_max = aggregate_pv._year_min, aggregate_pv._year_max
+    unborn = simulation.cohorts.xs(0, level = 'age')['pop'].sum(level = 'year').loc[year_min + 1:year_max].values
+    actualization = (1+g)/(1+r)**arange(len(unborn))
+    future = simulation.net_gov_spendings - simulation.net_gov_wealth - aggregate_pv.xs(year_min, level = 'year')['tax'].sum()
+    n_1 = future/(actualization*unborn).sum()
+    n_0 = (percapita_pv.get_value((0, 0, year_min), 'tax') + percapita_pv.get_value((0, 1, year_min), 'tax'))/2
+    assert abs(gen_imbalance - n_1/n_0) < 1e-9*abs(gen_imbalance)
+
+
+def test_stages():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+
+    def run(simulation, r):
+        simulation.set_discount_rate(r)
+        simulation.create_cohorts()
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        return simulation.compute_ipl('net_transfers')
+
+    simulation = Simulation()
+    simulation.set_population(population_dataframe)
+    simulation.set_profiles(profiles_dataframe)
+    simulation.set_population_projection(year_length=100, method="stable")
+    simulation.set_tax_projection(method="per_capita", rate=0.01)
+    simulation.set_growth_rate(0.01)
+    run(simulation, 0.02)
+    projected_taxes = simulation._stages[True]['taxes'][1]
+    ipl_base = simulation.compute_ipl('net_transfers')
+    simulation.set_gov_wealth(-10)
+    assert simulation.compute_ipl('net_transfers') == ipl_base + 10
+
+    ipl = run(simulation, 0.03)
+    # The projections do not depend on the discount rate
+    assert simulation._stages[True]['taxes'][1] is projected_taxes
+
+    fresh = Simulation()
+    fresh.set_population(population_dataframe)
+    fresh.set_profiles(profiles_dataframe)
+    fresh.set_population_projection(year_length=100, method="stable")
+    fresh.set_tax_projection(method="per_capita", rate=0.01)
+    fresh.set_growth_rate(0.01)
+    fresh.set_gov_wealth(-10)
+    assert abs(run(fresh, 0.03) - ipl) < 1e-9*abs(ipl)
+
+    # The growth rate does not change the population projection
+    population = simulation._stages[True]['population'][1]
+    simulation.set_growth_rate(0.02)
+    run(simulation, 0.03)
+    assert simulation._stages[True]['taxes'][1] is not projected_taxes
+    assert simulation._stages[True]['population'][1] is population
+    assert simulation.cohorts.get_value((0, 0, 2011), 'grth') == 1.02**10
+
+
+def test_stages_in_place_edits():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+
+    for storage in ['frame', 'cube']:
+        simulation = Simulation()
+        simulation.set_storage(storage)
+        simulation.set_population(population_dataframe)
+        simulation.set_profiles(profiles_dataframe)
+        simulation.set_population_projection(year_length=100, method="stable")
+        simulation.set_tax_projection(method="per_capita", rate=0.01)
+        simulation.set_growth_rate(0.01)
+        simulation.set_discount_rate(0.03)
+        simulation.create_cohorts()
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        ipl = simulation.compute_ipl('net_transfers')
+        aggregate_pv = simulation.aggregate_pv
+
+        # Nothing changed, the present values are not computed again
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        assert simulation.aggregate_pv is aggregate_pv
+
+        # The net transfers are doubled in place
+        simulation.cohorts['net_transfers'] = simulation.cohorts['net_transfers']*2
+        simulation.create_present_values('net_transfers')
+        assert abs(simulation.compute_ipl('net_transfers') - 2*ipl) < 1e-9*abs(ipl)
+
+        # The payments are halved from 2015 with an indexer, then the net transfers are combined again
+        if storage == 'frame':
+            years = simulation.cohorts.index.get_level_values('year')
+            simulation.cohorts.loc[years >= 2015, 'sub'] *= 0.5
+        else:
+            simulation.cohorts.expand('sub')[:, :, 2015 - 2001:] *= 0.5
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        reformed = simulation.compute_ipl('net_transfers')
+
+        fresh = Simulation()
+        fresh.set_storage(storage)
+        fresh.set_population(population_dataframe)
+        fresh.set_profiles(profiles_dataframe)
+        fresh.set_population_projection(year_length=100, method="stable")
+        fresh.set_tax_projection(method="per_capita", rate=0.01)
+        fresh.set_growth_rate(0.01)
+        fresh.set_discount_rate(0.03)
+        fresh.create_cohorts()
+        Reform('sub', years=(2015, None), factor=0.5).apply(fresh.cohorts)
+        fresh.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        fresh.create_present_values('net_transfers')
+        expected = fresh.compute_ipl('net_transfers')
+        assert abs(reformed - expected) < 1e-9*abs(expected)
+        assert abs(reformed - ipl) > 1e-3*abs(ipl)
+
+        # The cached indicators follow the edits of the present values
+        gen_imbalance = simulation.compute_gen_imbalance('net_transfers')
+        if storage == 'frame':
+            simulation.aggregate_pv.loc[(0, 0, 2001), 'net_transfers'] += 1000
+        else:
+            simulation.aggregate_pv.expand('net_transfers')[0, 0, 0] += 1000
+        assert abs(simulation.compute_ipl('net_transfers') - reformed + 1000) < 1e-9*abs(reformed)
+        assert simulation.compute_gen_imbalance('net_transfers') != gen_imbalance
+
+
+def test_age_class_copy():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2061, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+    simulation = Simulation()
+    simulation.set_population(population_dataframe)
+    simulation.set_profiles(profiles_dataframe)
+    simulation.set_population_projection(year_length=100, method="stable")
+    simulation.set_tax_projection(method="per_capita", rate=0.01)
+    simulation.set_growth_rate(0.01)
+    simulation.set_discount_rate(0.03)
+    simulation.create_cohorts()
+    simulation.create_all_present_values()
+
+    age_class = simulation.create_age_class(typ = ['tax', 'sub'], step = 5)
+    expected, types = age_class.copy(), list(age_class._types)
+    # The caller edits the age classes it gets, the next ones are not changed
+    age_class['tax'] *= 0
+    age_class._types = ['tax']
+    again = simulation.create_age_class(typ = ['tax', 'sub'], step = 5)
+    assert (again == expected).all().all()
+    assert again._types == types
+
+
+def test_base_year_evolution():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2031, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+    ages = profiles_dataframe.index.get_level_values('age')
+    profiles_dataframe['tax'] = -1 - (ages > 20)*(ages < 65)*0.02*ages
+    profiles_dataframe['sub'] = 0.5 + (ages > 60)*0.01*ages
+    years = range(2001, 2011)
+
+    def create_simulation(population, method):
+        simulation = Simulation()
+        simulation.set_population(population)
+        simulation.set_profiles(profiles_dataframe)
+        simulation.set_population_projection(year_length=50, method="exp_growth")
+        simulation.set_tax_projection(method=method, rate=0.01, inflation_rate=0.02,
+                                      typ=['tax'], payments_list=['sub'])
+        simulation.set_growth_rate(0.01)
+        simulation.set_discount_rate(0.03)
+        simulation.set_population_growth_rate(0.005)
+        simulation.set_gov_wealth(-10)
+        simulation.set_gov_spendings(20)
+        simulation.create_cohorts()
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        return simulation
+
+    for method in ['per_capita', 'desynchronized']:
+        simulation = create_simulation(population_dataframe, method)
+        evolution = simulation.compute_base_year_evolution('net_transfers', years, taxes_list = ['tax'], payments_list = ['sub'])
+
+        for year in [2001, 2004, 2010]:
+            population = population_dataframe.reset_index()
+            population = population[population.year >= year].set_index(['age', 'sex', 'year'])
+            rerun = create_simulation(population, method)
+            rerun.create_present_values('net_transfers')
+            for name, value in [('ipl', rerun.compute_ipl('net_transfers')),
+                                ('precision', rerun.compute_ipl('net_transfers', precision = True)),
+                                ('gen_imbalance', rerun.compute_gen_imbalance('net_transfers'))]:
+                assert abs(evolution.loc[year, name] - value) < 1e-9*abs(value)
+
+
+def test_derivatives():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2031, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+    ages = profiles_dataframe.index.get_level_values('age')
+    profiles_dataframe['tax'] = -1 - (ages > 20)*(ages < 65)*0.02*ages
+
+    def run(r=0.03, g=0.01, n=0.005, pi=0.02, derivatives=False):
+        simulation = Simulation()
+        simulation.set_population(population_dataframe)
+        simulation.set_profiles(profiles_dataframe)
+        simulation.set_year_length(80)
+        simulation.set_population_projection(year_length=80, method="exp_growth")
+        simulation.set_tax_projection(method="desynchronized", rate=g, inflation_rate=pi,
+                                      typ=['tax'], payments_list=['sub'])
+        simulation.set_growth_rate(g)
+        simulation.set_discount_rate(r)
+        simulation.set_population_growth_rate(n)
+        simulation.set_gov_wealth(-10)
+        simulation.set_gov_spendings(5, compute=True)
+        simulation.create_cohorts()
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        if derivatives:
+            return simulation.compute_derivatives('net_transfers', taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        return array([simulation.compute_ipl('net_transfers'), simulation.compute_gen_imbalance('net_transfers')])
+
+    derivatives = run(derivatives = True)
+    epsilon = 1e-6
+    for name, parameter in [('discount_rate', 'r'), ('growth_rate', 'g'),
+                            ('population_growth_rate', 'n'), ('inflation_rate', 'pi')]:
+        base = {'r': 0.03, 'g': 0.01, 'n': 0.005, 'pi': 0.02}
+        up, down = dict(base), dict(base)
+        up[parameter] += epsilon
+        down[parameter] -= epsilon
+        finite_differences = (run(**up) - run(**down))/(2*epsilon)
+        for column, value in zip(['ipl', 'gen_imbalance'], finite_differences):
+            assert abs(derivatives.loc[name, column] - value) < 1e-5*abs(value)
+
+    # The derivatives of the alternative set use its own rates, wealth and spendings
+    simulation = Simulation()
+    simulation.set_population(population_dataframe)
+    simulation.set_profiles(profiles_dataframe)
+    simulation.set_year_length(80)
+    simulation.set_population_projection(year_length=80, method="exp_growth")
+    simulation.set_tax_projection(method="desynchronized", rate=0.01, inflation_rate=0.02,
+                                  typ=['tax'], payments_list=['sub'])
+    simulation.set_population(population_dataframe, default=False)
+    simulation.set_growth_rate(0.01, default=False)
+    simulation.set_discount_rate(0.04, default=False)
+    simulation.set_population_growth_rate(0.005, default=False)
+    simulation.set_gov_wealth(-10, default=False)
+    simulation.set_gov_spendings(5, default=False, compute=True)
+    simulation.create_cohorts(default=False)
+    simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'], default=False)
+    alternative = simulation.compute_derivatives('net_transfers', taxes_list = ['tax'], payments_list = ['sub'],
+                                                 default=False)
+    expected = run(r=0.04, derivatives=True)
+    assert (abs(alternative - expected) <= 1e-9*abs(expected)).all().all()
+
+
+def test_adapt_horizon():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2021, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+
+    def create_simulation(year_length, method):
+        simulation = Simulation()
+        simulation.set_population(population_dataframe)
+        simulation.set_profiles(profiles_dataframe)
+        simulation.set_population_projection(year_length=year_length, method="exp_growth")
+        simulation.set_tax_projection(method=method, rate=0.01, inflation_rate=0.02,
+                                      typ=['tax'], payments_list=['sub'])
+        simulation.set_growth_rate(0.01)
+        simulation.set_discount_rate(0.06)
+        simulation.set_population_growth_rate(0.005)
+        simulation.set_gov_wealth(-10)
+        simulation.create_cohorts()
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        return simulation
+
+    for method in ['per_capita', 'desynchronized']:
+        simulation = create_simulation(40, method)
+        year_length = simulation.adapt_horizon('net_transfers', 1e-4, taxes_list = ['tax'], payments_list = ['sub'], block = 20)
+        assert simulation.cohorts._year_max == 2001 + year_length
+        ipl = simulation.compute_ipl('net_transfers')
+
+        # The present values are the ones of a projection created with this horizon
+        adapted = create_simulation(year_length, method)
+        assert abs(adapted.compute_ipl('net_transfers') - ipl) < 1e-9*abs(ipl)
+        # The last block changed the liability by less than the tolerance, the previous one did not
+        assert year_length > 40
+        shorter = create_simulation(year_length - 20, method).compute_ipl('net_transfers')
+        assert abs(shorter - ipl) < 1e-4*abs(ipl)
+        if year_length > 60:
+            shortest = create_simulation(year_length - 40, method).compute_ipl('net_transfers')
+            assert abs(shortest - shorter) > 1e-4*abs(shorter)
+
+
+
+def test_tail():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2021, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+
+    def create_simulation(year_length, method, tail):
+        simulation = Simulation()
+        simulation.set_population(population_dataframe)
+        simulation.set_profiles(profiles_dataframe)
+        simulation.set_population_projection(year_length=year_length, method="exp_growth")
+        simulation.set_tax_projection(method=method, rate=0.01, inflation_rate=0.02,
+                                      typ=['tax'], payments_list=['sub'])
+        simulation.set_growth_rate(0.01)
+        simulation.set_discount_rate(0.06)
+        simulation.set_population_growth_rate(0.005)
+        simulation.set_gov_wealth(-10)
+        simulation.set_tail(tail)
+        simulation.create_cohorts()
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        return simulation
+
+    # A short horizon with the tail gives the results of a very long one
+    for method in ['per_capita', 'desynchronized', 'aggregate']:
+        short = create_simulation(40, method, True)
+        long = create_simulation(600, method, False)
+        ipl = long.compute_ipl('net_transfers')
+        assert abs(short.compute_ipl('net_transfers') - ipl) < 1e-8*abs(ipl)
+        gen_imbalance = long.compute_gen_imbalance('net_transfers')
+        assert abs(short.compute_gen_imbalance('net_transfers') - gen_imbalance) < 1e-8*abs(gen_imbalance)
+        accounts = short.percapita_pv['net_transfers']
+        difference = accounts - long.percapita_pv['net_transfers'].reindex(accounts.index)
+        assert abs(difference).max() < 1e-8*abs(accounts).max()
+
+
+
+def test_memory_budget():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2021, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+    simulation = Simulation()
+    simulation.set_population(population_dataframe)
+    simulation.set_profiles(profiles_dataframe)
+    simulation.set_population_projection(year_length=100, method="stable")
+    simulation.set_tax_projection(method="per_capita", rate=0.02)
+    simulation.set_growth_rate(0.02)
+    simulation.set_discount_rate(0.03)
+    simulation.create_cohorts()
+    simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+    simulation.create_present_values('net_transfers')
+    ipl = simulation.compute_ipl('net_transfers')
+    dsct = simulation.cohorts['dsct'].copy()
+
+    # The cached stages and the accounting results hold no derived column
+    report = simulation.memory_report()
+    assert list(report[report['derived']].index) == [('cohorts', 'grth'), ('cohorts', 'dsct')]
+
+    simulation.set_memory_budget(0)
+    assert 'dsct' not in simulation.cohorts.columns
+    assert simulation.memory_report()['bytes'].sum() < report['bytes'].sum()
+    # An evicted column is computed again when it is read
+    assert (simulation.cohorts['dsct'] == dsct).all()
+    simulation.create_present_values('net_transfers')
+    assert simulation.compute_ipl('net_transfers') == ipl
+
+
+def test_precision():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2021, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+    for storage in ['frame', 'cube']:
+        simulation = Simulation()
+        simulation.set_storage(storage)
+        simulation.set_population(population_dataframe)
+        simulation.set_profiles(profiles_dataframe)
+        simulation.set_population_projection(year_length=100, method="stable")
+        simulation.set_tax_projection(method="per_capita", rate=0.02)
+        simulation.set_growth_rate(0.02)
+        simulation.set_discount_rate(0.03)
+        simulation.create_cohorts()
+        size = simulation.memory_report()['bytes'].sum()
+
+        simulation.set_precision('float32')
+        simulation.create_cohorts()
+        assert simulation.memory_report()['bytes'].sum() < size
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        assert simulation.cohorts['pop'].dtype == 'float32'
+        assert simulation.cohorts['net_transfers'].dtype == 'float32'
+        # The present values are summed in double precision
+        assert simulation.aggregate_pv['net_transfers'].dtype == 'float64'
+        assert (simulation.compute_precision_drift('net_transfers') < 1e-6).all()
+
+
+def test_all_present_values():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2021, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+    for storage in ['frame', 'cube']:
+        simulation = Simulation()
+        simulation.set_storage(storage)
+        simulation.set_population(population_dataframe)
+        simulation.set_profiles(profiles_dataframe)
+        simulation.set_population_projection(year_length=100, method="stable")
+        simulation.set_tax_projection(method="per_capita", rate=0.02)
+        simulation.set_growth_rate(0.02)
+        simulation.set_discount_rate(0.03)
+        simulation.create_cohorts()
+        simulation.compute_net_transfers(taxes_list = ['tax'], payments_list = ['sub'])
+        simulation.create_present_values('net_transfers')
+        ipl = simulation.compute_ipl('net_transfers')
+        percapita = simulation.percapita_pv.to_cube(['net_transfers'])['net_transfers'].copy()
+
+        assert sorted(simulation.create_all_present_values()) == ['net_transfers', 'sub', 'tax']
+        assert simulation.compute_ipl('net_transfers') == ipl
+        assert (simulation.percapita_pv.to_cube(['net_transfers'])['net_transfers'] == percapita).all()
+        contributions = simulation.decompose_ipl()
+        assert contributions['net_transfers'] == ipl
+        assert abs(contributions['tax'] - contributions['sub'] - ipl) < 1e-9*abs(ipl)
+
+
+def test_shared_alternative():
+    population_dataframe = create_testing_population_dataframe(year_start=2001, year_end=2021, rate=0.01)
+    profiles_dataframe = create_constant_profiles_dataframe(population_dataframe, tax=-1, sub=0.5)
+    simulation = Simulation()
+    simulation.set_storage('cube')
+    simulation.set_profiles(profiles_dataframe)
+    simulation.set_population_projection(year_length=100, method="stable")
+    simulation.set_tax_projection(method="per_capita", rate=0.02)
+    for default, discount_rate in [(True, 0.03), (False, 0.04)]:
+        simulation.set_population(population_dataframe, default=default)
+        simulation.set_growth_rate(0.02, default=default)
+        simulation.set_discount_rate(discount_rate, default=default)
+        simulation.create_cohorts(default=default)
+    size = simulation.cohorts.memory_report()['bytes'].sum()
+
+    # The alternative set shares the stages and the arrays of the default one
+    for stage in ['population', 'profiles', 'taxes']:
+        assert simulation._stages[False][stage] is simulation._stages[True][stage]
+    assert simulation.cohorts_alt['tax'] is simulation.cohorts['tax']
+    assert simulation.memory_report()['bytes'].sum() < 1.1*size
+
+    # A column is only copied when it is changed
+    Reform('sub', years=(2015, None), factor=0.5).apply(simulation.cohorts_alt)
+    assert simulation.cohorts['sub'][0, 0, -1] == 0.5*1.02**(2101 - 2001)
+    assert simulation.cohorts_alt['sub'][0, 0, -1] == 0.25*1.02**(2101 - 2001)
+    assert simulation.cohorts_alt['tax'] is simulation.cohorts['tax']
+    report = simulation.memory_report()
+    assert report.loc[('cohorts_alt', 'sub'), 'bytes'] > 0 and report.loc[('cohorts_alt', 'tax'), 'bytes'] == 0
+
+
 # TODO: create the test    
 def test_compute_gen_imbalance():
     size_generation = 1